@@ -23,6 +23,12 @@ Should be Completed
 ---
 """
 
+import time
+STARTED = time.perf_counter() # before the other imports, for --startup-time
+
+import argparse
+import playout_rng
+from sys import stderr
 from gtp_connection import GtpConnection
 from board_base import DEFAULT_SIZE, GO_POINT, GO_COLOR
 from board import GoBoard
@@ -52,12 +58,64 @@ class Go0(GoEngine):
         pass
 
 
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Ninuki GTP engine")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed of the playout random stream. "
+                             "Worker streams are derived from it, "
+                             "so runs with the same seed are repeatable")
+    parser.add_argument("--unix-socket", default=None, metavar="PATH",
+                        help="serve GTP sessions on a Unix socket instead of stdin/stdout")
+    parser.add_argument("--port", type=int, default=None,
+                        help="serve GTP sessions on localhost:PORT instead of stdin/stdout")
+    parser.add_argument("--pool-workers", type=int, default=None,
+                        help="search processes shared by the sessions of a server, "
+                             "the number of CPUs by default")
+    parser.add_argument("--prefork", type=int, default=None, metavar="N",
+                        help="with --unix-socket or --port: serve from N processes "
+                             "forked from a warmed-up parent instead of a worker pool")
+    parser.add_argument("--startup-time", action="store_true",
+                        help="write the time from the first import until the engine "
+                             "is ready for commands to stderr")
+    parser.add_argument("--trace", default=None, metavar="FILE",
+                        help="record the GTP commands and engine phases to FILE "
+                             "in Chrome trace format")
+    parser.add_argument("--profile", action="store_true",
+                        help="sample the stack during each GTP command and write "
+                             "the functions it spends most time in to stderr")
+    parser.add_argument("--solved-db", default=None, metavar="FILE",
+                        help="database of solved positions used by solve, genmove and "
+                             "the playouts, created if it does not exist, see solved_db.py. "
+                             "Server sessions use the GTP command solved_db")
+    return parser.parse_args(argv)
+
+
 def run() -> None:
     """
     start the gtp connection and wait for commands.
     """
+    args = parse_args()
+    if args.seed is not None:
+        playout_rng.seed(args.seed)
+    if args.trace is not None or args.profile:
+        import tracing
+        tracing.start(args.trace, args.profile)
+    if args.unix_socket is not None or args.port is not None:
+        if args.prefork:
+            from gtp_server import prefork_serve
+            prefork_serve(Go0, args.unix_socket, args.port, args.prefork)
+        else:
+            from gtp_server import serve
+            serve(Go0, args.unix_socket, args.port, args.pool_workers)
+        return
     board: GoBoard = GoBoard(DEFAULT_SIZE) #DEFAULT_SIZE
+    if args.solved_db is not None:
+        from solved_db import SolvedDB
+        board.solved_db = SolvedDB(args.solved_db)
     con: GtpConnection = GtpConnection(Go0(), board)
+    if args.startup_time:
+        stderr.write("startup {:.1f} ms\n".format(1000 * (time.perf_counter() - STARTED)))
+        stderr.flush()
     con.start_connection()
 
 
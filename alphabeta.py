@@ -0,0 +1,139 @@
+"""
+alphabeta.py
+Depth-limited alpha-beta search with the static evaluation of evaluation.py.
+
+The search is negamax with alpha-beta pruning. It plays and undoes
+moves on the given board, with an Evaluator attached, so every node
+costs one incremental update instead of a playout to the end of the game.
+Leaves at the depth limit are scored with Evaluator.score. Wins are
+detected from the evaluator (five in a row or 10 captures) and scored
+above any static score, sooner wins higher.
+
+Only empty points next to a stone are searched, ordered by
+Evaluator.move_priority, so that strong moves are tried first and
+cut off the rest.
+
+With a game clock the search stops at the hard limit of the move. The
+best of the root moves searched so far is played, or the first root
+move in the move order if there was no time for any.
+"""
+
+from typing import Dict, List, Tuple
+
+from analysis import AnalysisReporter
+from board import GoBoard
+from board_base import EMPTY, GO_COLOR, GO_POINT
+from evaluation import Evaluator, score_probability
+from time_control import TimeManager
+from tss import SearchLimitReached
+
+DEFAULT_DEPTH: int = 2
+
+"""
+Score of a won position, above any static score.
+"""
+WIN_SCORE: float = 1e7
+
+"""
+Nodes between two checks of the clock.
+"""
+CLOCK_CHECK_NODES: int = 256
+
+
+class AlphaBeta(object):
+    def __init__(self, depth: int = DEFAULT_DEPTH) -> None:
+        self.depth: int = depth
+        self.nodes: int = 0
+        self.control: TimeManager = None
+
+    def search(self, board: GoBoard, control: TimeManager = None) -> Tuple[GO_POINT, Dict[GO_POINT, float]]:
+        """
+        Search the current position of board to self.depth moves.
+        Returns the best move and the score of each root move for the
+        player to move. The root moves are searched with a full window,
+        so every score is exact.
+        The evaluator of board is kept if it has one, otherwise one is
+        attached for the search and removed again.
+        control: stops the search at its hard limit. The scores then only
+            hold the root moves searched to the end.
+        """
+        evaluator = board.evaluator
+        attached = evaluator is None
+        if attached:
+            evaluator = Evaluator(board)
+        self.nodes = 0
+        self.control = control
+        moveNr = board.moveNumber()
+        color = board.current_player
+        moves = self.ordered_moves(evaluator, color)
+        scores: Dict[GO_POINT, float] = {}
+        try:
+            for move in moves:
+                board.play_move(move, color)
+                scores[move] = -self.negamax(board, evaluator, self.depth - 1,
+                                             -WIN_SCORE * 2, WIN_SCORE * 2)
+                board.undo_move()
+        except SearchLimitReached:
+            board.resetToMoveNumber(moveNr)
+        finally:
+            self.control = None
+            if attached:
+                evaluator.detach()
+        if not scores:
+            return moves[0], scores
+        best = max(scores.keys(), key=lambda move: scores[move])
+        return best, scores
+
+    def negamax(self, board: GoBoard, evaluator: Evaluator, depth: int,
+                alpha: float, beta: float) -> float:
+        """ Value of the position for the player to move """
+        self.nodes += 1
+        if self.control is not None and self.nodes % CLOCK_CHECK_NODES == 0 \
+                and self.control.out_of_time():
+            raise SearchLimitReached()
+        color = board.current_player
+        winner = evaluator.winner()
+        if winner != EMPTY:
+            value = WIN_SCORE + depth
+            return value if winner == color else -value
+        if evaluator.empty == 0:
+            return 0.0
+        if depth <= 0:
+            return evaluator.score(color)
+        for move in self.ordered_moves(evaluator, color):
+            board.play_move(move, color)
+            value = -self.negamax(board, evaluator, depth - 1, -beta, -alpha)
+            board.undo_move()
+            if value > alpha:
+                alpha = value
+                if alpha >= beta:
+                    break
+        return alpha
+
+    def ordered_moves(self, evaluator: Evaluator, color: GO_COLOR) -> List[GO_POINT]:
+        moves = evaluator.candidate_moves()
+        moves.sort(key=lambda move: evaluator.move_priority(move, color), reverse=True)
+        return moves
+
+
+class AlphaBetaPlayer(object):
+    def __init__(self, depth: int = DEFAULT_DEPTH) -> None:
+        self.depth: int = depth
+        self.search: AlphaBeta = AlphaBeta(depth)
+
+    def name(self):
+        return "Alpha-Beta Player (depth {0})".format(self.depth)
+
+    def genmove(self, state: GoBoard, reporter: AnalysisReporter = None,
+                control: TimeManager = None) -> GO_POINT:
+        assert not state.end_of_game()
+        winning = state.winning_moves(state.current_player)
+        if winning:
+            return winning[0]
+        move, scores = self.search.search(state, control)
+        if reporter is not None:
+            # report each move as one visit with its win probability
+            stats = {m: (1, score_probability(score)) for m, score in scores.items()}
+            reporter.finish(self.search.nodes, stats)
+        return move
+
@@ -0,0 +1,108 @@
+"""
+analysis.py
+Live progress output of a running search.
+
+The searches call AnalysisReporter.update as they run, with a function
+that returns the current root statistics {move: (visits, wins)}, wins
+counted for the player to move at the root. The reporter only asks
+for the statistics once per interval, so update is cheap enough to be
+called after every playout.
+
+Each report is written to stderr as a text line and as a GoGui live
+graphics block:
+
+    gogui-gfx:
+    LABEL c3 61 d4 55
+    TEXT 1200 playouts, 850/s
+
+The last report is also kept for the analysis_winrates GTP command.
+"""
+
+import time
+from sys import stderr
+from typing import Callable, Dict, List, TextIO, Tuple
+
+from board_base import GO_POINT
+
+RootStats = Dict[GO_POINT, Tuple[int, float]]
+
+"""
+Number of candidate moves shown in each report.
+"""
+TOP_MOVES: int = 5
+
+
+class AnalysisReporter(object):
+    def __init__(self, format_move: Callable[[GO_POINT], str],
+                 interval: float = 0.0, stream: TextIO = None) -> None:
+        """
+        format_move: converts a point to its GTP name
+        interval: seconds between reports. With 0 nothing is written
+            while searching, only the final statistics are kept.
+        stream: where reports are written, stderr by default
+        """
+        self.format_move = format_move
+        self.interval: float = interval
+        self.stream: TextIO = stream if stream is not None else stderr
+        self.start()
+
+    def start(self) -> None:
+        """ Start timing a new search """
+        self.start_time: float = time.time()
+        self.last_report: float = self.start_time
+        self.stats: RootStats = {}
+        self.playouts: int = 0
+        self.elapsed: float = 0.0
+
+    def update(self, playouts: int, stats_fn: Callable[[], RootStats]) -> None:
+        """ Report if the interval has passed since the last report """
+        if self.interval <= 0:
+            return
+        now = time.time()
+        if now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        self._record(playouts, stats_fn(), now)
+        self.write()
+
+    def finish(self, playouts: int, stats: RootStats) -> None:
+        """ Record the final statistics, and write them if streaming """
+        self._record(playouts, stats, time.time())
+        if self.interval > 0:
+            self.write()
+
+    def _record(self, playouts: int, stats: RootStats, now: float) -> None:
+        self.playouts = playouts
+        self.stats = stats
+        self.elapsed = now - self.start_time
+
+    def top_moves(self, n: int = TOP_MOVES) -> List[Tuple[GO_POINT, int, float]]:
+        """ The n most visited moves as (move, visits, win rate) """
+        ranked = sorted(self.stats.items(), key=lambda item: item[1], reverse=True)
+        return [(move, visits, wins / visits if visits > 0 else 0.0)
+                for move, (visits, wins) in ranked[:n]]
+
+    def rate(self) -> float:
+        """ Playouts per second """
+        return self.playouts / self.elapsed if self.elapsed > 0 else 0.0
+
+    def format_text(self) -> str:
+        moves = " ".join("{} {:.1f}% {}".format(self.format_move(move), 100 * winrate, visits)
+                         for move, visits, winrate in self.top_moves())
+        return "{} playouts {:.0f}/s {:.1f}s | {}".format(
+            self.playouts, self.rate(), self.elapsed, moves)
+
+    def format_gfx(self) -> str:
+        """ Win rates of all searched moves as GoGui gfx commands """
+        labels = " ".join("{} {:.0f}".format(self.format_move(move), 100 * winrate)
+                          for move, _, winrate in self.top_moves(len(self.stats)))
+        lines = []
+        if labels:
+            lines.append("LABEL " + labels)
+        lines.append("TEXT {} playouts, {:.0f}/s".format(self.playouts, self.rate()))
+        return "\n".join(lines)
+
+    def write(self) -> None:
+        self.stream.write(self.format_text() + "\n")
+        self.stream.write("gogui-gfx:\n" + self.format_gfx() + "\n\n")
+        self.stream.flush()
@@ -0,0 +1,146 @@
+"""
+batch_eval.py
+Evaluation of many positions at once, with NumPy arrays in and out.
+
+evaluate_positions takes N positions as a stacked array of boards in the
+layout of GoBoardUtil.get_twoD_board, shape (N, size, size), with the
+color to move and the captures of each position. It returns a structured
+array of N records of result_dtype(size):
+
+    finished        the game is over in this position, nothing else is set
+    policy          index of the rule based policy category in
+                    POLICY_CATEGORIES, NO_POLICY for a finished game
+    move_mask       the moves of that category, in the board layout
+    move_values     flat Monte Carlo value of every empty point for the
+                    player to move, NaN for other points and when no
+                    simulations were asked for
+    value           the best of move_values
+
+Each position is set up on a GoBoard and evaluated with the same code as
+the GTP engine, FlatMonteCarloPlayer.policy_move_list and evaluate_moves.
+With workers > 1 the positions are split in chunks over a process pool.
+Every position has its own random stream, derived from seed, so the
+results do not depend on the number of workers.
+"""
+
+import numpy as np
+from typing import List, Tuple
+
+from board import GoBoard
+from board_base import BLACK, WHITE, coord_to_point
+from board_util import GoBoardUtil
+from gtp_connection import FlatMonteCarloPlayer, POLICY_CATEGORIES
+from playout_rng import PlayoutRNG
+
+NO_POLICY: int = 255
+
+"""
+Chunks per worker, so that workers that get easy positions are not idle.
+"""
+CHUNKS_PER_WORKER: int = 4
+
+
+def result_dtype(size: int) -> np.dtype:
+    """ The record layout of the results for boards of the given size """
+    return np.dtype([
+        ("finished", "?"),
+        ("policy", "u1"),
+        ("move_mask", "?", (size, size)),
+        ("move_values", "<f4", (size, size)),
+        ("value", "<f4"),
+    ])
+
+
+def board_points(size: int) -> np.ndarray:
+    """
+    The point of each entry of a board in the get_twoD_board layout,
+    whose first row is the top row of the board.
+    """
+    return np.array([[coord_to_point(size - row, col + 1, size) for col in range(size)]
+                     for row in range(size)])
+
+
+def set_position(board: GoBoard, board2d: np.ndarray, to_play: int,
+                 black_captures: int, white_captures: int) -> None:
+    """ Set up a position on board, without history """
+    board.reset(board2d.shape[0])
+    GoBoardUtil.set_twoD_board(board, board2d)
+    board.current_player = to_play
+    board.black_captures = black_captures
+    board.white_captures = white_captures
+
+
+def _evaluate_chunk(task: Tuple) -> np.ndarray:
+    """ Evaluate a chunk of positions, in a worker or in this process """
+    boards, to_play, black_captures, white_captures, num_simulations, seeds = task
+    size = boards.shape[1]
+    results = np.zeros(len(boards), dtype=result_dtype(size))
+    results["move_values"] = np.nan
+    results["value"] = np.nan
+    points = board_points(size)
+    player = FlatMonteCarloPlayer(max(1, num_simulations))
+    board = GoBoard(size)
+    for i in range(len(boards)):
+        set_position(board, boards[i], int(to_play[i]),
+                     int(black_captures[i]), int(white_captures[i]))
+        r = results[i]
+        if board.get_final_result() != "unknown":
+            r["finished"] = True
+            r["policy"] = NO_POLICY
+            continue
+        board.rng = PlayoutRNG(seeds[i])
+        category, moves = player.policy_move_list(board)
+        r["policy"] = POLICY_CATEGORIES.index(category)
+        mask = np.zeros(board.maxpoint, dtype=bool)
+        mask[np.asarray(moves, dtype=int)] = True
+        r["move_mask"] = mask[points]
+        if num_simulations > 0:
+            moves, values = player.evaluate_moves(board)
+            move_values = np.full(board.maxpoint, np.nan, dtype=np.float32)
+            move_values[moves] = values
+            r["move_values"] = move_values[points]
+            r["value"] = max(values)
+    return results
+
+
+def evaluate_positions(boards: np.ndarray, to_play: np.ndarray,
+                       black_captures: np.ndarray = None, white_captures: np.ndarray = None,
+                       num_simulations: int = 0, workers: int = 1, seed=None) -> np.ndarray:
+    """
+    Evaluate the positions boards[i], shape (N, size, size), with
+    to_play[i] to move and the given captures, zero if None.
+    num_simulations: playouts per move for move_values, 0 for none
+    workers: processes to use, 1 to evaluate in this process
+    seed: seed of the random streams, None for a random seed
+    Returns an array of N records of result_dtype(size).
+    Raises ValueError if the arrays do not describe N positions.
+    """
+    boards = np.asarray(boards, dtype=np.int8)
+    if boards.ndim != 3 or boards.shape[1] != boards.shape[2]:
+        raise ValueError("boards must have the shape (N, size, size)")
+    n, size = boards.shape[0], boards.shape[1]
+    if np.any((boards < 0) | (boards > WHITE)):
+        raise ValueError("boards may only hold EMPTY, BLACK and WHITE")
+    to_play = np.asarray(to_play)
+    zeros = np.zeros(n, dtype=int)
+    black_captures = zeros if black_captures is None else np.asarray(black_captures)
+    white_captures = zeros if white_captures is None else np.asarray(white_captures)
+    for name, array in [("to_play", to_play), ("black_captures", black_captures),
+                        ("white_captures", white_captures)]:
+        if array.shape != (n,):
+            raise ValueError("{} must have the shape ({},)".format(name, n))
+    if np.any((to_play != BLACK) & (to_play != WHITE)):
+        raise ValueError("to_play must be BLACK or WHITE")
+    seeds = np.random.SeedSequence(seed).spawn(n)
+    if workers <= 1 or n <= 1:
+        return _evaluate_chunk((boards, to_play, black_captures, white_captures,
+                                num_simulations, seeds))
+
+    chunk = max(1, -(-n // (workers * CHUNKS_PER_WORKER)))
+    tasks = [(boards[i:i + chunk], to_play[i:i + chunk], black_captures[i:i + chunk],
+              white_captures[i:i + chunk], num_simulations, seeds[i:i + chunk])
+             for i in range(0, n, chunk)]
+    import multiprocessing as mp
+    with mp.Pool(workers) as pool:
+        parts: List[np.ndarray] = pool.map(_evaluate_chunk, tasks)
+    return np.concatenate(parts)
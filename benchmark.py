@@ -0,0 +1,303 @@
+#!/usr/bin/python3
+"""
+benchmark.py
+Benchmark harness for the Ninuki playout and search code.
+
+Usage:
+    python3 benchmark.py playouts --size 7 --playouts 500
+    python3 benchmark.py playouts --size 13 --max-length 40
+    python3 benchmark.py strength --size 13 --max-length 40 --games 10 --playouts 300
+    python3 benchmark.py parallel --size 7 --playouts 2000 --workers 8
+    python3 benchmark.py solve --size 5 --moves 15 --positions 6 --workers 4
+    python3 benchmark.py replay --sgf games.sgf
+    python3 benchmark.py startup --runs 20
+
+Each benchmark prints one line per configuration, so that runs can be
+compared with a plain diff.
+"""
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+from typing import Callable, Dict, List
+
+import playout_rng
+from board import GoBoard
+from board_base import BLACK, WHITE
+from pattern_policy import PatternPolicy
+
+
+def bench_playouts(args: argparse.Namespace) -> None:
+    """
+    Random playouts from the empty board, with and without early termination,
+    logged (GoBoard.simulate, undone with resetToMoveNumber) and unlogged
+    (GoBoard.simulate_unlogged on a scratch board). Both modes use the same
+    random stream, so their results must be equal.
+    With --policy pattern, the unlogged playouts sample their moves with
+    the default PatternPolicy instead, and the logged ones are skipped.
+    With --max-length, the unlogged playouts stop after that many moves,
+    see GoBoard.playout_limit.
+    Reports the average playout length, the results and playouts per second.
+    """
+    for early_termination in [False, True]:
+        for logged in [True, False]:
+            if logged and args.policy == "pattern":
+                continue
+            playout_rng.seed(args.seed)
+            board = GoBoard(args.size)
+            if args.policy == "pattern":
+                board.playout_policy = PatternPolicy()
+            board.playout_limit = args.max_length
+            stats = [0] * 3
+            total_length = 0
+            start = time.time()
+            for _ in range(args.playouts):
+                if logged:
+                    winner = board.simulate(early_termination)
+                    total_length += board.moveNumber() + 1
+                    board.resetToMoveNumber(-1)
+                else:
+                    moves = []
+                    winner = board.simulate_unlogged(early_termination, moves)
+                    total_length += len(moves)
+                stats[winner] += 1
+            elapsed = time.time() - start
+            print("early_termination={:<5} mode={:<8} size={} max_length={} playouts={} avg_length={:.1f} "
+                  "draw/black/white={}/{}/{} playouts/s={:.1f}".format(
+                      str(early_termination), "logged" if logged else "unlogged" if args.policy == "random" else "pattern",
+                      args.size, None if logged else args.max_length, args.playouts,
+                      total_length / args.playouts, stats[0], stats[1], stats[2],
+                      args.playouts / elapsed))
+
+
+def bench_strength(args: argparse.Namespace) -> None:
+    """
+    Games of MCTS with playouts cut off after --max-length moves against
+    MCTS with full playouts, --playouts playouts per move each, colors
+    alternating. Reports the results of the cutoff player and the
+    playouts per second of both.
+    """
+    from mcts import MCTS
+    playout_rng.seed(args.seed)
+    board = GoBoard(args.size)
+    limits = {"cutoff": args.max_length, "full": None}
+    seconds = {"cutoff": 0.0, "full": 0.0}
+    searched = {"cutoff": 0, "full": 0}
+    results = {"win": 0, "draw": 0, "loss": 0}
+    for game in range(args.games):
+        board.reset(args.size)
+        players = {"cutoff": MCTS(), "full": MCTS()}
+        cutoff_color = BLACK if game % 2 == 0 else WHITE
+        while board.get_final_result() == "unknown":
+            name = "cutoff" if board.current_player == cutoff_color else "full"
+            board.playout_limit = limits[name]
+            start = time.time()
+            move = players[name].search(board, args.playouts)
+            seconds[name] += time.time() - start
+            searched[name] += args.playouts
+            board.play_move(move, board.current_player)
+        result = board.get_final_result()
+        if result == "draw":
+            results["draw"] += 1
+        elif result == ("black" if cutoff_color == BLACK else "white"):
+            results["win"] += 1
+        else:
+            results["loss"] += 1
+    print("size={} max_length={} games={} playouts={} cutoff win/draw/loss={}/{}/{} "
+          "cutoff playouts/s={:.1f} full playouts/s={:.1f}".format(
+              args.size, args.max_length, args.games, args.playouts,
+              results["win"], results["draw"], results["loss"],
+              searched["cutoff"] / seconds["cutoff"], searched["full"] / seconds["full"]))
+
+
+def bench_parallel(args: argparse.Namespace) -> None:
+    """
+    Root and tree parallel search with 1 to --workers processes
+    on the empty board. Reports playouts per second and the speedup
+    over one worker of the same variant.
+    """
+    from parallel_search import (
+        PARALLEL_MODES,
+        ROOT_PARALLEL,
+        root_parallel_search,
+        tree_parallel_search,
+    )
+    for mode in PARALLEL_MODES:
+        search = root_parallel_search if mode == ROOT_PARALLEL else tree_parallel_search
+        base_rate = None
+        for workers in range(1, args.workers + 1):
+            playout_rng.seed(args.seed)
+            board = GoBoard(args.size)
+            start = time.time()
+            search(board, args.playouts, workers)
+            rate = args.playouts / (time.time() - start)
+            if base_rate is None:
+                base_rate = rate
+            print("mode={} size={} workers={} playouts={} playouts/s={:.1f} speedup={:.2f}".format(
+                mode, args.size, workers, args.playouts, rate, rate / base_rate))
+
+
+def solve_positions(size: int, moves: int, count: int, seed: int) -> List[GoBoard]:
+    """
+    count positions after moves random moves from the empty board,
+    skipping games that end before.
+    """
+    rng = playout_rng.PlayoutRNG(seed)
+    positions = []
+    while len(positions) < count:
+        board = GoBoard(size)
+        for _ in range(moves):
+            board.play_move(rng.choice(board.get_empty_points()), board.current_player)
+            if board.get_final_result() != "unknown":
+                break
+        else:
+            positions.append(board)
+    return positions
+
+
+def bench_solve(args: argparse.Namespace) -> None:
+    """
+    Solve --positions random positions of --moves moves with the serial
+    solver and the parallel solver on 1 to --workers processes.
+    Reports the total time, the speedup over the serial solver, and the
+    positions whose result differs from the serial one.
+    """
+    from parallel_solver import ParallelSolver
+    from solver import Solver
+    positions = solve_positions(args.size, args.moves, args.positions, args.seed)
+    base_time = None
+    base_results = None
+    for workers in range(0, args.workers + 1):
+        results = []
+        start = time.time()
+        for board in positions:
+            if workers == 0:
+                solver = Solver(args.time_limit)
+            else:
+                solver = ParallelSolver(args.time_limit, workers)
+            solved = solver.solve(board)
+            results.append(None if solved is None else solved[0])
+        elapsed = time.time() - start
+        if base_time is None:
+            base_time, base_results = elapsed, results
+        print("solver={} size={} moves={} positions={} unsolved={} differ={} seconds={:.2f} speedup={:.2f}".format(
+            "serial" if workers == 0 else "parallel/{}".format(workers), args.size, args.moves,
+            len(positions), results.count(None),
+            sum(a != b for a, b in zip(results, base_results) if a is not None and b is not None),
+            elapsed, base_time / elapsed))
+
+
+def bench_replay(args: argparse.Namespace) -> None:
+    """
+    Parse and replay every game of the SGF file --sgf.
+    Reports games and moves per second.
+    """
+    from sgf import iter_game_file, replay
+    board = GoBoard(args.size)
+    games = 0
+    moves = 0
+    start = time.time()
+    for record in iter_game_file(args.sgf):
+        replay(board, record)
+        games += 1
+        moves += len(record.moves)
+    elapsed = time.time() - start
+    print("games={} moves={} seconds={:.2f} games/s={:.1f} moves/s={:.0f}".format(
+        games, moves, elapsed, games / elapsed, moves / elapsed))
+
+
+def _first_response(commands, responses) -> None:
+    """ Send a command to a GTP engine and wait for its answer """
+    commands.write("name\n")
+    commands.flush()
+    while responses.readline() not in ("\n", ""):
+        pass
+
+
+def _print_startup(mode: str, times: List[float]) -> None:
+    print("mode={} runs={} mean_ms={:.1f} best_ms={:.1f}".format(
+        mode, len(times), 1000 * sum(times) / len(times), 1000 * min(times)))
+
+
+def bench_startup(args: argparse.Namespace) -> None:
+    """
+    Time to first response: the time from starting an engine, or
+    connecting to a pre-forked server, until the first command is
+    answered. Reports the mean and best of --runs runs.
+    """
+    engine = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Ninuki.py")
+    times = []
+    for _ in range(args.runs):
+        start = time.time()
+        p = subprocess.Popen([sys.executable, engine], stdin=subprocess.PIPE,
+                             stdout=subprocess.PIPE, text=True)
+        _first_response(p.stdin, p.stdout)
+        times.append(time.time() - start)
+        p.stdin.close()
+        p.wait()
+    _print_startup("process", times)
+
+    path = os.path.join(tempfile.mkdtemp(), "ninuki.sock")
+    server = subprocess.Popen([sys.executable, engine, "--unix-socket", path, "--prefork", "2"])
+    try:
+        while not os.path.exists(path):
+            time.sleep(0.01)
+        times = []
+        for _ in range(args.runs):
+            start = time.time()
+            s = socket.socket(socket.AF_UNIX)
+            s.connect(path)
+            with s, s.makefile("rw") as f:
+                _first_response(f, f)
+            times.append(time.time() - start)
+        _print_startup("prefork", times)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+BENCHMARKS: Dict[str, Callable[[argparse.Namespace], None]] = {
+    "playouts": bench_playouts,
+    "strength": bench_strength,
+    "parallel": bench_parallel,
+    "solve": bench_solve,
+    "replay": bench_replay,
+    "startup": bench_startup,
+}
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Ninuki benchmark harness")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS.keys()))
+    parser.add_argument("--size", type=int, default=7, help="board size")
+    parser.add_argument("--playouts", type=int, default=500,
+                        help="number of playouts per configuration")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="largest number of worker processes")
+    parser.add_argument("--policy", choices=["random", "pattern"], default="random",
+                        help="playout policy of the unlogged playouts")
+    parser.add_argument("--max-length", type=int, default=None,
+                        help="most moves per playout, then the position is scored")
+    parser.add_argument("--games", type=int, default=10,
+                        help="games played by the strength benchmark")
+    parser.add_argument("--positions", type=int, default=6,
+                        help="positions solved by the solve benchmark")
+    parser.add_argument("--moves", type=int, default=15,
+                        help="random moves played to set up each position to solve")
+    parser.add_argument("--time-limit", type=float, default=60,
+                        help="seconds per position of the solve benchmark")
+    parser.add_argument("--sgf", help="SGF file of games to replay")
+    parser.add_argument("--runs", type=int, default=10,
+                        help="engine starts or connections timed by the startup benchmark")
+    args = parser.parse_args(argv)
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
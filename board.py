@@ -34,7 +34,8 @@ Should be Completed
 """
 
 import numpy as np
-from typing import List, Tuple
+from bisect import bisect_left, insort
+from typing import Dict, List, Tuple
 
 from board_base import (
     board_array_size,
@@ -53,6 +54,16 @@ from board_base import (
     GO_COLOR,
     GO_POINT,
 )
+from evaluation import run_score, score_probability
+from kernels import BoardKernels, kernels_for
+from playout_rng import PlayoutRNG, default_rng
+
+"""
+Rows, columns and diagonals of each board size, as computed by
+calculate_rows_cols_diags. They only depend on the size, so they are
+computed once per size and shared by all boards. Never modify them.
+"""
+_lines_cache: Dict[int, Tuple[List, List, List]] = {}
 
 
 """
@@ -70,8 +81,14 @@ class GoBoard(object):
         Creates a Go board of given size
         """
         assert 2 <= size <= MAXSIZE
+        self.evaluator = None # opt-in incremental evaluation, see evaluation.Evaluator
         self.reset(size)
         self.calculate_rows_cols_diags() #removed for new implementation
+        self.rng: PlayoutRNG = None # random stream for playouts, None for the engine-wide stream
+        self.scratch: ScratchBoard = None # reused by simulate_unlogged
+        self.playout_policy = None # e.g. pattern_policy.PatternPolicy, None for uniform random
+        self.playout_limit: int = None # most moves per playout, None for no limit
+        self.solved_db = None # solved_db.SolvedDB consulted by playouts, None for none
         self.black_captures = 0
         self.white_captures = 0
 
@@ -106,19 +123,43 @@ class GoBoard(object):
 
         self.current_player = opponent(self.current_player) # Change the current player back
 
+        if self.evaluator is not None:
+            self.evaluator.on_undo(last_moves)
+        self._status = None
         return None
 
-    def simulate(self) -> int:
+    def simulate(self, early_termination: bool = True) -> int:
         # run flat monte carlo simulation from current position and return winner and unknown value (unknown value returned in FlatMonteCarloPlayer)
         # play random until win or draw and return winner 
         # undo will be called in resetToMoveNumber() after this is called in genmove in ninuki.py. so no issues hopefully
+        # with early_termination the playout stops as soon as decided_winner() proves the result
         winner = "unknown"
+        rng = self.get_rng()
+
+        full_checks = 0
+        if early_termination:
+            if self.get_final_result() == "unknown":
+                decided = self.decided_winner()
+                if decided != EMPTY:
+                    return decided
+                full_checks = 1
+            else:
+                early_termination = False # game already over, keep the old behaviour
 
         while winner == "unknown":
             legalMoves = self.get_empty_points()
-            move = int(np.random.choice(legalMoves, 1)) #get one random legal move
+            move = int(rng.choice(legalMoves)) #get one random legal move
             self.play_move(move, self.current_player)
             winner = self.get_final_result() # Check for winner
+            if early_termination and winner == "unknown":
+                # full scans until both players have been checked, then only look near the last moves
+                if full_checks < 2:
+                    decided = self.decided_winner()
+                    full_checks += 1
+                else:
+                    decided = self._decided_winner_after_moves()
+                if decided != EMPTY:
+                    return decided
         
         if winner == "black":
             winner = 1
@@ -129,6 +170,42 @@ class GoBoard(object):
 
         return winner
 
+    def simulate_unlogged(self, early_termination: bool = True, moves: List = None) -> int:
+        """
+        Same playout and result as simulate with the same random stream,
+        but played on a ScratchBoard, so this board is not changed and
+        nothing has to be undone afterwards.
+        moves: if given, the [color, point, captures...] entries of the
+        playout moves are appended to it, as simulate would have put them
+        on the change stack (for AMAF statistics).
+        A finished game is not played on: its result is returned.
+        With a playout_policy, moves are sampled by it instead of
+        uniformly, and the results differ from simulate.
+        With a playout_limit, a playout that reaches that many moves is
+        stopped and its winner drawn from a quick evaluation, see
+        ScratchBoard.cutoff_winner.
+        With early_termination and a solved_db, a position solved in the
+        database returns its proven winner without a playout.
+        """
+        result = self.get_final_result()
+        if result != "unknown":
+            return {"black": BLACK, "white": WHITE, "draw": EMPTY}[result]
+        if early_termination and self.solved_db is not None:
+            winner = self.solved_db.winner(self)
+            if winner is not None:
+                return winner
+        if self.scratch is None or self.scratch.size != self.size:
+            self.scratch = ScratchBoard(self.size)
+        self.scratch.load(self)
+        return self.scratch.simulate(self.get_rng(), early_termination, moves,
+                                     self.playout_policy, self.playout_limit)
+
+    def get_rng(self) -> PlayoutRNG:
+        """ The random stream used by this board """
+        if self.rng is not None:
+            return self.rng
+        return default_rng()
+
     def resetToMoveNumber(self, moveNr) -> None:
         # reset board to move number given. Use undo for this
         while len(self.change_stack)-1 > moveNr:
@@ -142,6 +219,21 @@ class GoBoard(object):
         return len(self.change_stack)-1
 
     def get_final_result(self) -> str:
+        """
+        "black", "white", "draw" or "unknown" for a game still in progress.
+        Computed at most once per position: play_move, undo_move and reset
+        clear the cached value, and so must any code that changes the board
+        directly, by calling invalidate_status.
+        """
+        if self._status is None:
+            self._status = self._compute_final_result()
+        return self._status
+
+    def invalidate_status(self) -> None:
+        """ Forget the cached game status after a direct change of the board """
+        self._status = None
+
+    def _compute_final_result(self) -> str:
         """ We already implemented this function for Assignment 2 """
         result1 = self.detect_five_in_a_row()
         result2 = EMPTY
@@ -159,6 +251,165 @@ class GoBoard(object):
         else:
             return "unknown"
 
+    def is_winning_move(self, point: GO_POINT, color: GO_COLOR) -> bool:
+        """
+        Check whether color wins immediately by playing on the empty point,
+        either by making five in a row or by reaching 10 captures.
+        """
+        return self._is_winning_point(self.board.tolist(), point, color)
+
+    def count_captures(self, point: GO_POINT, color: GO_COLOR) -> int:
+        """ Number of pairs color would capture by playing on point """
+        return self._count_captures(self.board.tolist(), point, color)
+
+    def winning_moves(self, color: GO_COLOR) -> List:
+        """ List of all points where color wins immediately """
+        cells = self.board.tolist()
+        return [p for p in self.get_empty_points().tolist()
+                if self._is_winning_point(cells, p, color)]
+
+    def has_capture_move(self, color: GO_COLOR) -> bool:
+        """ Check whether color can capture anywhere on the board """
+        cells = self.board.tolist()
+        for point in self.get_empty_points().tolist():
+            if self._count_captures(cells, point, color) > 0:
+                return True
+        return False
+
+    def decided_winner(self) -> GO_COLOR:
+        """
+        Cheap check whether the game is decided with current_player to move.
+        Returns the winner, or EMPTY if no forced result was found.
+
+        - current_player can win in one move: current_player wins.
+        - the opponent has two or more winning points, current_player has no
+          winning point and cannot capture: current_player can block only one
+          of them, and only a capture could remove opponent stones from the
+          other threat, so the opponent wins.
+        This version scans all empty points, see _decided_winner_after_moves
+        for the version used during playouts.
+        """
+        return self._decided_winner(self.board.tolist(), self.get_empty_points().tolist())
+
+    def _decided_winner_after_moves(self) -> GO_COLOR:
+        """
+        Same as decided_winner, but only looks at the winning points that can
+        have been created by the last two moves.
+        Requires that decided_winner found nothing two moves ago, so that the
+        current player had no winning point before its own last move.
+        """
+        return self._decided_winner_after(self.board.tolist(),
+                                          self.change_stack[-1], self.change_stack[-2])
+
+    """
+    The helpers below work on cells, a list copy of self.board made with
+    self.board.tolist(). Reading single elements from a list is much faster
+    than from the numpy array. Besides cells they only use NS, current_player,
+    get_captures, has_capture_move and each other, so ScratchBoard shares them.
+    """
+    def _decided_winner(self, cells: List, points: List) -> GO_COLOR:
+        """ decided_winner with the given empty points """
+        toplay = self.current_player
+        opp = opponent(toplay)
+        for p in points:
+            if self._is_winning_point(cells, p, toplay):
+                return toplay
+        threats = 0
+        for p in points:
+            if self._is_winning_point(cells, p, opp):
+                threats += 1
+                if threats >= 2:
+                    break
+        if threats >= 2 and not self.has_capture_move(toplay):
+            return opp
+        return EMPTY
+
+    def _decided_winner_after(self, cells: List, last: List, prev: List) -> GO_COLOR:
+        """
+        _decided_winner_after_moves with the change stack entries of the
+        last move and the one before.
+        New five threats must pass through the stone a color just played.
+        New capture wins only appear next to the last stones or on captured points.
+        """
+        toplay = self.current_player
+        opp = opponent(toplay)
+        candidates = set(last[2:]) | set(prev[2:])
+        if self.get_captures(toplay) >= 8 or self.get_captures(opp) >= 8:
+            candidates.update(self._points_near(cells, last[1], 3))
+            candidates.update(self._points_near(cells, prev[1], 3))
+        candidates = [p for p in candidates if cells[p] == EMPTY]
+
+        if self._five_points(cells, prev[1], toplay):
+            return toplay
+        for p in candidates:
+            if self._is_winning_point(cells, p, toplay):
+                return toplay
+        threats = set(self._five_points(cells, last[1], opp))
+        for p in candidates:
+            if len(threats) >= 2:
+                break
+            if self._is_winning_point(cells, p, opp):
+                threats.add(p)
+        if len(threats) >= 2 and not self.has_capture_move(toplay):
+            return opp
+        return EMPTY
+
+    def _is_winning_point(self, cells: List, point: GO_POINT, color: GO_COLOR) -> bool:
+        assert cells[point] == EMPTY
+        if self.kernels.five_through(cells, point, color):
+            return True
+        captures = self.get_captures(color)
+        if captures >= 8:
+            captures += 2 * self._count_captures(cells, point, color)
+        return captures >= 10
+
+    def _count_captures(self, cells: List, point: GO_POINT, color: GO_COLOR) -> int:
+        return self.kernels.count_captures(cells, point, color, opponent(color))
+
+    def _five_points(self, cells: List, center: GO_POINT, color: GO_COLOR) -> List:
+        """
+        Empty points where color makes five in a row together with
+        its stone on center. Only the first empty point past the block
+        of stones through center can complete such a five, so there are
+        at most two candidates per direction.
+        """
+        points = []
+        if cells[center] != color:
+            return points
+        for d in [1, self.NS, self.NS + 1, self.NS - 1]:
+            ends = []
+            run = 1
+            for step in [d, -d]:
+                p = center + step
+                while cells[p] == color:
+                    run += 1
+                    p += step
+                ends.append(p)
+            for end, step in zip(ends, [d, -d]):
+                if cells[end] != EMPTY:
+                    continue
+                count = run + 1
+                p = end + step
+                while cells[p] == color:
+                    count += 1
+                    p += step
+                if count >= 5:
+                    points.append(end)
+        return points
+
+    def _points_near(self, cells: List, center: GO_POINT, distance: int) -> List:
+        """ Empty points up to distance away from center in the 8 directions """
+        points = []
+        for d in [1, -1, self.NS, -self.NS, self.NS+1, -(self.NS+1), self.NS-1, -self.NS+1]:
+            p = center + d
+            for _ in range(distance):
+                if cells[p] == BORDER:
+                    break
+                if cells[p] == EMPTY:
+                    points.append(p)
+                p += d
+        return points
+
     def add_two_captures(self, color: GO_COLOR) -> None:
         if color == BLACK:
             self.black_captures += 2
@@ -173,6 +424,9 @@ class GoBoard(object):
     def calculate_rows_cols_diags(self) -> None:
         if self.size < 5:
             return
+        if self.size in _lines_cache:
+            self.rows, self.cols, self.diags = _lines_cache[self.size]
+            return
         # precalculate all rows, cols, and diags for 5-in-a-row detection
         self.rows = []
         self.cols = []
@@ -229,6 +483,7 @@ class GoBoard(object):
         assert len(self.rows) == self.size
         assert len(self.cols) == self.size
         assert len(self.diags) == (2 * (self.size - 5) + 1) * 2
+        _lines_cache[self.size] = (self.rows, self.cols, self.diags)
 
     def reset(self, size: int) -> None:
         """
@@ -245,10 +500,14 @@ class GoBoard(object):
         self.board: np.ndarray[GO_POINT] = np.full(self.maxpoint, BORDER, dtype=GO_POINT)
         self._initialize_empty_points(self.board)
         self.calculate_rows_cols_diags()   
+        self.kernels: BoardKernels = kernels_for(size) # generated for this size, see kernels.py
         self.black_captures = 0
         self.white_captures = 0
 
         self.change_stack = []
+        self._status: str = None # cached get_final_result, None if not computed
+        if self.evaluator is not None:
+            self.evaluator.attach(self)
 
     def copy(self) -> 'GoBoard':
         b = GoBoard(self.size)
@@ -260,6 +519,10 @@ class GoBoard(object):
         b.current_player = self.current_player
         assert b.maxpoint == self.maxpoint
         b.board = np.copy(self.board)
+        b.rng = self.rng
+        b.playout_policy = self.playout_policy
+        b.playout_limit = self.playout_limit
+        b.solved_db = self.solved_db
         return b
 
     def get_color(self, point: GO_POINT) -> GO_COLOR:
@@ -302,14 +565,7 @@ class GoBoard(object):
         return can_play_move
 
     def end_of_game(self) -> bool:
-        if self.black_captures>=10 or self.white_captures>=10:
-            return True
-        elif self.detect_five_in_a_row() != EMPTY:
-            return True
-        elif len(self.get_empty_points()) == 0:
-            return True
-        else:
-            return False
+        return self.get_final_result() != "unknown"
     '''
     def end_of_game(self) -> bool:
         return self.last_move == PASS \
@@ -439,23 +695,22 @@ class GoBoard(object):
         self.current_player = opponent(color)
         self.last2_move = self.last_move
         self.last_move = point
-        O = opponent(color)
-        offsets = [1, -1, self.NS, -self.NS, self.NS+1, -(self.NS+1), self.NS-1, -self.NS+1]
-        for offset in offsets:
-            if self.board[point+offset] == O and self.board[point+(offset*2)] == O and self.board[point+(offset*3)] == color:
-                self.board[point+offset] = EMPTY
-                self.board[point+(offset*2)] = EMPTY
-                ####
-                changenode.append(point+offset)         # Add capture 1
-                changenode.append(point+(offset*2))     # Add capture 2 to changelist for undo
-                ####
-                if color == BLACK:
-                    self.black_captures += 2
-                else:
-                    self.white_captures += 2
+        captured = self.kernels.captures(self.board, point, color, opponent(color))
+        if captured:
+            self.board[captured] = EMPTY
+            ####
+            changenode += captured # Add the captured pairs to changelist for undo
+            ####
+            if color == BLACK:
+                self.black_captures += len(captured)
+            else:
+                self.white_captures += len(captured)
         ####
         self.change_stack.append(changenode) # Add all changes from the move played to the change stack
         ####
+        if self.evaluator is not None:
+            self.evaluator.on_play(changenode)
+        self._status = None
         return True
     
     def neighbors_of_color(self, point: GO_POINT, color: GO_COLOR) -> List:
@@ -528,19 +783,7 @@ class GoBoard(object):
         Returns BLACK or WHITE if any five in a row is detected for the color
         EMPTY otherwise.
         """
-        for r in self.rows:
-            result = self.has_five_in_list(r)
-            if result != EMPTY:
-                return result
-        for c in self.cols:
-            result = self.has_five_in_list(c)
-            if result != EMPTY:
-                return result
-        for d in self.diags:
-            result = self.has_five_in_list(d)
-            if result != EMPTY:
-                return result
-        return EMPTY
+        return self.kernels.five_in_a_row(self.board.tolist())
     
     def has_five_in_list(self, list) -> GO_COLOR:
         """
@@ -560,18 +803,11 @@ class GoBoard(object):
         return EMPTY
 
     def detectOpenFour(self) -> bool:
-        #fours = self.generateOpenFour(self.current_player)
-
-        for r in self.rows:
-            if self.isOpenFour(r):
-                return True
-        for c in self.cols:
-            if self.isOpenFour(c):
-                return True
-        for d in self.diags:
-            if self.isOpenFour(d):
-                return True
-        return False
+        """
+        Check whether the player who moved last has an open four,
+        as isOpenFour on every line.
+        """
+        return self.kernels.open_four(self.board.tolist(), opponent(self.current_player))
 
     def isOpenFour(self, a: list):
         #Lol
@@ -592,3 +828,141 @@ class GoBoard(object):
         for i in a:
             out.append(self.get_color(i))
         return out
+
+
+class ScratchBoard(object):
+    """
+    A throwaway copy of a GoBoard position for random playouts.
+    Moves are played without a change stack and without the game status
+    cache, and the result is checked only around the last move.
+    The cells and the sorted list of empty points are allocated once and
+    refilled by load, so a playout costs one copy of the board.
+    """
+    def __init__(self, size: int) -> None:
+        self.size: int = size
+        self.NS: int = size + 1
+        self.cells: List[GO_COLOR] = [BORDER] * board_array_size(size)
+        self.empty: List[GO_POINT] = []
+        self.current_player: GO_COLOR = BLACK
+        self.black_captures: int = 0
+        self.white_captures: int = 0
+        self.kernels: BoardKernels = kernels_for(size)
+        self.sampler = None # PatternSampler of the last playout policy used
+
+    # the cells helpers of GoBoard, see the note above GoBoard._decided_winner
+    get_captures = GoBoard.get_captures
+    _decided_winner = GoBoard._decided_winner
+    _decided_winner_after = GoBoard._decided_winner_after
+    _is_winning_point = GoBoard._is_winning_point
+    _count_captures = GoBoard._count_captures
+    _five_points = GoBoard._five_points
+    _points_near = GoBoard._points_near
+
+    def load(self, board: GoBoard) -> None:
+        """ Copy the position of board """
+        assert board.size == self.size
+        self.cells[:] = board.board.tolist()
+        self.empty[:] = board.get_empty_points().tolist()
+        self.current_player = board.current_player
+        self.black_captures = board.black_captures
+        self.white_captures = board.white_captures
+
+    def has_capture_move(self, color: GO_COLOR) -> bool:
+        cells = self.cells
+        for point in self.empty:
+            if self._count_captures(cells, point, color) > 0:
+                return True
+        return False
+
+    def play(self, point: GO_POINT, color: GO_COLOR) -> List:
+        """
+        Play color on the empty point, as GoBoard.play_move does.
+        Returns the move as a change stack entry.
+        """
+        cells = self.cells
+        empty = self.empty
+        cells[point] = color
+        del empty[bisect_left(empty, point)]
+        change = [color, point]
+        O = opponent(color)
+        captured = self.kernels.captures(cells, point, color, O)
+        if captured:
+            for p in captured:
+                cells[p] = EMPTY
+                insort(empty, p)
+            change += captured
+            if color == BLACK:
+                self.black_captures += len(captured)
+            else:
+                self.white_captures += len(captured)
+        self.current_player = O
+        return change
+
+    def is_five(self, point: GO_POINT) -> bool:
+        """ Check whether the stone on point is part of five in a row """
+        cells = self.cells
+        return self.kernels.five_through(cells, point, cells[point])
+
+    def cutoff_winner(self, rng: PlayoutRNG) -> GO_COLOR:
+        """
+        Winner of a playout stopped before the end of the game: BLACK with
+        the probability that evaluation.run_score gives to BLACK, else
+        WHITE. Over many playouts this counts as that share of a win, the
+        same as a finished playout is counted.
+        """
+        score = run_score(self.cells, self.NS, BLACK, self.black_captures, self.white_captures)
+        return BLACK if rng.random() < score_probability(score) else WHITE
+
+    def simulate(self, rng: PlayoutRNG, early_termination: bool = True, moves: List = None,
+                 policy=None, max_length: int = None) -> int:
+        """
+        GoBoard.simulate on the loaded position, which must not be finished.
+        Only the last move can have ended the game: a five must go through
+        its stone, and only its color gained captures.
+        policy: a PatternPolicy to sample the moves, None for uniform random
+        max_length: stop after that many moves and return cutoff_winner,
+            None to play until the game is over
+        """
+        sampler = None
+        if policy is not None:
+            if self.sampler is None or self.sampler.policy is not policy:
+                from pattern_policy import PatternSampler
+                self.sampler = PatternSampler(policy, self.size, len(self.cells))
+            sampler = self.sampler
+            sampler.load(self.cells, self.empty)
+        full_checks = 0
+        if early_termination:
+            decided = self._decided_winner(self.cells, self.empty)
+            if decided != EMPTY:
+                return decided
+            full_checks = 1
+        last = None
+        length = 0
+        while True:
+            if length == max_length:
+                return self.cutoff_winner(rng)
+            length += 1
+            color = self.current_player
+            if sampler is None:
+                change = self.play(rng.choice(self.empty), color)
+            else:
+                point = sampler.sample(color, rng.random())
+                if point < 0 or self.cells[point] != EMPTY: # rounding at the end of the weights
+                    point = rng.choice(self.empty)
+                change = self.play(point, color)
+                sampler.update(self.cells, change)
+            if moves is not None:
+                moves.append(change)
+            if self.is_five(change[1]) or self.get_captures(color) >= 10:
+                return color
+            if not self.empty:
+                return EMPTY
+            if early_termination:
+                prev, last = last, change
+                if full_checks < 2:
+                    decided = self._decided_winner(self.cells, self.empty)
+                    full_checks += 1
+                else:
+                    decided = self._decided_winner_after(self.cells, last, prev)
+                if decided != EMPTY:
+                    return decided
@@ -47,7 +47,7 @@ class GoBoardUtil(object):
             the color to generate the move for.
         """
         moves: np.ndarray[GO_POINT] = board.get_empty_points()
-        np.random.shuffle(moves)
+        board.get_rng().shuffle(moves)
         for move in moves:
             legal: bool = not (
                 use_eye_filter and board.is_eye(move, color)
@@ -91,3 +91,19 @@ class GoBoardUtil(object):
             board2d[row, :] = go_board.board[start : start + size]
         board2d = np.flipud(board2d)
         return board2d
+
+    @staticmethod
+    def set_twoD_board(go_board: GoBoard, board2d: np.ndarray) -> None:
+        """
+        Inverse of get_twoD_board: put the stones of board2d, a size x size
+        array in the layout returned by get_twoD_board, on go_board.
+        Only the points change, not the player to move, the captures or
+        the change stack.
+        """
+        size: int = go_board.size
+        assert board2d.shape == (size, size)
+        rows = np.flipud(board2d)
+        for row in range(size):
+            start: int = go_board.row_start(row + 1)
+            go_board.board[start : start + size] = rows[row, :]
+        go_board.invalidate_status()
@@ -0,0 +1,218 @@
+#!/usr/bin/python3
+"""
+dataset.py
+Self-play position datasets in a fixed-size binary record format.
+
+A dataset file holds positions of one board size. It starts with a
+HEADER_SIZE byte header:
+
+    magic "NINUKIDS", format version, board size, record size
+
+followed by records of record_dtype(size):
+
+    board           GoBoard.board packed to 2 bits per point, 4 points per byte
+    to_play         color to move
+    black_captures, white_captures
+    policy          index of the rule based policy category in POLICY_CATEGORIES
+    move            point played in the game from this position
+    value           flat Monte Carlo value of the played move, for to_play
+    move_values     flat Monte Carlo value of every point for to_play,
+                    NaN for points that are not empty
+
+Files are only ever appended to, so several generators can be run one
+after the other on the same file. read_dataset maps the records with
+np.memmap and returns a structured array view, nothing is parsed.
+
+Usage:
+    python3 dataset.py selfplay --out positions.bin --size 7 --games 100
+    python3 dataset.py info positions.bin
+"""
+
+import argparse
+import os
+import numpy as np
+from typing import List
+
+import playout_rng
+from board import GoBoard
+from board_base import board_array_size, GO_POINT
+from gtp_connection import FlatMonteCarloPlayer, POLICY_CATEGORIES
+
+MAGIC: bytes = b"NINUKIDS"
+FORMAT_VERSION: int = 1
+HEADER_SIZE: int = 64
+
+_HEADER_DTYPE = np.dtype([("magic", "S8"), ("version", "<u4"),
+                          ("size", "<u4"), ("record_size", "<u4")])
+
+
+def packed_board_bytes(size: int) -> int:
+    return (board_array_size(size) + 3) // 4
+
+
+def record_dtype(size: int) -> np.dtype:
+    """ The record layout for boards of the given size """
+    return np.dtype([
+        ("board", "u1", (packed_board_bytes(size),)),
+        ("to_play", "u1"),
+        ("black_captures", "u1"),
+        ("white_captures", "u1"),
+        ("policy", "u1"),
+        ("move", "<i2"),
+        ("value", "<f4"),
+        ("move_values", "<f4", (board_array_size(size),)),
+    ])
+
+
+def pack_board(board: np.ndarray) -> np.ndarray:
+    """ Pack a padded board array into 2 bits per point """
+    values = np.zeros(4 * ((len(board) + 3) // 4), dtype=np.uint8)
+    values[:len(board)] = board
+    values = values.reshape(-1, 4)
+    return (values[:, 0] | (values[:, 1] << 2) | (values[:, 2] << 4) | (values[:, 3] << 6)).astype(np.uint8)
+
+
+def unpack_boards(packed: np.ndarray, size: int) -> np.ndarray:
+    """
+    Unpack the board field of one record or an array of records
+    into padded board arrays, in the layout of GoBoard.board.
+    """
+    packed = np.asarray(packed, dtype=np.uint8)
+    values = np.stack([(packed >> shift) & 3 for shift in (0, 2, 4, 6)], axis=-1)
+    values = values.reshape(packed.shape[:-1] + (-1,))
+    return values[..., :board_array_size(size)]
+
+
+def _make_header(size: int) -> bytes:
+    header = np.zeros(1, dtype=_HEADER_DTYPE)
+    header["magic"] = MAGIC
+    header["version"] = FORMAT_VERSION
+    header["size"] = size
+    header["record_size"] = record_dtype(size).itemsize
+    return header.tobytes().ljust(HEADER_SIZE, b"\0")
+
+
+def read_header(path: str) -> int:
+    """ Check the header of a dataset file and return its board size """
+    with open(path, "rb") as f:
+        data = f.read(HEADER_SIZE)
+    if len(data) < HEADER_SIZE:
+        raise ValueError("not a dataset file: " + path)
+    header = np.frombuffer(data[:_HEADER_DTYPE.itemsize], dtype=_HEADER_DTYPE)[0]
+    if header["magic"] != MAGIC or header["version"] != FORMAT_VERSION:
+        raise ValueError("not a dataset file: " + path)
+    size = int(header["size"])
+    if header["record_size"] != record_dtype(size).itemsize:
+        raise ValueError("record size mismatch in " + path)
+    return size
+
+
+class DatasetWriter(object):
+    def __init__(self, path: str, size: int) -> None:
+        """
+        Open path for appending records of the given board size.
+        A new file gets a header, an existing one must have the same size.
+        """
+        self.size: int = size
+        self.dtype: np.dtype = record_dtype(size)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            if read_header(path) != size:
+                raise ValueError("{} holds positions of another board size".format(path))
+            self.file = open(path, "ab")
+        else:
+            self.file = open(path, "ab")
+            self.file.write(_make_header(size))
+        self.record = np.zeros(1, dtype=self.dtype)
+
+    def append(self, board: GoBoard, policy: str, move: GO_POINT,
+               moves: np.ndarray, values: List[float]) -> None:
+        """
+        Write the position of board.
+        policy: the category returned by policy_move_list
+        move: the move played from this position
+        moves, values: the flat Monte Carlo value of each candidate move
+        """
+        assert board.size == self.size
+        r = self.record[0]
+        r["board"] = pack_board(board.board)
+        r["to_play"] = board.current_player
+        r["black_captures"] = board.black_captures
+        r["white_captures"] = board.white_captures
+        r["policy"] = POLICY_CATEGORIES.index(policy)
+        r["move"] = move
+        r["move_values"] = np.nan
+        r["move_values"][moves] = values
+        r["value"] = r["move_values"][move]
+        self.file.write(self.record.tobytes())
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def read_dataset(path: str) -> np.ndarray:
+    """
+    Map the records of a dataset file as a read-only structured array.
+    Use unpack_boards on the board field to get board arrays.
+    """
+    size = read_header(path)
+    dtype = record_dtype(size)
+    count = (os.path.getsize(path) - HEADER_SIZE) // dtype.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=HEADER_SIZE, shape=(count,))
+
+
+def selfplay(path: str, size: int, games: int, numSimulations: int) -> int:
+    """
+    Play games with the flat Monte Carlo player against itself and write
+    every position to the dataset at path. Returns the number of positions.
+    """
+    player = FlatMonteCarloPlayer(numSimulations)
+    writer = DatasetWriter(path, size)
+    board = GoBoard(size)
+    positions = 0
+    try:
+        for _ in range(games):
+            board.reset(size)
+            while board.get_final_result() == "unknown":
+                policy, _ = player.policy_move_list(board)
+                moves, values = player.evaluate_moves(board)
+                move = int(moves[values.index(max(values))])
+                writer.append(board, policy, move, moves, values)
+                positions += 1
+                board.play_move(move, board.current_player)
+    finally:
+        writer.close()
+    return positions
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Ninuki self-play datasets")
+    commands = parser.add_subparsers(dest="command", required=True)
+    play = commands.add_parser("selfplay", help="append self-play positions to a dataset")
+    play.add_argument("--out", required=True, help="dataset file")
+    play.add_argument("--size", type=int, default=7, help="board size")
+    play.add_argument("--games", type=int, default=10, help="number of games")
+    play.add_argument("--simulations", type=int, default=10,
+                      help="playouts per move for the move values")
+    play.add_argument("--seed", type=int, default=None, help="random seed")
+    info = commands.add_parser("info", help="summarize a dataset")
+    info.add_argument("path")
+    args = parser.parse_args(argv)
+
+    if args.command == "selfplay":
+        if args.seed is not None:
+            playout_rng.seed(args.seed)
+        positions = selfplay(args.out, args.size, args.games, args.simulations)
+        print("wrote {} positions to {}".format(positions, args.out))
+    else:
+        records = read_dataset(args.path)
+        counts = np.bincount(records["policy"], minlength=len(POLICY_CATEGORIES))
+        print("size={} positions={} record_bytes={}".format(
+            read_header(args.path), len(records), records.dtype.itemsize))
+        for name, count in zip(POLICY_CATEGORIES, counts):
+            print("{} {}".format(name, count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+evaluation.py
+Static evaluation of Ninuki positions, updated incrementally.
+
+The score of a color is made of:
+- lines: every window of 5 consecutive points that holds stones of only
+  one color scores WINDOW_SCORES[number of stones] for that color.
+  An open four lies in two windows that need one more stone, a closed
+  four in one, so open shapes score more than closed ones without
+  looking for them explicitly. A full window is five in a row.
+- capture threats: every pattern X O O . in a line, where X can capture
+  the pair by playing on the empty point, scores CAPTURE_THREAT_SCORE for X.
+- captures: CAPTURE_SCORES by the number of pairs captured so far,
+  growing towards the 5 pairs that win.
+score(color) is the score of color minus the score of its opponent.
+
+An Evaluator is attached to one GoBoard. The board calls it from
+play_move and undo_move, and it only rescores the windows through the
+points that changed. Attaching is opt-in, since it slows down play_move:
+GoBoard.evaluator is None by default. After changing GoBoard.board
+directly (setup stones, SharedBoardState.sync) call attach again.
+
+run_score is a cheaper score from the runs of stones on a list of
+cells, for boards that have no Evaluator, such as the scratch board of
+a playout that is cut off.
+"""
+
+import math
+from typing import Dict, List, Tuple
+
+from board_base import BLACK, WHITE, EMPTY, BORDER, GO_COLOR, GO_POINT, coord_to_point, opponent
+
+"""
+Score of a 5-point window by the number of stones of its only color.
+"""
+WINDOW_SCORES: List[float] = [0.0, 1.0, 5.0, 25.0, 200.0, 10000.0]
+CAPTURE_THREAT_SCORE: float = 15.0
+"""
+Score by the number of captured pairs, up to 4. The fifth pair wins.
+"""
+CAPTURE_SCORES: List[float] = [0.0, 30.0, 70.0, 130.0, 250.0]
+"""
+Score of a run of stones of one color in a line by its length, per
+empty point at its ends, used by run_score. A five always scores RUN_SCORES[5].
+"""
+RUN_SCORES: List[float] = [0.0, 0.5, 5.0, 30.0, 200.0, 10000.0]
+
+"""
+Scale of the logistic function used by win_probability: a score
+difference of SCORE_SCALE is a win rate of about 73%.
+"""
+SCORE_SCALE: float = 100.0
+
+DIRECTIONS: List[Tuple[int, int]] = [(0, 1), (1, 0), (1, 1), (1, -1)]
+
+Windows = List[Tuple[GO_POINT, ...]]
+PointWindows = Dict[GO_POINT, List[int]]
+_geometry_cache: Dict[Tuple[int, int], Tuple[Windows, PointWindows]] = {}
+
+
+def line_windows(size: int, length: int) -> Tuple[Windows, PointWindows]:
+    """
+    All windows of length consecutive points in a line on a size x size
+    board, and for every point the numbers of the windows through it.
+    Computed once per size and length.
+    """
+    key = (size, length)
+    if key not in _geometry_cache:
+        windows: Windows = []
+        for row in range(1, size + 1):
+            for col in range(1, size + 1):
+                for dr, dc in DIRECTIONS:
+                    end_row = row + dr * (length - 1)
+                    end_col = col + dc * (length - 1)
+                    if 1 <= end_row <= size and 1 <= end_col <= size:
+                        windows.append(tuple(coord_to_point(row + dr * i, col + dc * i, size)
+                                             for i in range(length)))
+        point_windows: PointWindows = {}
+        for number, window in enumerate(windows):
+            for point in window:
+                point_windows.setdefault(point, []).append(number)
+        _geometry_cache[key] = (windows, point_windows)
+    return _geometry_cache[key]
+
+
+def score_probability(score: float) -> float:
+    """ Map a score to a win probability with a logistic function """
+    return 1.0 / (1.0 + math.exp(-max(-50.0, min(50.0, score / SCORE_SCALE))))
+
+
+def capture_value(stones: int) -> float:
+    """ Score of having captured the given number of stones """
+    return CAPTURE_SCORES[min(stones // 2, len(CAPTURE_SCORES) - 1)]
+
+
+def run_score(cells: List[GO_COLOR], NS: int, color: GO_COLOR,
+              black_captures: int, white_captures: int) -> float:
+    """
+    A cheaper score of the position in cells, the padded board of a
+    GoBoard as a list, for color, from the runs of stones in a line:
+    a run of n stones scores RUN_SCORES[n] per empty end, a five always
+    10000. A run of two with a stone of the other color on one end and
+    an empty point on the other is a capture threat for that color.
+    Captures score as in Evaluator.score. The cost grows with the number
+    of stones, not with the board size like Evaluator.
+    """
+    scores = [0.0, 0.0, 0.0]
+    threats = [0, 0, 0]
+    directions = [1, NS, NS + 1, NS - 1]
+    for p in range(len(cells)):
+        c = cells[p]
+        if c != BLACK and c != WHITE:
+            continue
+        for d in directions:
+            before = cells[p - d]
+            if before == c:
+                continue # not the first stone of its run
+            n = 1
+            q = p + d
+            while cells[q] == c:
+                n += 1
+                q += d
+            if n >= 5:
+                scores[c] += RUN_SCORES[5]
+                continue
+            after = cells[q]
+            scores[c] += RUN_SCORES[n] * ((before == EMPTY) + (after == EMPTY))
+            if n == 2:
+                if before == EMPTY and after != EMPTY and after != BORDER:
+                    threats[after] += 1
+                elif after == EMPTY and before != EMPTY and before != BORDER:
+                    threats[before] += 1
+    captures = [0, black_captures, white_captures]
+    opp = opponent(color)
+    return (scores[color] - scores[opp]
+            + CAPTURE_THREAT_SCORE * (threats[color] - threats[opp])
+            + capture_value(captures[color]) - capture_value(captures[opp]))
+
+
+class Evaluator(object):
+    def __init__(self, board=None) -> None:
+        """ Create an evaluator, and attach it to board if given """
+        self.board = None
+        if board is not None:
+            self.attach(board)
+
+    def attach(self, board) -> None:
+        """
+        Evaluate the current position of board from scratch and
+        follow its moves from now on.
+        """
+        self.board = board
+        board.evaluator = self
+        self.windows5, self.point_windows5 = line_windows(board.size, 5)
+        self.windows4, self.point_windows4 = line_windows(board.size, 4)
+        # plain ints: a numpy index makes every cells[p + d] a numpy operation
+        self.points: List[GO_POINT] = [int(coord_to_point(row, col, board.size))
+                                       for row in range(1, board.size + 1)
+                                       for col in range(1, board.size + 1)]
+        self.cells: List[GO_COLOR] = board.board.tolist()
+        cells = self.cells
+        self.empty: int = sum(1 for p in self.points if cells[p] == EMPTY)
+        self.stones: List[List[int]] = [None, [0] * len(self.windows5), [0] * len(self.windows5)]
+        self.line_score: List[float] = [0.0, 0.0, 0.0]
+        self.fives: List[int] = [0, 0, 0]
+        self.threats: List[int] = [0, 0, 0]
+        for number, window in enumerate(self.windows5):
+            for p in window:
+                if cells[p] == BLACK or cells[p] == WHITE:
+                    self.stones[cells[p]][number] += 1
+            self._add_window(number, 1)
+        for number in range(len(self.windows4)):
+            self._add_threat(number, 1)
+
+    def detach(self) -> None:
+        if self.board is not None and self.board.evaluator is self:
+            self.board.evaluator = None
+        self.board = None
+
+    def on_play(self, change: List) -> None:
+        """ Called by play_move with its change stack entry """
+        color, point = change[0], change[1]
+        self._set(point, color)
+        for capture in change[2:]:
+            self._set(capture, EMPTY)
+
+    def on_undo(self, change: List) -> None:
+        """ Called by undo_move with the change stack entry it takes back """
+        color, point = change[0], change[1]
+        opp = opponent(color)
+        for capture in change[2:]:
+            self._set(capture, opp)
+        self._set(point, EMPTY)
+
+    def _set(self, point: GO_POINT, color: GO_COLOR) -> None:
+        old = self.cells[point]
+        if old == color:
+            return
+        threat_windows = self.point_windows4.get(point, ())
+        for number in threat_windows:
+            self._add_threat(number, -1)
+        self.cells[point] = color
+        for number in threat_windows:
+            self._add_threat(number, 1)
+        for number in self.point_windows5.get(point, ()):
+            self._add_window(number, -1)
+            if old != EMPTY:
+                self.stones[old][number] -= 1
+            if color != EMPTY:
+                self.stones[color][number] += 1
+            self._add_window(number, 1)
+        if old == EMPTY:
+            self.empty -= 1
+        elif color == EMPTY:
+            self.empty += 1
+
+    def _add_window(self, number: int, sign: int) -> None:
+        black = self.stones[BLACK][number]
+        white = self.stones[WHITE][number]
+        if black > 0 and white == 0:
+            self.line_score[BLACK] += sign * WINDOW_SCORES[black]
+            if black == 5:
+                self.fives[BLACK] += sign
+        elif white > 0 and black == 0:
+            self.line_score[WHITE] += sign * WINDOW_SCORES[white]
+            if white == 5:
+                self.fives[WHITE] += sign
+
+    def _add_threat(self, number: int, sign: int) -> None:
+        cells = self.cells
+        a, b, c, d = [cells[p] for p in self.windows4[number]]
+        if b != c or (b != BLACK and b != WHITE):
+            return
+        capturer = opponent(b)
+        if (a == capturer and d == EMPTY) or (a == EMPTY and d == capturer):
+            self.threats[capturer] += sign
+
+    def winner(self) -> GO_COLOR:
+        """ The color that has five in a row or 10 captures, EMPTY if none """
+        board = self.board
+        if self.fives[BLACK] > 0 or board.black_captures >= 10:
+            return BLACK
+        if self.fives[WHITE] > 0 or board.white_captures >= 10:
+            return WHITE
+        return EMPTY
+
+    def score(self, color: GO_COLOR) -> float:
+        """ Static score of the position for color """
+        opp = opponent(color)
+        board = self.board
+        return (self.line_score[color] - self.line_score[opp]
+                + CAPTURE_THREAT_SCORE * (self.threats[color] - self.threats[opp])
+                + capture_value(board.get_captures(color)) - capture_value(board.get_captures(opp)))
+
+    def win_probability(self, color: GO_COLOR) -> float:
+        """ score(color) mapped to [0, 1] """
+        return score_probability(self.score(color))
+
+    def move_priority(self, point: GO_POINT, color: GO_COLOR) -> float:
+        """
+        How much a move of color on the empty point adds to the windows
+        through it, for both colors: the gain in attack plus the gain in
+        defense. Used to order moves.
+        """
+        black_stones = self.stones[BLACK]
+        white_stones = self.stones[WHITE]
+        priority = 0.0
+        for number in self.point_windows5.get(point, ()):
+            black = black_stones[number]
+            white = white_stones[number]
+            if white == 0:
+                priority += WINDOW_SCORES[black + 1] - WINDOW_SCORES[black]
+            if black == 0:
+                priority += WINDOW_SCORES[white + 1] - WINDOW_SCORES[white]
+        return priority
+
+    def candidate_moves(self) -> List[GO_POINT]:
+        """
+        Empty points next to a stone, or the center of an empty board.
+        """
+        cells = self.cells
+        board = self.board
+        offsets = [1, -1, board.NS, -board.NS, board.NS + 1, -(board.NS + 1),
+                   board.NS - 1, -board.NS + 1]
+        moves = []
+        for p in self.points:
+            if cells[p] != EMPTY:
+                continue
+            for d in offsets:
+                if cells[p + d] == BLACK or cells[p + d] == WHITE:
+                    moves.append(p)
+                    break
+        if not moves and self.empty > 0:
+            center = coord_to_point((board.size + 1) // 2, (board.size + 1) // 2, board.size)
+            moves = [center] if cells[center] == EMPTY else [p for p in self.points if cells[p] == EMPTY]
+        return moves
@@ -30,12 +30,12 @@ V3
 Fixed edge case mentioned in assignment 3 update for the class
 Should be Completed
 """
-from email import policy
 import traceback
 import numpy as np
 import re
+import time
 from sys import stdin, stdout, stderr
-from typing import Any, Callable, Dict, List, Tuple
+from typing import Any, Callable, Dict, List, TextIO, Tuple
 
 from board_base import (
     BLACK,
@@ -51,9 +51,16 @@ from board_base import (
 from board import GoBoard
 from board_util import GoBoardUtil
 from engine import GoEngine
+from analysis import AnalysisReporter
+from rave import AmafStats, blend
+from time_control import TimeManager
+import tracing
+# sgf, mcts and parallel_search are imported by the commands that use them,
+# so that starting the engine does not pay for multiprocessing and friends
 
 class GtpConnection:
-    def __init__(self, go_engine: GoEngine, board: GoBoard, debug_mode: bool = False) -> None:
+    def __init__(self, go_engine: GoEngine, board: GoBoard, debug_mode: bool = False,
+                 infile: TextIO = None, outfile: TextIO = None) -> None:
         """
         Manage a GTP connection for a Go-playing engine
 
@@ -63,13 +70,27 @@ class GtpConnection:
             a program that can reply to a set of GTP commandsbelow
         board: 
             Represents the current board state.
+        infile, outfile:
+            where commands are read from and responses written to,
+            stdin and stdout by default
         """
         self._debug_mode: bool = debug_mode
+        self.infile: TextIO = infile if infile is not None else stdin
+        self.outfile: TextIO = outfile if outfile is not None else stdout
         self.go_engine = go_engine
         self.board: GoBoard = board
 
         self.player = FlatMonteCarloPlayer(10)
         self.policy = "random"
+        self.search = "flat"
+        self.workers = None
+        self.parallel_player = None # ParallelMCTSPlayer, created on first use
+        self.mcts_player = None # MCTSPlayer, kept so that its tree is reused
+        self.puct_player = None # PUCTPlayer, likewise
+        self.analyze_interval: float = 0.0
+        self.timelimit: int = 1
+        self.time_manager = TimeManager()
+        self.analysis = AnalysisReporter(self.format_move)
 
         self.commands: Dict[str, Callable[[List[str]], None]] = {
             "protocol_version": self.protocol_version_cmd,
@@ -95,9 +116,21 @@ class GtpConnection:
             "gogui-analyze_commands": self.gogui_analyze_cmd,
             "timelimit": self.timelimit_cmd,
             "solve": self.solve_cmd,
+            "time_settings": self.time_settings_cmd,
+            "time_left": self.time_left_cmd,
+            "trace_start": self.trace_start_cmd,
+            "trace_stop": self.trace_stop_cmd,
+            "solved_db": self.solved_db_cmd,
             # New Added functions for A3
             "policy": self.policy_cmd,
-            "policy_moves": self.policy_moves_cmd
+            "policy_moves": self.policy_moves_cmd,
+            "search": self.search_cmd,
+            "workers": self.workers_cmd,
+            "playout_policy": self.playout_policy_cmd,
+            "playout_limit": self.playout_limit_cmd,
+            "analyze_interval": self.analyze_interval_cmd,
+            "analysis_winrates": self.analysis_winrates_cmd,
+            "loadsgf": self.loadsgf_cmd
             }
 
         # argmap is used for argument checking
@@ -110,23 +143,33 @@ class GtpConnection:
             "genmove": (1, "Usage: genmove {w,b}"),
             "play": (2, "Usage: play {b,w} MOVE"),
             "legal_moves": (1, "Usage: legal_moves {w,b}"),
+            "search": (1, "Usage: search {" + ",".join(SEARCH_MODES) + "}"),
+            "workers": (1, "Usage: workers INT"),
+            "playout_limit": (1, "Usage: playout_limit INT"),
+            "analyze_interval": (1, "Usage: analyze_interval SECONDS"),
+            "timelimit": (1, "Usage: timelimit INT"),
+            "solve": (0, "Usage: solve"),
+            "time_settings": (3, "Usage: time_settings MAIN_TIME BYO_YOMI_TIME BYO_YOMI_STONES"),
+            "time_left": (3, "Usage: time_left {w,b} TIME STONES"),
+            "trace_stop": (0, "Usage: trace_stop"),
+            "solved_db": (1, "Usage: solved_db {FILE,off}"),
         }
 
     def write(self, data: str) -> None:
-        stdout.write(data)
+        self.outfile.write(data)
 
     def flush(self) -> None:
-        stdout.flush()
+        self.outfile.flush()
 
     def start_connection(self) -> None:
         """
         Start a GTP connection. 
         This function continuously monitors standard input for commands.
         """
-        line = stdin.readline()
+        line = self.infile.readline()
         while line:
             self.get_cmd(line)
-            line = stdin.readline()
+            line = self.infile.readline()
 
     def get_cmd(self, command: str) -> None:
         """
@@ -149,7 +192,8 @@ class GtpConnection:
             return
         if command_name in self.commands:
             try:
-                self.commands[command_name](args)
+                with tracing.span(command_name, "gtp", {"args": args}, profile=True):
+                    self.commands[command_name](args)
             except Exception as e:
                 self.debug_msg("Error executing command {}\n".format(str(e)))
                 self.debug_msg("Stack Trace:\n{}\n".format(traceback.format_exc()))
@@ -157,7 +201,7 @@ class GtpConnection:
         else:
             self.debug_msg("Unknown command: {}\n".format(command_name))
             self.error("Unknown command")
-            stdout.flush()
+            self.flush()
 
     def has_arg_error(self, cmd: str, argnum: int) -> bool:
         """
@@ -176,14 +220,14 @@ class GtpConnection:
             stderr.flush()
 
     def error(self, error_msg: str) -> None:
-        """ Send error msg to stdout """
-        stdout.write("? {}\n\n".format(error_msg))
-        stdout.flush()
+        """ Send error msg to the output stream """
+        self.write("? {}\n\n".format(error_msg))
+        self.flush()
 
     def respond(self, response: str = "") -> None:
-        """ Send response to stdout """
-        stdout.write("= {}\n\n".format(response))
-        stdout.flush()
+        """ Send response to the output stream """
+        self.write("= {}\n\n".format(response))
+        self.flush()
 
     def reset(self, size: int) -> None:
         """
@@ -272,11 +316,11 @@ class GtpConnection:
         '''
         try:
             p = args[0].lower()
-            assert(p == "random" or "rule_based")
+            assert(p == "random" or p == "rule_based")
             self.policy = p
-            
+            self.respond()
         except:
-            self.respond("incorrect policy type: " + str(args[0]) + " type 'random' or 'rule_based'")
+            self.error("incorrect policy type: " + str(args[0]) + " type 'random' or 'rule_based'")
 
     def policy_moves_cmd(self, args: List[str]) -> None:
         """
@@ -303,6 +347,156 @@ class GtpConnection:
             out.sort()
             self.respond(pol+" "+ " ".join(str(e) for e in out))
         return None
+
+    def search_cmd(self, args: List[str]) -> None:
+        """
+        Set the search used by genmove with the random simulation policy:
+        flat         flat Monte Carlo, FlatMonteCarloPlayer
+        mcts         Monte Carlo tree search, MCTSPlayer
+        puct         tree search with rule based priors, PUCTPlayer
+        alphabeta    depth-limited alpha-beta on a static evaluation, AlphaBetaPlayer
+        root_parallel, tree_parallel
+                     parallel tree search, ParallelMCTSPlayer
+        auto         the parallel variant preferred for the board size
+        """
+        mode = args[0].lower()
+        if mode not in SEARCH_MODES:
+            self.error("unknown search: " + args[0])
+            return
+        self.search = mode
+        self.respond()
+
+    def workers_cmd(self, args: List[str]) -> None:
+        """ Set the number of processes used by the parallel searches """
+        try:
+            workers = int(args[0])
+            assert workers >= 1
+        except (ValueError, AssertionError):
+            self.error("workers must be a positive integer")
+            return
+        self.workers = workers
+        self.respond()
+
+    def playout_policy_cmd(self, args: List[str]) -> None:
+        """
+        Set the policy of the playouts: playout_policy {random,pattern} [FILE]
+        random       uniformly random moves
+        pattern      moves sampled by pattern_policy.PatternPolicy, with
+                     the table saved in FILE, or the default table
+        """
+        if not 1 <= len(args) <= 2 or args[0] not in ["random", "pattern"] \
+                or (args[0] == "random" and len(args) == 2):
+            self.error("Usage: playout_policy {random,pattern} [FILE]")
+            return
+        if args[0] == "random":
+            self.board.playout_policy = None
+        else:
+            from pattern_policy import PatternPolicy
+            try:
+                policy = PatternPolicy.load(args[1]) if len(args) == 2 else PatternPolicy()
+            except (OSError, ValueError, AssertionError):
+                self.error("cannot load pattern table " + args[1])
+                return
+            self.board.playout_policy = policy
+        self.respond()
+
+    def playout_limit_cmd(self, args: List[str]) -> None:
+        """
+        Set the most moves per playout, 0 for full playouts. A playout that
+        reaches the limit is scored by a quick evaluation, see
+        GoBoard.playout_limit.
+        """
+        try:
+            limit = int(args[0])
+            assert limit >= 0
+        except (ValueError, AssertionError):
+            self.error("playout_limit must be a non-negative integer")
+            return
+        self.board.playout_limit = limit if limit > 0 else None
+        self.respond()
+
+    def analyze_interval_cmd(self, args: List[str]) -> None:
+        """
+        Stream the search progress to stderr every args[0] seconds
+        during genmove. 0 turns streaming off.
+        """
+        try:
+            interval = float(args[0])
+            assert interval >= 0
+        except (ValueError, AssertionError):
+            self.error("interval must be a non-negative number of seconds")
+            return
+        self.analyze_interval = interval
+        self.respond()
+
+    def analysis_winrates_cmd(self, args: List[str]) -> None:
+        """ Win rates of the moves searched by the last genmove, as GoGui gfx """
+        self.respond(self.analysis.format_gfx())
+
+    def loadsgf_cmd(self, args: List[str]) -> None:
+        """
+        Load the position of an SGF file: loadsgf FILE [MOVE_NUMBER]
+        Without MOVE_NUMBER all moves of the main line are played, otherwise
+        the position before move MOVE_NUMBER. Only the first game of the
+        file is used.
+        The moves are replayed with play_move and can be undone.
+        The game is replayed on a copy of the board first, so a file that
+        cannot be loaded leaves the position unchanged.
+        """
+        if not 1 <= len(args) <= 2:
+            self.error("Usage: loadsgf FILE [MOVE_NUMBER]")
+            return
+        num_moves = None
+        if len(args) == 2:
+            try:
+                num_moves = int(args[1]) - 1
+                assert num_moves >= 0
+            except (ValueError, AssertionError):
+                self.error("MOVE_NUMBER must be a positive integer")
+                return
+        from sgf import read_game, replay
+        try:
+            record = read_game(args[0])
+            if record is None:
+                self.error("no game in " + args[0])
+                return
+            replay(self.board.copy(), record, num_moves)
+            replay(self.board, record, num_moves)
+        except (OSError, ValueError) as e:
+            self.error("cannot load {}: {}".format(args[0], str(e)))
+            return
+        self.respond()
+
+    def format_move(self, move: GO_POINT) -> str:
+        return format_point(point_to_coord(move, self.board.size)).lower()
+
+    def search_player(self):
+        """ The player used by genmove for the current search mode """
+        if self.search == "flat":
+            return self.player
+        if self.search == "alphabeta":
+            from alphabeta import AlphaBetaPlayer
+            return AlphaBetaPlayer()
+        if self.search == "mcts":
+            from mcts import MCTSPlayer
+            if self.mcts_player is None or self.mcts_player.numSimulations != self.player.numSimulations:
+                self.mcts_player = MCTSPlayer(self.player.numSimulations)
+            return self.mcts_player
+        if self.search == "puct":
+            from puct import PUCTPlayer
+            if self.puct_player is None or self.puct_player.numSimulations != self.player.numSimulations:
+                self.puct_player = PUCTPlayer(self.player.numSimulations)
+            return self.puct_player
+        # keep the parallel player, its worker pool is reused between genmoves
+        p = self.parallel_player
+        if p is None or (self.workers and p.workers != self.workers):
+            if p is not None:
+                p.close()
+            from parallel_search import ParallelMCTSPlayer
+            p = ParallelMCTSPlayer(self.player.numSimulations, self.search, self.workers)
+            self.parallel_player = p
+        p.mode = self.search
+        return p
     """
 
     # Genmove needs to be changed using active simulation policy |X|
@@ -324,6 +518,7 @@ class GtpConnection:
                      "pstring/Board Size/gogui-rules_board_size\n"
                      "pstring/Rules GameID/gogui-rules_game_id\n"
                      "pstring/Show Board/gogui-rules_board\n"
+                     "gfx/Win Rates/analysis_winrates\n"
                      )
 
     def gogui_rules_game_id_cmd(self, args: List[str]) -> None:
@@ -362,28 +557,12 @@ class GtpConnection:
 
     def gogui_rules_final_result_cmd(self, args: List[str]) -> None:
         """ We already implemented this function for Assignment 2 """
-        result1 = self.board.detect_five_in_a_row()
-        result2 = EMPTY
-        if self.board.get_captures(BLACK) >= 10:
-            result2 = BLACK
-        elif self.board.get_captures(WHITE) >= 10:
-            result2 = WHITE
-
-        if (result1 == BLACK) or (result2 == BLACK):
-            self.respond("black")
-        elif (result1 == WHITE) or (result2 == WHITE):
-            self.respond("white")
-        elif self.board.get_empty_points().size == 0:
-            self.respond("draw")
-        else:
-            self.respond("unknown")
+        self.respond(self.board.get_final_result())
         return
 
     def gogui_rules_legal_moves_cmd(self, args: List[str]) -> None:
         """ We already implemented this function for Assignment 2 """
-        if (self.board.detect_five_in_a_row() != EMPTY) or \
-            (self.board.get_captures(BLACK) >= 10) or \
-            (self.board.get_captures(WHITE) >= 10):
+        if self.board.get_final_result() in ("black", "white"):
             self.respond("")
             return
         legal_moves = self.board.get_empty_points()
@@ -440,38 +619,170 @@ class GtpConnection:
         """
         board_color = args[0].lower()
         color = color_to_int(board_color)
-        result1 = self.board.detect_five_in_a_row()
-        result2 = EMPTY
-        if self.board.get_captures(BLACK) >= 10:
-            result2 = BLACK
-        elif self.board.get_captures(WHITE) >= 10:
-            result2 = WHITE
-
-        if (result1 == opponent(color)) or (result2 == opponent(color)):
+        result = self.board.get_final_result()
+        if result == ["", "black", "white"][opponent(color)]:
             self.respond("resign")
             return
-        elif (result1 == color) or (result2 == color) or self.board.get_empty_points().size == 0:
+        elif result != "unknown":
             self.respond("pass")
             return
 
-        # Choose move based on policy
-        if self.policy == "random":
-            move = self.player.genmoveRandom(self.board)
-        elif self.policy == "rule_based":
-            move = self.player.genmovePolicy(self.board)
-
+        clock = self.time_manager
+        if clock.active:
+            start = time.time()
+            with tracing.span("time_budget"):
+                # positions where the rule based policy finds a move in one of the
+                # CRITICAL_CATEGORIES get more time
+                category, policy_moves = self.player.policy_move_list(self.board)
+                clock.start_move(color, len(self.board.get_empty_points()),
+                                 category in CRITICAL_CATEGORIES, start, policy_moves)
+        move = self.choose_move()
+        if clock.active:
+            clock.end_move(color)
         move_coord = point_to_coord(move, self.board.size)
         move_as_string = format_point(move_coord)
         self.play_cmd([board_color, move_as_string, 'print_move'])
         return
     
+    def choose_move(self) -> GO_POINT:
+        """
+        Choose a move for the current player based on policy and search.
+        Only called when the game is not over.
+        With the random policy a forced win found by threat-space search
+        is played without searching further.
+        With a game clock every search runs until the time manager stops it.
+        """
+        self.analysis.interval = self.analyze_interval
+        self.analysis.start()
+        if self.policy == "rule_based":
+            with tracing.span("policy"):
+                return self.player.genmovePolicy(self.board)
+        from tss import GENMOVE_TIME_LIMIT, forced_win_move
+        control = self.time_manager if self.time_manager.active else None
+        tss_time = GENMOVE_TIME_LIMIT if control is None else min(GENMOVE_TIME_LIMIT, control.soft)
+        with tracing.span("threat_space_search"):
+            move = forced_win_move(self.board, time_limit=tss_time, db=self.board.solved_db)
+        if move is not None:
+            return move
+        with tracing.span("search", args={"search": self.search}):
+            if self.search == "flat":
+                return self.player.genmoveRandom(self.board, self.analysis, control)
+            return self.search_player().genmove(self.board, self.analysis, control)
+
     def timelimit_cmd(self, args: List[str]) -> None:
-        """ Implement this function for Assignment 2 """
-        pass
+        """ Set the time limit of solve in seconds, 1 to 100 """
+        try:
+            seconds = int(args[0])
+            assert 1 <= seconds <= 100
+        except (ValueError, AssertionError):
+            self.error("time limit must be an integer from 1 to 100")
+            return
+        self.timelimit = seconds
+        self.respond()
+
+    def time_settings_cmd(self, args: List[str]) -> None:
+        """
+        Set the game clock of both players: main time in seconds, then
+        byo-yomi periods of BYO_YOMI_TIME seconds for BYO_YOMI_STONES moves.
+        BYO_YOMI_TIME > 0 with BYO_YOMI_STONES 0 means no time limit.
+        """
+        try:
+            main_time, byo_yomi_time = float(args[0]), float(args[1])
+            byo_yomi_stones = int(args[2])
+            assert main_time >= 0 and byo_yomi_time >= 0 and byo_yomi_stones >= 0
+        except (ValueError, AssertionError):
+            self.error("time settings must be non-negative numbers")
+            return
+        self.time_manager.time_settings(main_time, byo_yomi_time, byo_yomi_stones)
+        self.respond()
+
+    def time_left_cmd(self, args: List[str]) -> None:
+        """
+        Correct the clock of a color: TIME seconds left for STONES moves in
+        the current byo-yomi period, or of main time if STONES is 0.
+        """
+        try:
+            color = color_to_int(args[0].lower())
+            seconds, stones = float(args[1]), int(args[2])
+            assert color in (BLACK, WHITE) and stones >= 0
+        except (KeyError, ValueError, AssertionError):
+            self.error("Usage: time_left {w,b} TIME STONES")
+            return
+        self.time_manager.time_left(color, seconds, stones)
+        self.respond()
+
+    def trace_start_cmd(self, args: List[str]) -> None:
+        """
+        Start tracing: trace_start FILE [profile]
+        Spans of the following commands and engine phases are written to
+        FILE in Chrome trace format by trace_stop or at exit. With profile,
+        the functions each command spends most time in are written to stderr.
+        """
+        if not 1 <= len(args) <= 2 or (len(args) == 2 and args[1] != "profile"):
+            self.error("Usage: trace_start FILE [profile]")
+            return
+        tracing.start(args[0], len(args) == 2)
+        self.respond()
+
+    def trace_stop_cmd(self, args: List[str]) -> None:
+        """ Write the trace file and stop tracing """
+        tracing.stop()
+        self.respond()
+
+    def solved_db_cmd(self, args: List[str]) -> None:
+        """
+        Use the solved position database FILE, created if it does not
+        exist, in solve, genmove and the playouts. off stops using it.
+        """
+        if args[0] == "off":
+            self.board.solved_db = None
+        else:
+            from solved_db import SolvedDB
+            try:
+                self.board.solved_db = SolvedDB(args[0])
+            except (OSError, ValueError) as e:
+                self.error("cannot open solved position database: {}".format(e))
+                return
+        self.respond()
 
     def solve_cmd(self, args: List[str]) -> None:
-        """ Implement this function for Assignment 2 """
-        pass
+        """
+        Solve the position for the player to move within the time limit.
+        Answers "b MOVE" or "w MOVE" if the player to move wins, the color
+        of the opponent if it wins, "draw MOVE" for a draw, and "unknown"
+        if the time limit was reached.
+        """
+        from solver import WIN, DRAW
+        solved = self.solve_position()
+        if solved is None:
+            self.respond("unknown")
+            return
+        value, move = solved
+        toplay = self.board.current_player
+        if value == WIN:
+            response = "b" if toplay == BLACK else "w"
+        elif value == DRAW:
+            response = "draw"
+        else:
+            self.respond("w" if toplay == BLACK else "b")
+            return
+        if move is not None:
+            response += " " + self.format_move(move)
+        self.respond(response)
+
+    def solve_position(self) -> Tuple[int, GO_POINT]:
+        """
+        The (result, move) of Solver.solve for the current position, None
+        if the time limit was reached.
+        With workers set above 1, the search runs on that many processes.
+        """
+        from solver import Solver
+        if self.workers is not None and self.workers > 1:
+            from parallel_solver import ParallelSolver
+            solver = ParallelSolver(self.timelimit, self.workers, self.board.solved_db)
+        else:
+            solver = Solver(self.timelimit, self.board.solved_db)
+        return solver.solve(self.board)
 
     """
     ==========================================================================
@@ -479,6 +790,20 @@ class GtpConnection:
     ==========================================================================
     """
 
+# the parallel modes are parallel_search.PARALLEL_MODES, spelled out here
+# to keep parallel_search out of the startup imports
+SEARCH_MODES = ["flat", "mcts", "puct", "alphabeta", "root_parallel", "tree_parallel", "auto"]
+
+"""
+Move categories of the rule based policy, in order of priority.
+"""
+POLICY_CATEGORIES = ["Win", "BlockWin", "OpenFour", "Capture", "Random"]
+
+"""
+Policy categories of critical positions, which get more time with a game clock.
+"""
+CRITICAL_CATEGORIES = ["BlockWin", "OpenFour", "Capture"]
+
 def point_to_coord(point: GO_POINT, boardsize: int) -> Tuple[int, int]:
     """
     Transform point given as board array index 
@@ -555,8 +880,10 @@ def legal_moves_cmd(self, args: List[str]) -> None:
 
 
 class FlatMonteCarloPlayer(object):
-    def __init__(self, numSimulations):
+    def __init__(self, numSimulations, use_rave: bool = True):
         self.numSimulations = numSimulations
+        self.use_rave = use_rave
+        self.amaf = None
 
     def name(self):
         return "Flat Monte Carlo Player ({0} sim.)".format(self.numSimulations)
@@ -576,38 +903,107 @@ class FlatMonteCarloPlayer(object):
         assert best in state.get_empty_points()
         return best
     '''
-    def genmoveRandom(self, state: GoBoard) -> None:
+    def genmoveRandom(self, state: GoBoard, reporter: AnalysisReporter = None,
+                      control: TimeManager = None) -> None:
         assert not state.end_of_game() #in board
-        moves = state.get_empty_points() #legal_moves_cmd in gtp_connection
-        numMoves = len(moves)
-        score = [0] * numMoves
-        for i in range(numMoves):
-            move = moves[i]
-            score[i] = self.simulate(state, move)
+        # Playouts stop early once the result is forced, so a move that wins
+        # at once and a move that wins a few moves later both score 1.
+        # Play the immediate win.
+        winning = state.winning_moves(state.current_player)
+        if winning:
+            return winning[0]
+        moves, score = self.evaluate_moves(state, reporter, control)
+        if control is not None and max(score) < 0:
+            # not a single playout in time
+            fallback = control.fallback_move(state.get_rng())
+            if fallback is not None:
+                return fallback
         bestIndex = score.index(max(score))
         best = moves[bestIndex]
         assert best in state.get_empty_points()
         return best
 
+    def evaluate_moves(self, state: GoBoard, reporter: AnalysisReporter = None,
+                       control: TimeManager = None):
+        """
+        Flat Monte Carlo values of all empty points for the player to move.
+        Returns the moves and the list of their values.
+        Without control every move gets numSimulations playouts. With a
+        time manager, rounds of one playout per move are run until
+        control.should_stop, so that a short budget still compares the
+        moves. The first round tries the moves of the rule based policy
+        first, the others in random order. Only the hard limit can end the
+        first round; moves that were not reached then get the value -1.
+        """
+        moves = state.get_empty_points()
+        n = self.numSimulations
+        if control is not None:
+            n = 1
+            moves = np.array(moves)
+            state.get_rng().shuffle(moves)
+            if control.policy_moves is not None:
+                policy = set(int(p) for p in control.policy_moves)
+                moves = [p for p in moves if p in policy] + [p for p in moves if p not in policy]
+        numMoves = len(moves)
+        visits = [0] * numMoves
+        wins = [0.0] * numMoves
+        self.amaf = AmafStats(state.maxpoint) if self.use_rave else None
+        stats = lambda: {moves[j]: (visits[j], wins[j]) for j in range(numMoves) if visits[j] > 0}
+        playouts = 0
+        rounds = 0
+        stop = False
+        while not stop:
+            for i in range(numMoves):
+                wins[i] += self.simulate(state, moves[i], n) * n
+                visits[i] += n
+                playouts += n
+                if reporter is not None:
+                    reporter.update(playouts, stats)
+                first_round = rounds == 0 and i < numMoves - 1
+                if control is not None and (control.out_of_time() if first_round
+                                            else control.should_stop(playouts, stats)):
+                    stop = True
+                    break
+            rounds += 1
+            stop = stop or control is None
+        score = [wins[i] / visits[i] if visits[i] > 0 else -1 for i in range(numMoves)]
+        if self.use_rave:
+            color = state.current_player
+            for i in range(numMoves):
+                if visits[i] > 0:
+                    score[i] = blend(score[i], visits[i],
+                                     self.amaf.value(color, moves[i]),
+                                     self.amaf.visits[color, moves[i]])
+        if reporter is not None:
+            reporter.finish(playouts, {moves[j]: (visits[j], score[j] * visits[j])
+                                       for j in range(numMoves) if visits[j] > 0})
+        return moves, score
+
     def genmovePolicy(self, state: GoBoard) -> None:
         assert not state.end_of_game() #in board
         _, moves = self.policy_move_list(state)
-        move = np.random.choice(moves, 1)
+        move = state.get_rng().choice(moves)
         return int(move)
 
-    def simulate(self, state: GoBoard, move):
+    def simulate(self, state: GoBoard, move, numSimulations: int = None):
+        """ Value of move from numSimulations playouts, self.numSimulations by default """
+        if numSimulations is None:
+            numSimulations = self.numSimulations
         stats = [0] * 3
         state.play_move(move, state.current_player)
         moveNr = state.moveNumber()
-        for _ in range(self.numSimulations):
-            winner = state.simulate()
+        for _ in range(numSimulations):
+            moves = None if self.amaf is None else []
+            winner = state.simulate_unlogged(moves=moves)
             #print(winner)
             stats[winner] += 1
-            state.resetToMoveNumber(moveNr)
-        assert sum(stats) == self.numSimulations
+            if self.amaf is not None:
+                # the root move and every move of the playout count for AMAF
+                self.amaf.update(state.change_stack[moveNr:] + moves, winner)
+        assert sum(stats) == numSimulations
         assert moveNr == state.moveNumber()
         state.undo_move() #in board 
-        eval = (stats[BLACK] + 0.5 * stats[EMPTY]) / self.numSimulations
+        eval = (stats[BLACK] + 0.5 * stats[EMPTY]) / numSimulations
         if state.current_player == WHITE:
             eval = 1 - eval
         return eval
@@ -660,6 +1056,6 @@ class FlatMonteCarloPlayer(object):
 
         for i in range(4): #Choose move from policy
             if policymoves[i] != []:
-                return ["Win", "BlockWin", "OpenFour", "Capture"][i], policymoves[i]
+                return POLICY_CATEGORIES[i], policymoves[i]
 
         return "Random", moves # If no moves in policy return all moves for random policy
@@ -0,0 +1,292 @@
+#!/usr/bin/python3
+"""
+gtp_regress.py
+Parallel runner of GTP regression test files.
+
+A test file is a list of GTP commands. A command with a number is a
+test when it is followed by an expectation line, as in gogui-regress:
+
+    10 policy_moves
+    #?[Win e2]
+
+The response, without "= ", must match the regular expression in the
+brackets completely. [!pattern] expects a response that does not match,
+and an error response only matches a pattern that starts with "?".
+A "*" after the brackets marks a known failure, which is reported but
+does not fail the run.
+
+The file is split into blocks, each starting at a boardsize or
+clear_board command, and the blocks are run on --workers engine
+processes at once. Settings such as policy or timelimit last across
+clear_board, and so does the board size, so before its first block an
+engine replays the last boardsize and setting commands of the file that
+come before it, see SETTING_COMMANDS. An engine runs a chunk of
+consecutive blocks, so inside a chunk the commands run as in the file,
+and every chunk gets a new engine.
+
+With --check-serial the files are also run on one engine each, as if
+piped through it, and every test whose pass or fail differs between the
+two runs is reported. Such a test depends on state the blocks do not
+replay.
+
+The runner reports every failed test, the number of passed tests, and
+for each command name the count and the 50th, 95th and 99th percentile
+of the time from sending the command to reading its full response.
+The replayed settings are not timed. The exit status is 1 if a test
+failed unexpectedly, or differs from the serial run.
+
+Usage:
+    python3 gtp_regress.py assignment3-public-tests.gtp --workers 4
+    python3 gtp_regress.py assignment3-public-tests.gtp --workers 4 --check-serial
+    python3 gtp_regress.py suite1.gtp suite2.gtp --engine "python3 Ninuki.py"
+"""
+
+import argparse
+import os
+import re
+import shlex
+import subprocess
+import sys
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+"""
+Commands whose effect lasts across boardsize and clear_board. They are
+replayed before a block together with the last boardsize.
+"""
+SETTING_COMMANDS: List[str] = [
+    "komi", "timelimit", "time_settings", "policy", "search", "workers",
+    "playout_policy", "playout_limit", "analyze_interval", "analysis_winrates",
+    "solved_db",
+]
+
+BLOCK_COMMANDS: List[str] = ["boardsize", "clear_board"]
+
+"""
+Chunks per worker, so that workers that get fast blocks are not idle.
+"""
+CHUNKS_PER_WORKER: int = 4
+
+PERCENTILES: List[int] = [50, 95, 99]
+
+_EXPECTATION = re.compile(r"#\?\[(.*)\](\*?)\s*$")
+_RESPONSE = re.compile(r"([=?])\d*\s?")
+
+
+class Command(object):
+    def __init__(self, path: str, line: int, text: str) -> None:
+        """ A command of a test file, and what is expected of its response """
+        self.path: str = path
+        self.line: int = line
+        self.text: str = text
+        words = re.sub(r"^\d+", "", text).split()
+        self.name: str = words[0] if words else ""
+        self.numbered: bool = text[0].isdigit()
+        self.expected: str = None
+        self.known_failure: bool = False
+
+
+class Result(object):
+    def __init__(self, command: Command, response: str, error: bool, seconds: float) -> None:
+        self.command: Command = command
+        self.response: str = response
+        self.error: bool = error
+        self.seconds: float = seconds
+        self.passed: bool = command.expected is None or matches(command.expected, response, error)
+
+
+def matches(expected: str, response: str, error: bool) -> bool:
+    """ The response matches the expectation, see the module docstring """
+    if expected.startswith("!"):
+        return not matches(expected[1:], response, error)
+    if expected.startswith("?"):
+        return error and re.fullmatch(expected[1:], response) is not None
+    return not error and re.fullmatch(expected, response) is not None
+
+
+def read_tests(path: str) -> List[Command]:
+    """
+    The commands of a test file, with their expectations.
+    Raises ValueError for an expectation that does not follow a
+    numbered command.
+    """
+    commands: List[Command] = []
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if line.startswith("#?"):
+                m = _EXPECTATION.match(line)
+                if m is None or not commands or not commands[-1].numbered:
+                    raise ValueError("{}:{}: expectation without a numbered command".format(path, number))
+                commands[-1].expected = m.group(1)
+                commands[-1].known_failure = m.group(2) == "*"
+            elif line and not line.startswith("#"):
+                commands.append(Command(path, number, line))
+    return commands
+
+
+def split_blocks(commands: List[Command]) -> List[Tuple[List[str], List[Command]]]:
+    """
+    Split the commands of a file into blocks, each starting at a
+    boardsize or clear_board command. Each block comes with the
+    commands to replay before it: the last boardsize and the last
+    command of each name in SETTING_COMMANDS before the block, in file
+    order. clear_board keeps the board size, so a block that starts
+    with it needs the boardsize of an earlier block.
+    """
+    blocks: List[List[Command]] = []
+    settings: Dict[str, Command] = {}
+    current: List[Command] = []
+    for i, command in enumerate(commands):
+        starts = command.name in BLOCK_COMMANDS and not (i > 0 and commands[i - 1].name in BLOCK_COMMANDS)
+        if starts and current:
+            blocks.append(current)
+            current = []
+        current.append(command)
+    if current:
+        blocks.append(current)
+
+    result = []
+    for block in blocks:
+        replay = sorted(settings.values(), key=lambda c: c.line)
+        result.append(([re.sub(r"^\d+", "", c.text).strip() for c in replay], block))
+        for command in block:
+            if command.name in SETTING_COMMANDS or command.name == "boardsize":
+                settings[command.name] = command
+    return result
+
+
+class Engine(object):
+    def __init__(self, argv: List[str]) -> None:
+        """ A GTP engine process, talking over its stdin and stdout """
+        self.process = subprocess.Popen(argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL, text=True)
+        self.send("name") # wait until the engine has started, outside the timings
+
+    def send(self, text: str) -> Tuple[str, bool]:
+        """ Send a command and return its response and whether it is an error """
+        self.process.stdin.write(text + "\n")
+        self.process.stdin.flush()
+        lines = []
+        while True:
+            line = self.process.stdout.readline()
+            if line == "":
+                raise EOFError("engine exited after: " + text)
+            line = line.rstrip("\r\n")
+            if line == "":
+                if lines:
+                    break
+                continue
+            lines.append(line)
+        m = _RESPONSE.match(lines[0])
+        if m is None:
+            raise ValueError("not a GTP response to {}: {}".format(text, lines[0]))
+        lines[0] = lines[0][m.end():]
+        return "\n".join(lines).strip(), m.group(1) == "?"
+
+    def close(self) -> None:
+        try:
+            self.send("quit")
+        except (EOFError, ValueError, OSError):
+            pass
+        self.process.stdin.close()
+        self.process.wait()
+
+
+def run_chunk(argv: List[str], chunk: List[Tuple[List[str], List[Command]]]) -> List[Result]:
+    """ Run consecutive blocks on a new engine """
+    engine = Engine(argv)
+    results = []
+    try:
+        for command in chunk[0][0]:
+            engine.send(command)
+        for _, block in chunk:
+            for command in block:
+                start = time.time()
+                response, error = engine.send(command.text)
+                results.append(Result(command, response, error, time.time() - start))
+    finally:
+        engine.close()
+    return results
+
+
+def run_tests(paths: List[str], argv: List[str], workers: int, serial: bool = False) -> List[Result]:
+    """
+    Run the test files on workers engines at once, results in file order.
+    serial: run each file on one engine instead of splitting it in chunks
+    """
+    chunks = []
+    for path in paths:
+        blocks = split_blocks(read_tests(path))
+        size = len(blocks) if serial else max(1, -(-len(blocks) // (workers * CHUNKS_PER_WORKER)))
+        chunks += [blocks[i:i + size] for i in range(0, len(blocks), size)]
+    with ThreadPoolExecutor(workers) as pool:
+        parts = list(pool.map(lambda chunk: run_chunk(argv, chunk), chunks))
+    return [result for part in parts for result in part]
+
+
+def report(results: List[Result], out=sys.stdout) -> int:
+    """ Print the failures, the totals and the latencies; return the unexpected failures """
+    tests = [r for r in results if r.command.expected is not None]
+    unexpected = 0
+    for r in tests:
+        if r.passed and r.command.known_failure:
+            out.write("FIXED {}:{} {}\n".format(r.command.path, r.command.line, r.command.text))
+        elif not r.passed:
+            unexpected += not r.command.known_failure
+            out.write("{} {}:{} {}: expected [{}] got {}{}\n".format(
+                "FAIL" if not r.command.known_failure else "known failure",
+                r.command.path, r.command.line, r.command.text, r.command.expected,
+                "? " if r.error else "", r.response.replace("\n", " ")))
+    out.write("passed={}/{} unexpected_failures={}\n".format(
+        sum(r.passed for r in tests), len(tests), unexpected))
+    times: Dict[str, List[float]] = {}
+    for r in results:
+        times.setdefault(r.command.name, []).append(r.seconds)
+    for name in sorted(times):
+        ms = 1000 * np.array(times[name])
+        out.write("command={} count={} {}\n".format(name, len(ms), " ".join(
+            "p{}_ms={:.2f}".format(p, v) for p, v in zip(PERCENTILES, np.percentile(ms, PERCENTILES)))))
+    return unexpected
+
+
+def compare_serial(results: List[Result], serial: List[Result], out=sys.stdout) -> int:
+    """ Print the tests that pass in one run and fail in the other; return their number """
+    differ = 0
+    for r, s in zip(results, serial):
+        if r.command.expected is not None and r.passed != s.passed:
+            differ += 1
+            out.write("DIFFERS {}:{} {}: got {}{} serial got {}{}\n".format(
+                r.command.path, r.command.line, r.command.text,
+                "? " if r.error else "", r.response.replace("\n", " "),
+                "? " if s.error else "", s.response.replace("\n", " ")))
+    out.write("serial_differences={}\n".format(differ))
+    return differ
+
+
+def main(argv: List[str] = None) -> None:
+    engine = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Ninuki.py")
+    parser = argparse.ArgumentParser(description="Parallel GTP regression runner")
+    parser.add_argument("files", nargs="+", help="GTP test files")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="engine processes run at once")
+    parser.add_argument("--engine", default=None,
+                        help="command line of the engine, by default this Ninuki.py")
+    parser.add_argument("--check-serial", action="store_true",
+                        help="also run each file on one engine and compare the results")
+    args = parser.parse_args(argv)
+    command = shlex.split(args.engine) if args.engine else [sys.executable, engine]
+    start = time.time()
+    results = run_tests(args.files, command, max(1, args.workers))
+    unexpected = report(results)
+    print("workers={} seconds={:.2f}".format(args.workers, time.time() - start))
+    differ = 0
+    if args.check_serial:
+        differ = compare_serial(results, run_tests(args.files, command, max(1, args.workers), serial=True))
+    sys.exit(1 if unexpected or differ else 0)
+
+
+if __name__ == "__main__":
+    main()
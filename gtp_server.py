@@ -0,0 +1,344 @@
+"""
+gtp_server.py
+Many GTP sessions in one process, served over a local socket.
+
+Every client connection gets its own GtpConnection and GoBoard, so games
+are independent, but they share the Python interpreter, the imported
+modules and one pool of worker processes. Cheap commands (play, showboard,
+legal_moves, ...) run on the session's thread. genmove and solve are
+sent to the pool, so a few long searches cannot hold up the other
+sessions, and the number of searches running at once is bounded by the
+pool size.
+
+The position is sent to a worker as a small tuple, see board_state,
+together with the playout settings of the board, see
+shared_board.playout_settings, and a seed spawned from the engine-wide
+playout stream. With a game clock the session sets the limits of the
+move as in a local connection, GtpConnection.genmove_cmd, and sends a
+copy of its TimeManager with the task. The worker searches until the
+copy stops it: the limits are absolute times, and the wall clock is the
+same in every process, so the time the task waits in the pool is
+charged too. The session charges the clock when the move comes back.
+Searches in the pool run on one process each, so a session only
+accepts the serial search modes, POOL_SEARCH_MODES, answers workers
+with an error, and solve uses the serial Solver.
+analyze_interval is refused as well: the progress reports of a search
+go to stderr, and a client on the socket only has the GTP stream, so
+it would never see them. analysis_winrates still answers with the
+final statistics of the last genmove.
+
+With --prefork N the server runs as N forked processes instead, each
+serving one session at a time and searching in its own process. The
+parent imports every module and builds the geometry tables of all board
+sizes before it forks, so a connection is answered by a process that
+is already warm. The parent replaces children that exit.
+
+Usage:
+    python3 Ninuki.py --unix-socket /tmp/ninuki.sock --pool-workers 4
+    python3 Ninuki.py --port 5455
+    python3 Ninuki.py --unix-socket /tmp/ninuki.sock --prefork 8
+Then connect one client per game, for example
+    nc -U /tmp/ninuki.sock
+"""
+
+import io
+import os
+import signal
+import socket
+import socketserver
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from alphabeta import AlphaBetaPlayer
+from analysis import AnalysisReporter, RootStats
+from board import GoBoard
+from board_base import DEFAULT_SIZE, MAXSIZE, GO_POINT
+from engine import GoEngine
+from gtp_connection import GtpConnection, FlatMonteCarloPlayer
+from mcts import MCTSPlayer
+from playout_rng import PlayoutRNG, default_rng
+from puct import PUCTPlayer
+from shared_board import PlayoutSettings, apply_playout_settings, open_solved_db, playout_settings
+from solver import Solver
+from time_control import TimeManager
+from tss import GENMOVE_TIME_LIMIT, forced_win_move
+
+BoardState = Tuple[int, bytes, int, int, int, int, int]
+
+"""
+Search modes of a session with a pool. The parallel modes would start
+processes of their own in a pool worker, past the size of the pool.
+"""
+POOL_SEARCH_MODES: List[str] = ["flat", "mcts", "puct", "alphabeta"]
+
+
+def board_state(board: GoBoard) -> BoardState:
+    """ The position of board as a small picklable tuple, without history """
+    return (board.size, board.board.tobytes(), board.current_player,
+            board.black_captures, board.white_captures,
+            board.last_move, board.last2_move)
+
+
+def restore_board(state: BoardState) -> GoBoard:
+    """ A new GoBoard holding the position saved by board_state """
+    size, cells, current_player, black_captures, white_captures, last_move, last2_move = state
+    board = GoBoard(size)
+    board.board[:] = np.frombuffer(cells, dtype=board.board.dtype)
+    board.current_player = current_player
+    board.black_captures = black_captures
+    board.white_captures = white_captures
+    board.last_move = last_move
+    board.last2_move = last2_move
+    board.invalidate_status()
+    return board
+
+
+"""
+Players of a pool worker, one per (search, numSimulations),
+kept between tasks.
+"""
+_players: Dict[Tuple[str, int], object] = {}
+
+
+def _worker_player(search: str, numSimulations: int):
+    key = (search, numSimulations)
+    if key not in _players:
+        if search == "flat":
+            _players[key] = FlatMonteCarloPlayer(numSimulations)
+        elif search == "alphabeta":
+            _players[key] = AlphaBetaPlayer()
+        elif search == "puct":
+            _players[key] = PUCTPlayer(numSimulations)
+        elif search == "mcts":
+            _players[key] = MCTSPlayer(numSimulations)
+        else:
+            raise ValueError("search not available in the pool: " + search)
+    return _players[key]
+
+
+def _choose_move_task(state: BoardState, settings: PlayoutSettings, policy: str, search: str,
+                      numSimulations: int, seed, control: TimeManager) -> Tuple[GO_POINT, int, RootStats]:
+    """
+    Run in a pool worker: choose a move in the position state, with
+    the playout settings of the session.
+    control: the TimeManager of the session after start_move, None
+        without a game clock
+    Returns the move and the final root statistics of the search.
+    """
+    board = restore_board(state)
+    apply_playout_settings(board, settings)
+    board.rng = PlayoutRNG(seed)
+    if policy == "rule_based":
+        return _worker_player("flat", numSimulations).genmovePolicy(board), 0, {}
+    tss_time = GENMOVE_TIME_LIMIT if control is None else min(GENMOVE_TIME_LIMIT, control.soft)
+    move = forced_win_move(board, time_limit=tss_time, db=board.solved_db)
+    if move is not None:
+        return move, 0, {}
+    reporter = AnalysisReporter(str)
+    if search == "flat":
+        move = _worker_player("flat", numSimulations).genmoveRandom(board, reporter, control)
+    else:
+        move = _worker_player(search, numSimulations).genmove(board, reporter, control)
+    return move, reporter.playouts, reporter.stats
+
+
+def _solve_task(state: BoardState, time_limit: float, db_path: str) -> Tuple[int, GO_POINT]:
+    """
+    Run in a pool worker: the result of Solver.solve in the position
+    state, with the solved position database at db_path if not None.
+    """
+    board = restore_board(state)
+    db = open_solved_db(db_path) if db_path is not None else None
+    return Solver(time_limit, db).solve(board)
+
+
+class ServerGtpConnection(GtpConnection):
+    def __init__(self, go_engine: GoEngine, board: GoBoard, pool: ProcessPoolExecutor,
+                 infile, outfile) -> None:
+        """
+        A GTP session of the server. Moves are chosen and positions
+        solved in pool, or in this process if pool is None.
+        """
+        GtpConnection.__init__(self, go_engine, board, infile=infile, outfile=outfile)
+        self.pool: ProcessPoolExecutor = pool
+
+    def search_cmd(self, args: List[str]) -> None:
+        if self.pool is not None and args[0].lower() not in POOL_SEARCH_MODES:
+            self.error("search {} is not available in server sessions, use one of {}".format(
+                args[0], ",".join(POOL_SEARCH_MODES)))
+            return
+        GtpConnection.search_cmd(self, args)
+
+    def analyze_interval_cmd(self, args: List[str]) -> None:
+        try:
+            streaming = float(args[0]) > 0
+        except ValueError:
+            streaming = False # answered by GtpConnection.analyze_interval_cmd
+        if self.pool is not None and streaming:
+            self.error("analyze_interval is not available in server sessions, use analysis_winrates")
+            return
+        GtpConnection.analyze_interval_cmd(self, args)
+
+    def workers_cmd(self, args: List[str]) -> None:
+        if self.pool is not None:
+            self.error("workers is not available in server sessions, searches run on the server pool")
+            return
+        GtpConnection.workers_cmd(self, args)
+
+    def choose_move(self) -> GO_POINT:
+        if self.pool is None:
+            return GtpConnection.choose_move(self)
+        self.analysis.start()
+        seed = default_rng().spawn_seeds(1)[0]
+        control = self.time_manager if self.time_manager.active else None
+        future = self.pool.submit(_choose_move_task, board_state(self.board),
+                                  playout_settings(self.board), self.policy,
+                                  self.search, self.player.numSimulations, seed, control)
+        move, playouts, stats = future.result()
+        self.analysis.finish(playouts, stats)
+        return move
+
+    def solve_position(self) -> Tuple[int, GO_POINT]:
+        if self.pool is None:
+            return GtpConnection.solve_position(self)
+        db = self.board.solved_db
+        future = self.pool.submit(_solve_task, board_state(self.board), self.timelimit,
+                                  db.path if db is not None else None)
+        return future.result()
+
+
+class GtpSessionHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        infile = io.TextIOWrapper(self.rfile, encoding="utf-8", newline=None)
+        outfile = io.TextIOWrapper(self.wfile, encoding="utf-8", write_through=True)
+        con = ServerGtpConnection(self.server.engine_factory(), GoBoard(DEFAULT_SIZE),
+                                  self.server.pool, infile, outfile)
+        try:
+            con.start_connection()
+        except SystemExit:
+            pass
+        finally:
+            try:
+                outfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+
+class _ServerMixin(object):
+    daemon_threads = True
+
+    def setup_server(self, engine_factory: Callable[[], GoEngine], pool_workers: int,
+                     use_pool: bool = True) -> None:
+        self.engine_factory: Callable[[], GoEngine] = engine_factory
+        self.pool: ProcessPoolExecutor = None
+        if use_pool:
+            self.pool = ProcessPoolExecutor(max_workers=pool_workers)
+
+    def server_close(self) -> None:
+        super().server_close()
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+        if self.address_family == socket.AF_UNIX and os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+class UnixGtpServer(_ServerMixin, socketserver.ThreadingUnixStreamServer):
+    pass
+
+
+class TcpGtpServer(_ServerMixin, socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+
+
+class PreforkUnixGtpServer(_ServerMixin, socketserver.UnixStreamServer):
+    pass
+
+
+class PreforkTcpGtpServer(_ServerMixin, socketserver.TCPServer):
+    allow_reuse_address = True
+
+
+def make_server(engine_factory: Callable[[], GoEngine], unix_socket: str = None,
+                port: int = None, pool_workers: int = None, prefork: bool = False):
+    """
+    Create a server on the Unix socket path unix_socket, or on
+    localhost:port. pool_workers is the number of search processes,
+    the number of CPUs by default.
+    A prefork server handles one session at a time and has no pool.
+    """
+    if unix_socket is not None:
+        if os.path.exists(unix_socket):
+            os.unlink(unix_socket)
+        server_class = PreforkUnixGtpServer if prefork else UnixGtpServer
+        server = server_class(unix_socket, GtpSessionHandler)
+    else:
+        server_class = PreforkTcpGtpServer if prefork else TcpGtpServer
+        server = server_class(("127.0.0.1", port), GtpSessionHandler)
+    server.setup_server(engine_factory, pool_workers, use_pool=not prefork)
+    return server
+
+
+def warm_up() -> None:
+    """
+    Do the work a fresh engine would do on its first commands:
+    import the search modules and build the geometry tables of every
+    board size.
+    """
+    import alphabeta
+    import mcts
+    import parallel_search
+    import sgf
+    for size in range(5, MAXSIZE + 1):
+        GoBoard(size)
+
+
+def _fork_child(server) -> int:
+    pid = os.fork()
+    if pid == 0:
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        try:
+            server.serve_forever()
+        finally:
+            os._exit(0)
+    return pid
+
+
+def prefork_serve(engine_factory: Callable[[], GoEngine], unix_socket: str = None,
+                  port: int = None, children: int = 1) -> None:
+    """
+    Warm up, then serve GTP sessions from children forked processes
+    that share the listening socket, until interrupted.
+    """
+    warm_up()
+    server = make_server(engine_factory, unix_socket, port, prefork=True)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    pids = set(_fork_child(server) for _ in range(children))
+    try:
+        while True:
+            pid, _ = os.wait()
+            pids.discard(pid)
+            pids.add(_fork_child(server))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        server.server_close()
+
+
+def serve(engine_factory: Callable[[], GoEngine], unix_socket: str = None,
+          port: int = None, pool_workers: int = None) -> None:
+    """ Serve GTP sessions until interrupted """
+    server = make_server(engine_factory, unix_socket, port, pool_workers)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
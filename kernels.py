@@ -0,0 +1,164 @@
+"""
+kernels.py
+Board kernels generated for one board size.
+
+The hot board checks walk the 8 neighbor offsets, or the lines through a
+point, of the padded 1D board. The offsets only depend on NS = size + 1,
+so for each size the functions below are written out as Python source
+with the offsets as constants and the direction loops unrolled, and
+compiled once with exec:
+
+    captures(cells, point, color, opp)
+        points of the pairs color captures by playing on point
+    count_captures(cells, point, color, opp)
+        number of those pairs
+    five_through(cells, point, color)
+        a stone of color on point is part of five in a row
+
+cells is a list copy of the board, or the board array itself (play_move).
+five_in_a_row and open_four look at all lines of the board at once: the
+cells of all lines of 5 or more points, each followed by a BORDER cell,
+are gathered into one bytes object, and the patterns are found with
+bytes.find.
+
+kernels_for(size) compiles the kernels of a size on first use and keeps
+them, like the line lists of GoBoard.calculate_rows_cols_diags.
+The generated source is kept in BoardKernels.source for inspection.
+"""
+
+from operator import itemgetter
+from typing import Callable, Dict, List
+
+from board_base import BLACK, WHITE, EMPTY, GO_COLOR, board_array_size, coord_to_point
+
+
+def _offsets(NS: int) -> List[int]:
+    """ The 8 neighbor offsets, in the order of GoBoard.play_move """
+    return [1, -1, NS, -NS, NS + 1, -(NS + 1), NS - 1, -NS + 1]
+
+
+def _at(k: int) -> str:
+    """ Source of the cell k points away from point """
+    return "cells[point {} {}]".format("+" if k >= 0 else "-", abs(k))
+
+
+def _captures_source(NS: int) -> List[str]:
+    lines = ["def captures(cells, point, color, opp):",
+             "    caps = []"]
+    for d in _offsets(NS):
+        lines += ["    if {} == opp and {} == opp and {} == color:".format(_at(d), _at(2 * d), _at(3 * d)),
+                  "        caps += (point {0} {1}, point {0} {2})".format(
+                      "+" if d > 0 else "-", abs(d), abs(2 * d))]
+    lines.append("    return caps")
+    return lines
+
+
+def _count_captures_source(NS: int) -> List[str]:
+    lines = ["def count_captures(cells, point, color, opp):",
+             "    pairs = 0"]
+    for d in _offsets(NS):
+        lines += ["    if {} == opp and {} == opp and {} == color:".format(_at(d), _at(2 * d), _at(3 * d)),
+                  "        pairs += 1"]
+    lines.append("    return pairs")
+    return lines
+
+
+def _five_through_source(NS: int) -> List[str]:
+    """
+    For each line direction d, count the stones of color at 1..4 steps
+    in the +d direction, then at 1..4 steps in the -d direction, as
+    nested ifs, and stop as soon as five are found.
+    """
+    lines = ["def five_through(cells, point, color):"]
+    for d in [1, NS, NS + 1, NS - 1]:
+        lines.append("    n = 1")
+        for k in range(1, 5):
+            indent = "    " * k
+            lines.append("{}if {} == color:".format(indent, _at(k * d)))
+            lines.append("{}    n += 1".format(indent) if k < 4 else "{}    return True".format(indent))
+        for k in range(1, 5):
+            indent = "    " * k
+            lines += ["{}if {} == color:".format(indent, _at(-k * d)),
+                      "{}    n += 1".format(indent),
+                      "{}    if n >= 5:".format(indent),
+                      "{}        return True".format(indent)]
+    lines.append("    return False")
+    return lines
+
+
+def generate_source(size: int) -> str:
+    """ The source of the generated kernels for boards of the given size """
+    NS = size + 1
+    lines = ['"""', "Generated by kernels.py for size {}, NS = {}".format(size, NS), '"""', ""]
+    for part in [_captures_source, _count_captures_source, _five_through_source]:
+        lines += part(NS) + [""]
+    return "\n".join(lines)
+
+
+def line_points(size: int) -> List[int]:
+    """
+    The points of all lines of 5 or more points in the 4 directions,
+    each line followed by the point 0, which is BORDER.
+    """
+    NS = size + 1
+    on_board = [False] * board_array_size(size)
+    for row in range(1, size + 1):
+        for col in range(1, size + 1):
+            on_board[coord_to_point(row, col, size)] = True
+    points = []
+    for d in [1, NS, NS + 1, NS - 1]:
+        for start in range(len(on_board)):
+            if not on_board[start] or on_board[start - d]:
+                continue
+            line = []
+            p = start
+            while 0 <= p < len(on_board) and on_board[p]:
+                line.append(p)
+                p += d
+            if len(line) >= 5:
+                points += line + [0]
+    return points
+
+
+class BoardKernels(object):
+    def __init__(self, size: int) -> None:
+        """ Generate and compile the kernels for boards of the given size """
+        self.size: int = size
+        self.source: str = generate_source(size)
+        namespace: Dict = {}
+        exec(compile(self.source, "<kernels size {}>".format(size), "exec"), namespace)
+        self.captures: Callable = namespace["captures"]
+        self.count_captures: Callable = namespace["count_captures"]
+        self.five_through: Callable = namespace["five_through"]
+        points = line_points(size)
+        self._lines: Callable = itemgetter(*points) if points else (lambda cells: ())
+        self._fives: List = [(BLACK, bytes([BLACK] * 5)), (WHITE, bytes([WHITE] * 5))]
+        self._open_fours: List[bytes] = [None] + [bytes([EMPTY] + [color] * 4 + [EMPTY])
+                                                  for color in [BLACK, WHITE]]
+
+    def lines(self, cells: List[GO_COLOR]) -> bytes:
+        """ The cells of all lines, each followed by a BORDER cell """
+        return bytes(self._lines(cells))
+
+    def five_in_a_row(self, cells: List[GO_COLOR]) -> GO_COLOR:
+        """ The color with five in a row anywhere on the board, or EMPTY """
+        lines = self.lines(cells)
+        for color, five in self._fives:
+            if five in lines:
+                return color
+        return EMPTY
+
+    def open_four(self, cells: List[GO_COLOR], color: GO_COLOR) -> bool:
+        """ color has four in a row with an empty point at both ends """
+        return self._open_fours[color] in self.lines(cells)
+
+
+_kernel_cache: Dict[int, BoardKernels] = {}
+
+
+def kernels_for(size: int) -> BoardKernels:
+    """ The kernels for boards of the given size, generated on first use """
+    kernels = _kernel_cache.get(size)
+    if kernels is None:
+        kernels = _kernel_cache[size] = BoardKernels(size)
+    return kernels
@@ -0,0 +1,256 @@
+"""
+mcts.py
+Monte Carlo tree search for Ninuki.
+
+Selection uses UCT with the node values blended with AMAF statistics
+as in rave.py. Leaves are evaluated with the random playouts of
+GoBoard.simulate_unlogged. The search plays and undoes moves on the given
+board, which is back in its original state when the search returns.
+
+The tree is kept in a NodePool. An MCTS object keeps its tree from one
+search to the next: when the next position follows from the previous
+root, the search starts from the subtree that was already built for it.
+"""
+
+import numpy as np
+from typing import Dict, List, Tuple
+
+from analysis import AnalysisReporter
+from board import GoBoard
+from board_base import BLACK, WHITE, EMPTY, GO_COLOR, GO_POINT, opponent
+from node_pool import MAX_TREE_BYTES, NO_NODE, NodePool
+from rave import blend
+from time_control import TimeManager
+
+EXPLORATION: float = 0.4
+
+"""
+Map the strings returned by GoBoard.get_final_result to the winner
+encoding returned by GoBoard.simulate.
+"""
+RESULT_WINNER: Dict[str, GO_COLOR] = {"black": BLACK, "white": WHITE, "draw": EMPTY}
+
+
+def result_value(winner: GO_COLOR, color: GO_COLOR) -> float:
+    """ Value of a playout result for color: 1 win, 0.5 draw, 0 loss """
+    if winner == color:
+        return 1.0
+    if winner == EMPTY:
+        return 0.5
+    return 0.0
+
+
+def first_moves_after(changes: List, depth: int) -> List[Dict[GO_POINT, GO_COLOR]]:
+    """
+    For each depth 0..depth, a dict mapping every point played in
+    changes[d:] to the color that played it first.
+    This is the set of moves an AMAF update credits at that depth.
+    """
+    firsts: List[Dict[GO_POINT, GO_COLOR]] = [None] * (depth + 1)
+    current: Dict[GO_POINT, GO_COLOR] = {}
+    for d in range(len(changes) - 1, -1, -1):
+        color, point = changes[d][0], changes[d][1]
+        current[point] = color
+        if d <= depth:
+            firsts[d] = dict(current)
+    for d in range(min(depth, len(changes) - 1) + 1, depth + 1):
+        firsts[d] = {}
+    return firsts
+
+
+def uct_value(wins: float, visits: float, amaf_wins: float, amaf_visits: float,
+              parent_visits: float, exploration: float, use_rave: bool) -> float:
+    """
+    UCT value of a child, with the mean value blended with its AMAF value.
+    A child with no statistics at all is tried first.
+    """
+    if visits == 0 and (not use_rave or amaf_visits == 0):
+        return float("inf")
+    value = wins / visits if visits > 0 else 0.5
+    if use_rave and amaf_visits > 0:
+        value = blend(value, visits, amaf_wins / amaf_visits, amaf_visits)
+    return value + exploration * np.sqrt(np.log(parent_visits + 1) / (visits + 1))
+
+
+class MCTS(object):
+    def __init__(self, exploration: float = EXPLORATION, use_rave: bool = True,
+                 max_bytes: int = MAX_TREE_BYTES) -> None:
+        """
+        max_bytes: memory limit of the tree, see NodePool
+        """
+        self.exploration: float = exploration
+        self.use_rave: bool = use_rave
+        self.pool: NodePool = NodePool(max_bytes=max_bytes)
+        self.root_board: GoBoard = None # position of node 0
+        self.root_moves: int = 0 # length of its change stack
+        self.playouts: int = 0
+
+    def search(self, board: GoBoard, num_playouts: int,
+               reporter: AnalysisReporter = None, control: TimeManager = None) -> GO_POINT:
+        """
+        Run num_playouts playouts from the current position of board
+        and return the most visited move.
+        If the position follows the one of the previous search, the subtree
+        below it is kept and the rest of the tree is freed.
+        reporter: receives the root statistics while searching
+        control: stops the search early when control.should_stop.
+            num_playouts can then be None for no playout limit.
+        The number of playouts run is kept in self.playouts.
+        """
+        self.set_root(board)
+        self.playouts = 0
+        while num_playouts is None or self.playouts < num_playouts:
+            self.playout(board)
+            self.playouts += 1
+            if reporter is not None:
+                reporter.update(self.playouts, self.root_stats)
+            if control is not None and control.should_stop(self.playouts, self.root_stats):
+                break
+        return self.best_move()
+
+    def set_root(self, board: GoBoard) -> None:
+        """ Make node 0 the current position of board """
+        node = self.find_position(board)
+        if node == NO_NODE:
+            self.pool.clear(opponent(board.current_player))
+        else:
+            self.pool.collect(node)
+        self.root_board = board.copy()
+        self.root_board.black_captures = board.black_captures
+        self.root_board.white_captures = board.white_captures
+        self.root_moves = len(board.change_stack)
+
+    def find_position(self, board: GoBoard) -> int:
+        """
+        The node of the current position of board, found by playing the
+        moves made since the previous search from its root.
+        NO_NODE if the position is not in the tree.
+        """
+        if self.root_board is None or self.root_board.size != board.size \
+                or len(board.change_stack) < self.root_moves:
+            return NO_NODE
+        pool = self.pool
+        replay = self.root_board
+        node = 0
+        for change in board.change_stack[self.root_moves:]:
+            color, point = change[0], change[1]
+            node = pool.child_with_move(node, point)
+            if node == NO_NODE or pool.color[node] != color \
+                    or not replay.play_move(point, color):
+                return NO_NODE
+        if replay.current_player != board.current_player \
+                or replay.black_captures != board.black_captures \
+                or replay.white_captures != board.white_captures \
+                or not np.array_equal(replay.board, board.board):
+            return NO_NODE
+        return node
+
+    def playout(self, board: GoBoard) -> None:
+        pool = self.pool
+        moveNr = board.moveNumber()
+        node = 0
+        path = [node]
+        while pool.num_children[node] > 0:
+            node = self.select_child(node)
+            board.play_move(int(pool.move[node]), board.current_player)
+            path.append(node)
+        result = board.get_final_result()
+        moves = []
+        if result == "unknown":
+            self.expand(node, board)
+            winner = board.simulate_unlogged(moves=moves if self.use_rave else None)
+        else:
+            winner = RESULT_WINNER[result]
+        self.update(path, winner, board.change_stack[moveNr + 1:] + moves)
+        board.resetToMoveNumber(moveNr)
+
+    def expand(self, node: int, board: GoBoard) -> None:
+        """ Add the children of the leaf node, whose position is on board """
+        self.pool.expand(node, board.get_empty_points(), board.current_player)
+
+    def select_child(self, node: int) -> int:
+        pool = self.pool
+        block = pool.children(node)
+        parent_visits = float(pool.visits[node])
+        best = block.start
+        best_value = -1.0
+        for i, (wins, visits, amaf_wins, amaf_visits) in enumerate(zip(
+                pool.wins[block].tolist(), pool.visits[block].tolist(),
+                pool.amaf_wins[block].tolist(), pool.amaf_visits[block].tolist())):
+            value = uct_value(wins, visits, amaf_wins, amaf_visits,
+                              parent_visits, self.exploration, self.use_rave)
+            if value > best_value:
+                best, best_value = block.start + i, value
+        return best
+
+    def update(self, path: List[int], winner: GO_COLOR, changes: List) -> None:
+        """
+        Back up the playout result along path.
+        changes are the change_stack entries of all moves played from the root.
+        """
+        pool = self.pool
+        for node in path:
+            pool.visits[node] += 1
+            pool.wins[node] += result_value(winner, pool.color[node])
+        if not self.use_rave:
+            return
+        firsts = first_moves_after(changes, len(path) - 1)
+        for depth, node in enumerate(path):
+            block = pool.children(node)
+            if block.start == block.stop:
+                continue
+            played = firsts[depth]
+            color = int(pool.color[block.start]) # all children are moves of one player
+            hits = [block.start + i for i, move in enumerate(pool.move[block].tolist())
+                    if played.get(move) == color]
+            if hits:
+                pool.amaf_visits[hits] += 1
+                pool.amaf_wins[hits] += result_value(winner, color)
+
+    def root_stats(self) -> Dict[GO_POINT, Tuple[int, float]]:
+        """ Map each root move to its (visits, wins) """
+        return self.pool.stats(0)
+
+    def best_move(self) -> GO_POINT:
+        return best_move_from_stats(self.root_stats())
+
+
+def best_move_from_stats(stats: Dict[GO_POINT, Tuple[int, float]]) -> GO_POINT:
+    """ The most visited move, ties broken by the number of wins """
+    return max(stats.keys(), key=lambda move: stats[move])
+
+
+class MCTSPlayer(object):
+    def __init__(self, numSimulations: int) -> None:
+        """
+        numSimulations: playouts per legal move, as in FlatMonteCarloPlayer,
+        so both players use the same budget.
+        """
+        self.numSimulations = numSimulations
+        self.search = MCTS()
+
+    def name(self):
+        return "MCTS Player ({0} sim.)".format(self.numSimulations)
+
+    def genmove(self, state: GoBoard, reporter: AnalysisReporter = None,
+                control: TimeManager = None) -> GO_POINT:
+        """
+        Without control, search numSimulations playouts per legal move.
+        With a time manager, search until it stops the search.
+        """
+        assert not state.end_of_game()
+        winning = state.winning_moves(state.current_player)
+        if winning:
+            return winning[0]
+        num_playouts = None
+        if control is None:
+            num_playouts = self.numSimulations * len(state.get_empty_points())
+        move = self.search.search(state, num_playouts, reporter, control)
+        if reporter is not None:
+            reporter.finish(self.search.playouts, self.search.root_stats())
+        if control is not None and self.search.playouts < len(state.get_empty_points()):
+            # stopped before it could compare the moves
+            fallback = control.fallback_move(state.get_rng())
+            if fallback is not None:
+                return fallback
+        return move
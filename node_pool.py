@@ -0,0 +1,170 @@
+"""
+node_pool.py
+Search tree nodes stored in preallocated arrays.
+
+A NodePool keeps one numpy array per node field, indexed by node number,
+instead of one Python object per node:
+
+    move, color         the move leading to the node and the player who made it
+    parent              the parent node, NO_NODE for the root
+    first_child         the first child, NO_NODE while not expanded
+    num_children
+    visits, wins        wins are counted for color
+    amaf_visits, amaf_wins
+
+Node 0 is always the root. The children of a node are allocated together
+as the block first_child .. first_child + num_children - 1, so the next
+sibling of a child is the next node and a selection step reads all
+children with one slice. Nodes are allocated at the end of the used part
+of the arrays, so a child always has a higher number than its parent.
+
+The arrays are allocated once, with a capacity derived from a memory
+limit. When the pool is full, expand fails and the search evaluates the
+leaf without growing the tree. Between searches, collect keeps only the
+subtree of the new root and moves it to the front of the arrays.
+"""
+
+import numpy as np
+from typing import Dict, List, Tuple
+
+from board_base import EMPTY, NO_POINT, GO_COLOR, GO_POINT
+
+NO_NODE: int = -1
+
+"""
+Default memory limit of a pool, in bytes.
+"""
+MAX_TREE_BYTES: int = 256 << 20
+
+NODE_FIELDS: List[Tuple[str, str]] = [
+    ("move", "i4"),
+    ("color", "i1"),
+    ("parent", "i4"),
+    ("first_child", "i4"),
+    ("num_children", "i4"),
+    ("visits", "f8"),
+    ("wins", "f8"),
+    ("amaf_visits", "f8"),
+    ("amaf_wins", "f8"),
+]
+
+
+def node_bytes(fields: List[Tuple[str, str]]) -> int:
+    """ Bytes used by one node with the given fields """
+    return sum(np.dtype(dtype).itemsize for _, dtype in fields)
+
+
+class NodePool(object):
+    FIELDS: List[Tuple[str, str]] = NODE_FIELDS
+
+    def __init__(self, capacity: int = None, max_bytes: int = MAX_TREE_BYTES) -> None:
+        """
+        capacity: maximum number of nodes. By default as many as fit
+        in max_bytes.
+        """
+        if capacity is None:
+            capacity = max_bytes // node_bytes(self.FIELDS)
+        assert capacity >= 1
+        self.capacity: int = capacity
+        self._size: int = 0
+        self._allocate()
+        self.clear()
+
+    def _allocate(self) -> None:
+        for name, dtype in self.FIELDS:
+            setattr(self, name, np.zeros(self.capacity, dtype=dtype))
+
+    @property
+    def size(self) -> int:
+        """ Number of nodes in use """
+        return self._size
+
+    @size.setter
+    def size(self, value: int) -> None:
+        self._size = value
+
+    def _init_nodes(self, start: int, end: int) -> None:
+        for name, _ in self.FIELDS:
+            getattr(self, name)[start:end] = 0
+        self.first_child[start:end] = NO_NODE
+
+    def clear(self, color: GO_COLOR = EMPTY) -> None:
+        """ Free all nodes but a new root, reached by a move of color """
+        self.size = 1
+        self._init_nodes(0, 1)
+        self.move[0] = NO_POINT
+        self.color[0] = color
+        self.parent[0] = NO_NODE
+
+    def expand(self, node: int, moves: np.ndarray, color: GO_COLOR) -> bool:
+        """
+        Add a child of node for each of moves, played by color.
+        Returns False if the pool is full.
+        """
+        if self.first_child[node] != NO_NODE:
+            return True
+        start = self.size
+        end = start + len(moves)
+        if end > self.capacity:
+            return False
+        self.size = end
+        self._init_nodes(start, end)
+        self.move[start:end] = moves
+        self.color[start:end] = color
+        self.parent[start:end] = node
+        self.num_children[node] = len(moves)
+        self.first_child[node] = start
+        return True
+
+    def children(self, node: int) -> slice:
+        """ The block of the children of node """
+        first = int(self.first_child[node])
+        if first == NO_NODE:
+            return slice(0, 0)
+        return slice(first, first + int(self.num_children[node]))
+
+    def child_with_move(self, node: int, move: GO_POINT) -> int:
+        """ The child of node reached by move, NO_NODE if there is none """
+        block = self.children(node)
+        found = np.flatnonzero(self.move[block] == move)
+        if len(found) == 0:
+            return NO_NODE
+        return block.start + int(found[0])
+
+    def stats(self, node: int) -> Dict[GO_POINT, Tuple[int, float]]:
+        """ Map the move of each child of node to its (visits, wins) """
+        block = self.children(node)
+        return {move: (int(visits), wins) for move, visits, wins in zip(
+            self.move[block].tolist(), self.visits[block].tolist(), self.wins[block].tolist())}
+
+    def collect(self, root: int) -> int:
+        """
+        Free every node that is not in the subtree of root, and renumber
+        the rest so that root becomes node 0, keeping their order.
+        Returns the number of nodes kept.
+        """
+        if root == 0:
+            return self.size
+        n = self.size
+        parent = self.parent[:n]
+        live = np.zeros(n, dtype=bool)
+        live[root] = True
+        # a parent always has a lower number than its children, so only the
+        # nodes after root can be in its subtree. Each pass adds one level.
+        parents = parent[root + 1:]
+        while True:
+            added = live[parents] & ~live[root + 1:]
+            if not added.any():
+                break
+            live[root + 1:] |= added
+        new_number = np.cumsum(live) - 1
+        kept = int(new_number[-1]) + 1
+        for name, _ in self.FIELDS:
+            array = getattr(self, name)
+            array[:kept] = array[:n][live]
+        self.parent[0] = NO_NODE
+        self.parent[1:kept] = new_number[self.parent[1:kept]]
+        expanded = self.first_child[:kept] != NO_NODE
+        self.first_child[:kept][expanded] = new_number[self.first_child[:kept][expanded]]
+        self.size = kept
+        return kept
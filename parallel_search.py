@@ -0,0 +1,440 @@
+"""
+parallel_search.py
+Parallel Monte Carlo tree search on several processes.
+
+Two variants:
+- root parallelism: every worker of a persistent pool builds its own MCTS
+  tree from the position. The root statistics of all trees are summed when
+  the move is chosen.
+- tree parallelism: all workers search one tree stored in shared memory.
+  A worker adds a virtual loss to every node it walks through, so that
+  the other workers are pushed to different branches until its playout
+  has been backed up.
+  Statistics are updated without a lock. Two workers may rarely overwrite
+  each other's update of the same node, which only costs a playout.
+  Only the expansion of a node is done under a lock.
+Workers read the root position from a SharedBoardState, see shared_board.py.
+
+With a game clock, every worker gets a copy of the TimeManager of the
+move and searches until its should_stop, instead of a share of the
+playouts. The clock is the same wall clock in every process.
+"""
+
+import atexit
+import multiprocessing as mp
+import numpy as np
+import os
+import time
+from multiprocessing.sharedctypes import RawArray, RawValue
+from typing import Callable, Dict, List, Tuple
+
+from analysis import AnalysisReporter
+from board import GoBoard
+from board_base import (
+    DEFAULT_SIZE,
+    EMPTY,
+    MAXSIZE,
+    NO_POINT,
+    GO_COLOR,
+    GO_POINT,
+    board_array_size,
+    opponent,
+    where1d,
+)
+from mcts import (
+    EXPLORATION,
+    MCTS,
+    RESULT_WINNER,
+    best_move_from_stats,
+    first_moves_after,
+    result_value,
+    uct_value,
+)
+from node_pool import NODE_FIELDS, NodePool
+from playout_rng import PlayoutRNG, default_rng
+from shared_board import PlayoutSettings, SharedBoardState, apply_playout_settings, playout_settings
+from time_control import TimeManager
+
+ROOT_PARALLEL = "root_parallel"
+TREE_PARALLEL = "tree_parallel"
+PARALLEL_MODES = [ROOT_PARALLEL, TREE_PARALLEL]
+
+"""
+Variant used for each board size by the "auto" mode.
+Fill in from the speedups reported by
+    python3 benchmark.py parallel --size N --workers W
+on the tournament host. Small boards default to root parallelism,
+since their short playouts make the shared tree the bottleneck.
+"""
+PREFERRED_MODE: Dict[int, str] = {5: ROOT_PARALLEL, 6: ROOT_PARALLEL, 7: ROOT_PARALLEL}
+DEFAULT_PREFERRED_MODE: str = TREE_PARALLEL
+
+"""
+Upper limit on the number of nodes of a shared tree.
+"""
+MAX_SHARED_NODES: int = 1 << 20
+
+"""
+Points per slot of the live statistics array, enough for any board size.
+"""
+BOARD_POINTS: int = board_array_size(MAXSIZE)
+
+
+def preferred_mode(size: int) -> str:
+    return PREFERRED_MODE.get(size, DEFAULT_PREFERRED_MODE)
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 1
+
+
+def _split(total: int, parts: int) -> List[int]:
+    """ Split total into parts nearly equal non-negative integers, None into parts None """
+    if total is None:
+        return [None] * parts
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+
+def _worker_seeds(workers: int) -> List[np.random.SeedSequence]:
+    """
+    Independent seeds derived from the engine stream, so that workers
+    do not play the same playouts and a search is repeatable for a given seed.
+    """
+    return default_rng().spawn_seeds(workers)
+
+
+"""
+==========================================================================
+Root parallelism
+==========================================================================
+"""
+"""
+State of a pool worker: the shared root position, the private
+board the worker searches on, and the array the workers publish
+their live root statistics in.
+"""
+_worker_state: SharedBoardState = None
+_worker_board: GoBoard = None
+_worker_live = None
+
+
+def _init_root_worker(state_name: str, live) -> None:
+    global _worker_state, _worker_board, _worker_live
+    _worker_state = SharedBoardState(state_name)
+    _worker_board = GoBoard(DEFAULT_SIZE)
+    _worker_live = np.ctypeslib.as_array(live)
+
+
+class _LiveStatsWriter(object):
+    def __init__(self, slot: int, interval: float) -> None:
+        """
+        Copies the root statistics of a worker's search into its slot
+        of the live array every interval seconds, for the parent to report.
+        A slot holds visits for all points followed by wins for all points.
+        """
+        self.slot: np.ndarray = _worker_live[slot * 2 * BOARD_POINTS:(slot + 1) * 2 * BOARD_POINTS]
+        self.interval: float = interval
+        self.last: float = time.time()
+
+    def update(self, playouts: int, stats_fn: Callable[[], Dict[GO_POINT, Tuple[int, float]]]) -> None:
+        now = time.time()
+        if now - self.last < self.interval:
+            return
+        self.last = now
+        for move, (visits, wins) in stats_fn().items():
+            self.slot[move] = visits
+            self.slot[BOARD_POINTS + move] = wins
+
+
+def _root_parallel_worker(task: Tuple[int, PlayoutSettings, int, np.random.SeedSequence, int, float,
+                                      TimeManager]) -> Dict[GO_POINT, Tuple[int, float]]:
+    version, settings, num_playouts, seed, slot, interval, control = task
+    _worker_state.sync(_worker_board)
+    assert _worker_state.local_version == version
+    apply_playout_settings(_worker_board, settings)
+    _worker_board.rng = PlayoutRNG(seed)
+    writer = _LiveStatsWriter(slot, interval) if interval > 0 else None
+    search = MCTS()
+    search.search(_worker_board, num_playouts, writer, control)
+    return search.root_stats()
+
+
+def merge_root_stats(all_stats: List[Dict[GO_POINT, Tuple[int, float]]]) -> Dict[GO_POINT, Tuple[int, float]]:
+    """ Sum the (visits, wins) of each root move over all trees """
+    merged: Dict[GO_POINT, Tuple[int, float]] = {}
+    for stats in all_stats:
+        for move, (visits, wins) in stats.items():
+            old_visits, old_wins = merged.get(move, (0, 0.0))
+            merged[move] = (old_visits + visits, old_wins + wins)
+    return merged
+
+
+class RootParallelPool(object):
+    def __init__(self, workers: int) -> None:
+        """
+        A pool of workers processes that stays alive between searches.
+        The root position is sent through a SharedBoardState, the tasks
+        only carry its version number and the playout settings.
+        """
+        self.workers: int = workers
+        self.state: SharedBoardState = SharedBoardState()
+        self._live_raw = RawArray("d", workers * 2 * BOARD_POINTS)
+        self.live: np.ndarray = np.ctypeslib.as_array(self._live_raw)
+        self.pool = mp.Pool(workers, initializer=_init_root_worker,
+                            initargs=(self.state.name, self._live_raw))
+        atexit.register(self.close)
+
+    def search(self, board: GoBoard, num_playouts: int, reporter: AnalysisReporter = None,
+               control: TimeManager = None) -> Dict[GO_POINT, Tuple[int, float]]:
+        """
+        Search with independent trees on all workers.
+        Returns the merged root statistics.
+        reporter: receives the merged statistics of all workers while searching
+        control: stops each worker when its copy says so,
+            num_playouts can then be None
+        """
+        version = self.state.publish(board)
+        interval = reporter.interval / 2 if reporter is not None else 0.0
+        settings = playout_settings(board)
+        tasks = [(version, settings, n, seed, slot, interval, control) for slot, (n, seed) in
+                 enumerate(zip(_split(num_playouts, self.workers), _worker_seeds(self.workers)))]
+        if interval <= 0:
+            return merge_root_stats(self.pool.map(_root_parallel_worker, tasks))
+        self.live[:] = 0
+        result = self.pool.map_async(_root_parallel_worker, tasks)
+        while not result.ready():
+            result.wait(reporter.interval)
+            stats = self.live_stats()
+            reporter.update(sum(visits for visits, _ in stats.values()), lambda: stats)
+        return merge_root_stats(result.get())
+
+    def live_stats(self) -> Dict[GO_POINT, Tuple[int, float]]:
+        """ The root statistics last published by the workers, merged """
+        slots = self.live.reshape(self.workers, 2, BOARD_POINTS).sum(axis=0)
+        return {int(move): (int(slots[0, move]), float(slots[1, move]))
+                for move in where1d(slots[0] > 0)}
+
+    def close(self) -> None:
+        if self.pool is None:
+            return
+        self.pool.terminate()
+        self.pool.join()
+        self.pool = None
+        self.state.close()
+        atexit.unregister(self.close)
+
+
+def root_parallel_search(board: GoBoard, num_playouts: int, workers: int) -> Dict[GO_POINT, Tuple[int, float]]:
+    """
+    Search with independent trees on a new pool of workers processes.
+    Returns the merged root statistics.
+    """
+    pool = RootParallelPool(workers)
+    try:
+        return pool.search(board, num_playouts)
+    finally:
+        pool.close()
+
+
+"""
+==========================================================================
+Tree parallelism
+==========================================================================
+"""
+class SharedTree(NodePool):
+    FIELDS: List[Tuple[str, str]] = NODE_FIELDS + [("virtual_loss", "i4")]
+
+    def __init__(self, capacity: int) -> None:
+        """
+        A NodePool in shared memory, with a virtual loss count per node.
+        The arrays are RawArrays, so the tree can be passed to worker
+        processes, and the number of used nodes is shared too.
+        """
+        self._size_value = RawValue("i", 0)
+        self._lock = mp.Lock()
+        NodePool.__init__(self, capacity)
+
+    def _allocate(self) -> None:
+        self._raw = {name: RawArray(np.ctypeslib.as_ctypes_type(np.dtype(dtype)), self.capacity)
+                     for name, dtype in self.FIELDS}
+        self._bind()
+
+    def _bind(self) -> None:
+        """ Create the numpy views of the shared arrays """
+        for name, raw in self._raw.items():
+            setattr(self, name, np.ctypeslib.as_array(raw))
+
+    @property
+    def size(self) -> int:
+        return self._size_value.value
+
+    @size.setter
+    def size(self, value: int) -> None:
+        self._size_value.value = value
+
+    def __getstate__(self) -> Dict:
+        return {"capacity": self.capacity, "_raw": self._raw,
+                "_size_value": self._size_value, "_lock": self._lock}
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self._bind()
+
+    def expand(self, node: int, moves: np.ndarray, color: GO_COLOR) -> bool:
+        """ NodePool.expand under the lock of the tree """
+        with self._lock:
+            return NodePool.expand(self, node, moves, color)
+
+    def select_child(self, node: int, exploration: float) -> int:
+        """
+        UCT selection, treating every virtual loss as a lost playout.
+        """
+        block = self.children(node)
+        visits = (self.visits[block] + self.virtual_loss[block]).tolist()
+        parent_visits = float(self.visits[node] + self.virtual_loss[node])
+        best = block.start
+        best_value = -1.0
+        for i, (wins, n, amaf_wins, amaf_n) in enumerate(zip(
+                self.wins[block].tolist(), visits,
+                self.amaf_wins[block].tolist(), self.amaf_visits[block].tolist())):
+            value = uct_value(wins, n, amaf_wins, amaf_n, parent_visits, exploration, True)
+            if value > best_value:
+                best, best_value = block.start + i, value
+        return best
+
+    def root_stats(self) -> Dict[GO_POINT, Tuple[int, float]]:
+        return self.stats(0)
+
+
+def _tree_playout(tree: SharedTree, board: GoBoard, exploration: float) -> None:
+    moveNr = board.moveNumber()
+    node = 0
+    path = [node]
+    tree.virtual_loss[node] += 1
+    while tree.first_child[node] >= 0 and tree.num_children[node] > 0:
+        node = tree.select_child(node, exploration)
+        tree.virtual_loss[node] += 1
+        board.play_move(int(tree.move[node]), board.current_player)
+        path.append(node)
+    result = board.get_final_result()
+    moves = []
+    if result == "unknown":
+        tree.expand(node, board.get_empty_points(), board.current_player)
+        winner = board.simulate_unlogged(moves=moves)
+    else:
+        winner = RESULT_WINNER[result]
+
+    firsts = first_moves_after(board.change_stack[moveNr + 1:] + moves, len(path) - 1)
+    for depth, node in enumerate(path):
+        tree.visits[node] += 1
+        tree.wins[node] += result_value(winner, tree.color[node])
+        tree.virtual_loss[node] -= 1
+        first = tree.first_child[node]
+        if first < 0:
+            continue
+        played = firsts[depth]
+        for child in range(first, first + tree.num_children[node]):
+            if played.get(int(tree.move[child])) == tree.color[child]:
+                tree.amaf_visits[child] += 1
+                tree.amaf_wins[child] += result_value(winner, tree.color[child])
+    board.resetToMoveNumber(moveNr)
+
+
+def _tree_parallel_worker(tree: SharedTree, state_name: str, settings: PlayoutSettings,
+                         num_playouts: int, seed: np.random.SeedSequence, control: TimeManager) -> None:
+    state = SharedBoardState(state_name)
+    board = GoBoard(DEFAULT_SIZE)
+    state.sync(board)
+    state.close()
+    apply_playout_settings(board, settings)
+    board.rng = PlayoutRNG(seed)
+    playouts = 0
+    while num_playouts is None or playouts < num_playouts:
+        _tree_playout(tree, board, EXPLORATION)
+        playouts += 1
+        if control is not None and control.should_stop(int(tree.visits[0]), tree.root_stats):
+            break
+
+
+def tree_parallel_search(board: GoBoard, num_playouts: int, workers: int,
+                         reporter: AnalysisReporter = None,
+                         control: TimeManager = None) -> Dict[GO_POINT, Tuple[int, float]]:
+    """
+    Search one shared tree with workers processes.
+    Returns the root statistics.
+    reporter: receives the statistics of the shared root while searching
+    control: stops each worker when its copy says so, num_playouts can
+        then be None
+    """
+    num_moves = len(board.get_empty_points())
+    capacity = MAX_SHARED_NODES if num_playouts is None else num_playouts * num_moves + 1
+    tree = SharedTree(min(capacity, MAX_SHARED_NODES))
+    tree.clear(opponent(board.current_player))
+    state = SharedBoardState()
+    state.publish(board)
+    settings = playout_settings(board)
+    processes = [mp.Process(target=_tree_parallel_worker,
+                            args=(tree, state.name, settings, n, seed, control))
+                 for n, seed in zip(_split(num_playouts, workers), _worker_seeds(workers))]
+    try:
+        for p in processes:
+            p.start()
+        for p in processes:
+            while p.is_alive():
+                p.join(reporter.interval if reporter is not None and reporter.interval > 0 else None)
+                if reporter is not None:
+                    reporter.update(int(tree.visits[0]), tree.root_stats)
+    finally:
+        state.close()
+    return tree.root_stats()
+
+
+class ParallelMCTSPlayer(object):
+    def __init__(self, numSimulations: int, mode: str = "auto", workers: int = None) -> None:
+        """
+        numSimulations: playouts per legal move, as in FlatMonteCarloPlayer
+        mode: ROOT_PARALLEL, TREE_PARALLEL, or "auto" to use preferred_mode
+        workers: number of processes, one per core by default
+        """
+        self.numSimulations = numSimulations
+        self.mode = mode
+        self.workers = workers if workers else default_workers()
+        self.root_pool: RootParallelPool = None
+
+    def name(self):
+        return "Parallel MCTS Player ({0}, {1} workers)".format(self.mode, self.workers)
+
+    def genmove(self, state: GoBoard, reporter: AnalysisReporter = None,
+                control: TimeManager = None) -> GO_POINT:
+        """
+        Without control, search numSimulations playouts per legal move.
+        With a time manager, search until it stops the workers.
+        """
+        assert not state.end_of_game()
+        winning = state.winning_moves(state.current_player)
+        if winning:
+            return winning[0]
+        num_playouts = None
+        if control is None:
+            num_playouts = self.numSimulations * len(state.get_empty_points())
+        mode = self.mode if self.mode != "auto" else preferred_mode(state.size)
+        if mode == ROOT_PARALLEL:
+            if self.root_pool is None:
+                self.root_pool = RootParallelPool(self.workers)
+            stats = self.root_pool.search(state, num_playouts, reporter, control)
+        else:
+            stats = tree_parallel_search(state, num_playouts, self.workers, reporter, control)
+        playouts = sum(visits for visits, _ in stats.values())
+        if reporter is not None:
+            reporter.finish(playouts, stats)
+        if control is not None and playouts < len(state.get_empty_points()):
+            # stopped before it could compare the moves
+            fallback = control.fallback_move(state.get_rng())
+            if fallback is not None:
+                return fallback
+        return best_move_from_stats(stats)
+
+    def close(self) -> None:
+        if self.root_pool is not None:
+            self.root_pool.close()
+            self.root_pool = None
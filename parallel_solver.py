@@ -0,0 +1,184 @@
+"""
+parallel_solver.py
+Exact solver on several processes with a shared transposition table.
+
+ParallelSolver.solve works like Solver.solve, but runs the full negamax
+search in the style of Lazy SMP: every worker process searches the same
+root with the Solver negamax. The workers differ only in their move
+order. Worker 0 uses the order of Evaluator.move_priority, the others
+multiply each priority by a random factor, up to 1 + MOVE_NOISE, so they
+go down different subtrees first.
+
+All workers share one SharedTable. A subtree one worker has proven is
+not searched again by the others, and the first worker to prove the
+root reports the result and stops the others.
+
+The table is lockless in the way of Hyatt and Mann. Each entry is two
+64-bit words written without a lock: data, and key ^ data. A reader
+accepts an entry only if its key ^ data matches the key it looks for.
+A torn write by two workers therefore only loses an entry. Keys are
+64-bit blake2b hashes of the position, the player to move and the
+captures, which are the same in every process.
+Workers read the root position from a SharedBoardState, see shared_board.py.
+"""
+
+import hashlib
+import multiprocessing as mp
+import numpy as np
+import time
+from multiprocessing.sharedctypes import RawArray, RawValue
+from typing import Dict, Tuple
+
+from board import GoBoard
+from board_base import DEFAULT_SIZE, GO_COLOR, GO_POINT
+from evaluation import Evaluator
+from playout_rng import PlayoutRNG
+from shared_board import SharedBoardState
+from solver import DEFAULT_TIME_LIMIT, Solver
+
+"""
+Entries of the shared table, a power of two, 16 bytes each.
+"""
+TABLE_ENTRIES: int = 1 << 20
+
+"""
+Largest random increase of a move priority, in the move order of the
+workers other than worker 0.
+"""
+MOVE_NOISE: float = 0.5
+
+"""
+Seconds between two checks of the main process for a result.
+"""
+POLL_INTERVAL: float = 0.005
+
+Entry = Tuple[int, int, GO_POINT]
+
+
+class SharedTable(object):
+    def __init__(self, entries: int = TABLE_ENTRIES) -> None:
+        """
+        A transposition table of entries slots in shared memory, always
+        replacing the old entry of a slot. entries must be a power of two.
+        """
+        assert entries & (entries - 1) == 0
+        self.mask: int = entries - 1
+        self._raw_check = RawArray("Q", entries)
+        self._raw_data = RawArray("Q", entries)
+        self._bind()
+
+    def _bind(self) -> None:
+        self.check: np.ndarray = np.ctypeslib.as_array(self._raw_check)
+        self.data: np.ndarray = np.ctypeslib.as_array(self._raw_data)
+
+    def __getstate__(self) -> Dict:
+        return {"mask": self.mask, "_raw_check": self._raw_check, "_raw_data": self._raw_data}
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self._bind()
+
+    def probe(self, key: int) -> Entry:
+        """ The (value, flag, move) entry of key, None if there is none """
+        slot = key & self.mask
+        data = int(self.data[slot])
+        if data == 0 or int(self.check[slot]) ^ data != key:
+            return None
+        value = ((data >> 1) & 3) - 1
+        flag = (data >> 3) & 3
+        move = (data >> 5) - 1
+        return value, flag, (move if move >= 0 else None)
+
+    def save(self, key: int, value: int, flag: int, move: GO_POINT) -> None:
+        # bit 0 is set, so that an empty slot never matches
+        data = 1 | ((value + 1) << 1) | (flag << 3) | ((int(move) + 1 if move is not None else 0) << 5)
+        slot = key & self.mask
+        self.check[slot] = key ^ data
+        self.data[slot] = data
+
+
+class SharedTableSolver(Solver):
+    def __init__(self, table: SharedTable, worker: int, deadline: float, stop) -> None:
+        """
+        The negamax search of one worker.
+        stop: shared flag, set when the search must end
+        """
+        Solver.__init__(self)
+        self.shared: SharedTable = table
+        self.deadline: float = deadline
+        self.stop = stop
+        self.noise: float = MOVE_NOISE if worker > 0 else 0.0
+        self.rng: PlayoutRNG = PlayoutRNG(worker)
+
+    def _key(self, board: GoBoard) -> int:
+        material = board.board.tobytes() + bytes([board.current_player, board.black_captures,
+                                                  board.white_captures])
+        return int.from_bytes(hashlib.blake2b(material, digest_size=8).digest(), "little")
+
+    def probe(self, key: int) -> Entry:
+        return self.shared.probe(key)
+
+    def save(self, key: int, value: int, flag: int, move: GO_POINT) -> None:
+        self.shared.save(key, value, flag, move)
+
+    def out_of_time(self) -> bool:
+        return self.stop.value != 0 or time.time() > self.deadline
+
+    def move_order(self, evaluator: Evaluator, move: GO_POINT, color: GO_COLOR) -> float:
+        priority = evaluator.move_priority(move, color)
+        if self.noise > 0:
+            priority *= 1.0 + self.noise * self.rng.random()
+        return priority
+
+
+def _solver_worker(table: SharedTable, state_name: str, worker: int, deadline: float,
+                   stop, result, lock) -> None:
+    state = SharedBoardState(state_name)
+    board = GoBoard(DEFAULT_SIZE)
+    state.sync(board)
+    state.close()
+    solved = SharedTableSolver(table, worker, deadline, stop).search_root(board)
+    if solved is None:
+        return
+    value, move, depth = solved
+    with lock:
+        if result[0] == 0:
+            result[:] = [1, value, move if move is not None else -1, depth, worker]
+    stop.value = 1
+
+
+class ParallelSolver(Solver):
+    def __init__(self, time_limit: float = DEFAULT_TIME_LIMIT, workers: int = 2,
+                 db=None, table_entries: int = TABLE_ENTRIES) -> None:
+        """ Solver that runs its full search on workers processes """
+        Solver.__init__(self, time_limit, db)
+        self.workers: int = workers
+        self.table_entries: int = table_entries
+        self.winner_worker: int = None # the worker that proved the last result
+
+    def search_root(self, board: GoBoard) -> Tuple[int, GO_POINT, int]:
+        table = SharedTable(self.table_entries)
+        stop = RawValue("i", 0)
+        result = RawArray("q", 5)
+        lock = mp.Lock()
+        state = SharedBoardState()
+        state.publish(board)
+        processes = [mp.Process(target=_solver_worker,
+                                args=(table, state.name, worker, self.deadline, stop, result, lock))
+                     for worker in range(self.workers)]
+        try:
+            for p in processes:
+                p.start()
+            while stop.value == 0 and time.time() < self.deadline \
+                    and any(p.is_alive() for p in processes):
+                time.sleep(POLL_INTERVAL)
+            stop.value = 1
+            for p in processes:
+                p.join()
+        finally:
+            state.close()
+        if result[0] == 0:
+            return None
+        self.winner_worker = int(result[4])
+        move = int(result[2])
+        return int(result[1]), (move if move >= 0 else None), int(result[3])
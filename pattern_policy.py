@@ -0,0 +1,334 @@
+#!/usr/bin/python3
+"""
+pattern_policy.py
+Playout policy that samples moves by local line patterns.
+
+The pattern code of a point in one of the 4 line directions encodes the
+RADIUS points on each side of it, 2 bits each (EMPTY, BLACK, WHITE,
+BORDER), so there are NUM_CODES codes per direction. Points past the
+edge of the board are BORDER. A weight table gives a weight to every
+code, for BLACK to play. For WHITE to play the code is read with the
+colors swapped. The weight of an empty point for a color is
+
+    exp(sum of the table weights of its 4 codes)
+
+and a playout move is sampled with probability proportional to its
+weight, a softmax over the empty points. The weight is computed as the
+product of the exp of the 4 table weights.
+
+A PatternSampler keeps the codes of all points and the weights of the
+empty points for both colors, in a Fenwick tree per color. When a stone
+is placed or captured, only the codes of the points up to RADIUS away
+along the 4 lines change, so a move costs O(affected points) updates,
+and sampling costs O(log points).
+
+The default table is built by hand from five, four and three in a row
+for both colors and capture patterns. train_weights fits a table from
+a self-play dataset of dataset.py, from how often each code was played
+compared to how often it was available.
+
+Usage:
+    python3 pattern_policy.py train --data positions.bin --out weights.npy
+"""
+
+import argparse
+import numpy as np
+from typing import List
+
+from board_base import BLACK, WHITE, EMPTY, BORDER, GO_COLOR, GO_POINT
+
+RADIUS: int = 4
+SLOTS: int = 2 * RADIUS
+NUM_CODES: int = 4 ** SLOTS
+
+"""
+Offsets along a line of the slots of a code, slot i has the value 4**i.
+"""
+SLOT_OFFSETS: List[int] = list(range(-RADIUS, 0)) + list(range(1, RADIUS + 1))
+
+"""
+Limit of a table weight, so that the product of 4 factors cannot overflow.
+"""
+MAX_WEIGHT: float = 30.0
+
+"""
+Weights of the default table, for the number of stones of one color
+in a row through the point if it is played there.
+"""
+OWN_RUN_WEIGHTS: List[float] = [0.0, 0.0, 0.3, 1.0, 3.0, 12.0]
+OPPONENT_RUN_WEIGHTS: List[float] = [0.0, 0.0, 0.1, 0.8, 2.5, 9.0]
+OPEN_BONUS: float = 0.5
+CAPTURE_WEIGHT: float = 2.0
+
+"""
+Prior used by train_weights: a code seen fewer times than this keeps
+a weight near 0.
+"""
+TRAIN_PRIOR: float = 10.0
+
+
+def code_digits(codes: np.ndarray) -> np.ndarray:
+    """ The slot values of codes, shape codes.shape + (SLOTS,) """
+    return (codes[..., None] >> (2 * np.arange(SLOTS))) & 3
+
+
+def swapped_codes() -> np.ndarray:
+    """ For every code, the code with BLACK and WHITE exchanged """
+    swap = np.array([EMPTY, WHITE, BLACK, BORDER])
+    digits = swap[code_digits(np.arange(NUM_CODES))]
+    return (digits << (2 * np.arange(SLOTS))).sum(axis=1)
+
+
+def _runs(side: np.ndarray, color: GO_COLOR) -> np.ndarray:
+    """ Number of stones of color next to the point on one side """
+    return np.cumprod(side == color, axis=1).sum(axis=1)
+
+
+def _after_run(side: np.ndarray, run: np.ndarray) -> np.ndarray:
+    """ The value of the first point after the run, BORDER past the radius """
+    padded = np.concatenate([side, np.full((len(side), 1), BORDER)], axis=1)
+    return padded[np.arange(len(side)), run]
+
+
+def default_weights() -> np.ndarray:
+    """ The hand-made table, for BLACK to play """
+    digits = code_digits(np.arange(NUM_CODES))
+    left = digits[:, RADIUS - 1::-1] # nearest point first
+    right = digits[:, RADIUS:]
+    weights = np.zeros(NUM_CODES)
+    for color, run_weights in [(BLACK, OWN_RUN_WEIGHTS), (WHITE, OPPONENT_RUN_WEIGHTS)]:
+        left_run, right_run = _runs(left, color), _runs(right, color)
+        run = np.minimum(1 + left_run + right_run, 5)
+        weights += np.array(run_weights)[run]
+        open_ends = (_after_run(left, left_run) == EMPTY) & (_after_run(right, right_run) == EMPTY)
+        weights += np.where(open_ends & (run >= 3) & (run < 5), OPEN_BONUS, 0.0)
+    for side in [left, right]:
+        captures = (side[:, 0] == WHITE) & (side[:, 1] == WHITE) & (side[:, 2] == BLACK)
+        weights += np.where(captures, CAPTURE_WEIGHT, 0.0)
+    return weights
+
+
+def point_codes(cells: List, point: GO_POINT, NS: int) -> List[int]:
+    """ The codes of point in the 4 directions, computed from scratch """
+    codes = []
+    for d in [1, NS, NS + 1, NS - 1]:
+        code = 0
+        for slot, offset in enumerate(SLOT_OFFSETS):
+            step = 1 if offset > 0 else -1
+            value = EMPTY
+            for k in range(1, abs(offset) + 1):
+                value = cells[point + step * k * d]
+                if value == BORDER:
+                    break
+            code += value << (2 * slot)
+        codes.append(code)
+    return codes
+
+
+def train_weights(path: str) -> np.ndarray:
+    """
+    Fit a table to the moves played in the dataset at path.
+    The weight of a code is the log of how much more often than average
+    it was played when it was available, shrunk towards 0 by TRAIN_PRIOR.
+    Codes are taken from the view of the player to move.
+    """
+    from dataset import read_dataset, read_header, unpack_boards
+    size = read_header(path)
+    records = read_dataset(path)
+    swap = swapped_codes()
+    played = np.zeros(NUM_CODES)
+    seen = np.zeros(NUM_CODES)
+    NS = size + 1
+    for record, cells in zip(records, unpack_boards(records["board"], size)):
+        cells = cells.tolist()
+        for point in range(len(cells)):
+            if cells[point] != EMPTY:
+                continue
+            codes = point_codes(cells, point, NS)
+            if record["to_play"] == WHITE:
+                codes = [int(swap[code]) for code in codes]
+            for code in codes:
+                seen[code] += 1
+                if point == record["move"]:
+                    played[code] += 1
+    rate = played.sum() / max(seen.sum(), 1.0)
+    return np.log((played + TRAIN_PRIOR * rate) / ((seen + TRAIN_PRIOR) * rate))
+
+
+class PatternPolicy(object):
+    def __init__(self, weights: np.ndarray = None, path: str = None) -> None:
+        """
+        weights: table of NUM_CODES weights for BLACK to play,
+        default_weights() if None
+        path: the file the table was loaded from, None for a table that
+        was not, so that worker processes can load the same table
+        """
+        if weights is None:
+            weights = default_weights()
+        weights = np.asarray(weights, dtype=float)
+        assert weights.shape == (NUM_CODES,)
+        self.weights: np.ndarray = weights
+        self.path: str = path
+        # exp of the weights, so that the weight of a point is a product
+        factors = np.exp(np.clip(weights, -MAX_WEIGHT, MAX_WEIGHT))
+        self.factors: List[List[float]] = [None, factors.tolist(),
+                                           factors[swapped_codes()].tolist()]
+
+    @classmethod
+    def load(cls, path: str) -> 'PatternPolicy':
+        """ A policy with the table saved by np.save at path """
+        return cls(np.load(path), path)
+
+    def name(self) -> str:
+        return "pattern"
+
+
+class PatternSampler(object):
+    def __init__(self, policy: PatternPolicy, size: int, maxpoint: int) -> None:
+        """ Sampling state for boards of the given size, filled by load """
+        self.policy: PatternPolicy = policy
+        self.size: int = size
+        self.NS: int = size + 1
+        self.maxpoint: int = maxpoint
+        self.directions: List[int] = [1, self.NS, self.NS + 1, self.NS - 1]
+        self.codes: List[List[int]] = [[0] * maxpoint for _ in self.directions]
+        self.weight: List[List[float]] = [None, [0.0] * maxpoint, [0.0] * maxpoint]
+        self.tree: List[List[float]] = [None, [0.0] * (maxpoint + 1), [0.0] * (maxpoint + 1)]
+        self.top: int = 1 << (maxpoint.bit_length() - 1)
+        self.saved_cells: List = None
+        self.saved: List[List] = None
+
+    def _state(self) -> List[List]:
+        return self.codes + self.weight[1:] + self.tree[1:]
+
+    def load(self, cells: List, empty: List[GO_POINT]) -> None:
+        """
+        Compute the codes and weights of a position. The state of the
+        last position computed is kept, and copied back if it is loaded
+        again, as for the many playouts from one position.
+        """
+        if cells == self.saved_cells:
+            for array, saved in zip(self._state(), self.saved):
+                array[:] = saved
+            return
+        self._compute(cells, empty)
+        self.saved_cells = list(cells)
+        self.saved = [list(array) for array in self._state()]
+
+    def _compute(self, cells: List, empty: List[GO_POINT]) -> None:
+        NS = self.NS
+        codes = self.codes
+        for p in range(self.maxpoint):
+            if cells[p] == BORDER:
+                continue
+            for d, code in enumerate(point_codes(cells, p, NS)):
+                codes[d][p] = code
+        for color in [BLACK, WHITE]:
+            weight = self.weight[color]
+            for p in range(self.maxpoint):
+                weight[p] = 0.0
+            for p in empty:
+                weight[p] = self._point_weight(color, p)
+            # build the Fenwick tree in linear time
+            tree = self.tree[color]
+            tree[0] = 0.0
+            tree[1:] = weight
+            for i in range(1, self.maxpoint + 1):
+                parent = i + (i & -i)
+                if parent <= self.maxpoint:
+                    tree[parent] += tree[i]
+
+    def _point_weight(self, color: GO_COLOR, p: GO_POINT) -> float:
+        factors = self.policy.factors[color]
+        codes = self.codes
+        return factors[codes[0][p]] * factors[codes[1][p]] * factors[codes[2][p]] * factors[codes[3][p]]
+
+    def _add(self, color: GO_COLOR, p: GO_POINT, delta: float) -> None:
+        tree = self.tree[color]
+        i = p + 1
+        n = self.maxpoint
+        while i <= n:
+            tree[i] += delta
+            i += i & -i
+
+    def _set_weight(self, p: GO_POINT, empty: bool) -> None:
+        for color in [BLACK, WHITE]:
+            new = self._point_weight(color, p) if empty else 0.0
+            old = self.weight[color][p]
+            if new != old:
+                self.weight[color][p] = new
+                self._add(color, p, new - old)
+
+    def update(self, cells: List, change: List) -> None:
+        """
+        Follow a move played on cells, given as a change stack entry
+        [color, point, captures...]: cells already hold the new position.
+        """
+        color, point = change[0], change[1]
+        affected = set()
+        self._change_cell(cells, point, color - EMPTY, affected)
+        for capture in change[2:]:
+            self._change_cell(cells, capture, EMPTY - (BLACK + WHITE - color), affected)
+        for p in affected:
+            self._set_weight(p, cells[p] == EMPTY)
+
+    def _change_cell(self, cells: List, q: GO_POINT, delta: int, affected: set) -> None:
+        """ Update the codes that see the point q, whose value changed by delta """
+        affected.add(q)
+        for d, step in enumerate(self.directions):
+            codes = self.codes[d]
+            # a point r sees q at offset +k if r = q - k * step
+            for sign, first_slot in [(-1, RADIUS), (1, RADIUS - 1)]:
+                r = q
+                for k in range(1, RADIUS + 1):
+                    r += sign * step
+                    if cells[r] == BORDER:
+                        break
+                    slot = first_slot + k - 1 if sign < 0 else first_slot - k + 1
+                    codes[r] += delta << (2 * slot)
+                    if cells[r] == EMPTY:
+                        affected.add(r)
+
+    def sample(self, color: GO_COLOR, u: float) -> GO_POINT:
+        """
+        The empty point whose weight interval holds u * total weight,
+        NO point (-1) if all weights are 0.
+        """
+        tree = self.tree[color]
+        n = self.maxpoint
+        target = u * self.total(color)
+        i = 0
+        bit = self.top
+        while bit > 0:
+            j = i + bit
+            if j <= n and tree[j] <= target:
+                i = j
+                target -= tree[j]
+            bit >>= 1
+        return i if i < n else -1
+
+    def total(self, color: GO_COLOR) -> float:
+        tree = self.tree[color]
+        total = 0.0
+        i = self.maxpoint
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Pattern playout policy tables")
+    commands = parser.add_subparsers(dest="command", required=True)
+    train = commands.add_parser("train", help="fit a weight table to a self-play dataset")
+    train.add_argument("--data", required=True, help="dataset file of dataset.py")
+    train.add_argument("--out", required=True, help="weight table, saved with np.save")
+    args = parser.parse_args(argv)
+    weights = train_weights(args.data)
+    np.save(args.out, weights)
+    print("wrote {} weights to {}, {} codes seen".format(
+        NUM_CODES, args.out, int(np.count_nonzero(weights))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+playout_rng.py
+Seedable random number stream for playouts.
+
+np.random.choice has a high fixed cost per call and uses the global
+numpy generator, so playouts could not be reproduced.
+A PlayoutRNG draws uniform numbers from its own generator in large
+blocks and hands them out one at a time, which makes sampling a move
+a list lookup.
+
+Every GoBoard has an rng attribute, by default the engine-wide stream
+returned by default_rng(). Worker processes get their own streams,
+derived from the engine seed with spawn(), so a search is repeatable
+for a given --seed.
+"""
+
+import numpy as np
+from typing import List, Sequence
+
+BLOCK_SIZE: int = 4096
+
+
+class PlayoutRNG(object):
+    def __init__(self, seed=None, block_size: int = BLOCK_SIZE) -> None:
+        """
+        seed: an int, a numpy SeedSequence, or None for a random seed
+        block_size: number of uniform values generated at a time
+        """
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        self.seed_sequence: np.random.SeedSequence = seed
+        self.generator: np.random.Generator = np.random.default_rng(seed)
+        self.block_size: int = block_size
+        self._block: List[float] = []
+        self._index: int = 0
+
+    def random(self) -> float:
+        """ A uniform value in [0, 1) """
+        if self._index == len(self._block):
+            self._block = self.generator.random(self.block_size).tolist()
+            self._index = 0
+        value = self._block[self._index]
+        self._index += 1
+        return value
+
+    def randrange(self, n: int) -> int:
+        """ A uniform integer in [0, n) """
+        return int(self.random() * n)
+
+    def choice(self, items: Sequence):
+        """ A uniformly chosen element of the non-empty sequence items """
+        return items[int(self.random() * len(items))]
+
+    def shuffle(self, items: np.ndarray) -> None:
+        """ Shuffle the array in place """
+        self.generator.shuffle(items)
+
+    def spawn(self, n: int) -> List['PlayoutRNG']:
+        """ n independent streams, for worker processes or tasks """
+        return [PlayoutRNG(s, self.block_size) for s in self.seed_sequence.spawn(n)]
+
+    def spawn_seeds(self, n: int) -> List[np.random.SeedSequence]:
+        """
+        Seeds for n independent streams. Cheaper to send to a worker
+        than a PlayoutRNG with its block.
+        """
+        return self.seed_sequence.spawn(n)
+
+
+_default: PlayoutRNG = PlayoutRNG()
+
+
+def default_rng() -> PlayoutRNG:
+    return _default
+
+
+def seed(value) -> None:
+    """ Reseed the engine-wide stream """
+    global _default
+    _default = PlayoutRNG(value)
@@ -0,0 +1,182 @@
+"""
+puct.py
+Monte Carlo tree search with rule based priors and progressive widening.
+
+PUCT is MCTS with another selection rule. When a node is expanded,
+every move gets a prior probability from the move categories of the
+rule based policy, FlatMonteCarloPlayer.policy_move_list:
+
+    Win, BlockWin, OpenFour, Capture, Random
+
+and from the capture and threat counts of the move. The categories are
+not found by playing every move as in policy_move_list, which would
+cost two play/undo per point and node, but from the kernels of the
+board and the window counts of an Evaluator:
+
+    Win         five through the point, or the pairs it captures win
+    BlockWin    the same for the opponent
+    OpenFour    the move makes two windows of four of its own stones
+    Capture     the move captures a pair
+
+A move weighs CATEGORY_WEIGHTS[category], plus CAPTURE_WEIGHT per pair
+it captures or saves from capture, plus Evaluator.move_priority. The
+priors are the weights normalized to 1.
+
+The children of a node are allocated in the order of their priors, and
+selection only considers the first widened_children(visits) of them.
+A node starts with the WIDEN_BASE best ranked moves, and the next ones
+are added as its visit count grows, so on a large board the playouts go
+to a few dozen candidates instead of every empty point.
+Among these, selection takes the child with the highest
+
+    value + exploration * prior * sqrt(parent visits) / (1 + visits)
+
+with the value blended with AMAF as in MCTS. A child without statistics
+has the value FIRST_PLAY_VALUE.
+"""
+
+import math
+import numpy as np
+from typing import List, Tuple
+
+from analysis import AnalysisReporter
+from board import GoBoard
+from board_base import GO_POINT, EMPTY, opponent
+from evaluation import Evaluator
+from mcts import MCTS, MCTSPlayer
+from node_pool import MAX_TREE_BYTES, NODE_FIELDS, NodePool
+from rave import blend
+from time_control import TimeManager
+
+PUCT_EXPLORATION: float = 1.0
+
+"""
+Prior weight of a move by its category, in the order of POLICY_CATEGORIES
+of gtp_connection.py: Win, BlockWin, OpenFour, Capture, Random.
+"""
+CATEGORY_WEIGHTS: List[float] = [100000.0, 10000.0, 1000.0, 100.0, 0.0]
+CAPTURE_WEIGHT: float = 50.0
+
+"""
+Children considered by the selection at a node with n visits:
+WIDEN_BASE + WIDEN_SCALE * sqrt(n), at most all of them.
+"""
+WIDEN_BASE: int = 2
+WIDEN_SCALE: float = 1.5
+
+FIRST_PLAY_VALUE: float = 0.5
+
+
+def widened_children(visits: float) -> int:
+    return WIDEN_BASE + int(WIDEN_SCALE * math.sqrt(visits))
+
+
+def puct_value(wins: float, visits: float, amaf_wins: float, amaf_visits: float, prior: float,
+               sqrt_parent_visits: float, exploration: float, use_rave: bool) -> float:
+    """ PUCT value of a child, with the mean value blended with its AMAF value """
+    if visits > 0:
+        value = wins / visits
+        if use_rave and amaf_visits > 0:
+            value = blend(value, visits, amaf_wins / amaf_visits, amaf_visits)
+    elif use_rave and amaf_visits > 0:
+        value = amaf_wins / amaf_visits
+    else:
+        value = FIRST_PLAY_VALUE
+    return value + exploration * prior * sqrt_parent_visits / (1 + visits)
+
+
+def move_priors(board: GoBoard, evaluator: Evaluator) -> Tuple[List[GO_POINT], List[float]]:
+    """
+    The empty points of board and the prior probabilities of the moves
+    of the player to move there, highest first.
+    evaluator: attached to board
+    """
+    color = board.current_player
+    opp = opponent(color)
+    cells = evaluator.cells
+    kernels = board.kernels
+    own_stones = evaluator.stones[color]
+    opp_stones = evaluator.stones[opp]
+    captures = board.get_captures(color)
+    opp_captures = board.get_captures(opp)
+    moves = []
+    weights = []
+    for p in evaluator.points:
+        if cells[p] != EMPTY:
+            continue
+        pairs = kernels.count_captures(cells, p, color, opp)
+        saved = kernels.count_captures(cells, p, opp, color)
+        if kernels.five_through(cells, p, color) or captures + 2 * pairs >= 10:
+            category = 0
+        elif kernels.five_through(cells, p, opp) or opp_captures + 2 * saved >= 10:
+            category = 1
+        elif sum(1 for number in evaluator.point_windows5.get(p, ())
+                 if own_stones[number] == 3 and opp_stones[number] == 0) >= 2:
+            category = 2
+        elif pairs > 0:
+            category = 3
+        else:
+            category = 4
+        moves.append(p)
+        weights.append(CATEGORY_WEIGHTS[category] + CAPTURE_WEIGHT * (pairs + saved)
+                       + evaluator.move_priority(p, color) + 1.0)
+    order = sorted(range(len(moves)), key=weights.__getitem__, reverse=True)
+    total = sum(weights)
+    return [moves[i] for i in order], [weights[i] / total for i in order]
+
+
+class PriorNodePool(NodePool):
+    FIELDS: List[Tuple[str, str]] = NODE_FIELDS + [("prior", "f4")]
+
+
+class PUCT(MCTS):
+    def __init__(self, exploration: float = PUCT_EXPLORATION, use_rave: bool = True,
+                 max_bytes: int = MAX_TREE_BYTES) -> None:
+        MCTS.__init__(self, exploration, use_rave, max_bytes)
+        self.pool: PriorNodePool = PriorNodePool(max_bytes=max_bytes)
+
+    def search(self, board: GoBoard, num_playouts: int,
+               reporter: AnalysisReporter = None, control: TimeManager = None) -> GO_POINT:
+        """ MCTS.search, with an Evaluator attached to board for the priors """
+        attached = board.evaluator is None
+        if attached:
+            Evaluator(board)
+        try:
+            return MCTS.search(self, board, num_playouts, reporter, control)
+        finally:
+            if attached:
+                board.evaluator.detach()
+
+    def expand(self, node: int, board: GoBoard) -> None:
+        pool = self.pool
+        moves, priors = move_priors(board, board.evaluator)
+        if pool.expand(node, np.array(moves, dtype=np.int32), board.current_player):
+            pool.prior[pool.children(node)] = priors
+
+    def select_child(self, node: int) -> int:
+        pool = self.pool
+        block = pool.children(node)
+        visits = float(pool.visits[node])
+        end = min(block.stop, block.start + widened_children(visits))
+        sqrt_visits = math.sqrt(max(visits, 1.0))
+        best = block.start
+        best_value = -1.0
+        for i, (wins, child_visits, amaf_wins, amaf_visits, prior) in enumerate(zip(
+                pool.wins[block.start:end].tolist(), pool.visits[block.start:end].tolist(),
+                pool.amaf_wins[block.start:end].tolist(), pool.amaf_visits[block.start:end].tolist(),
+                pool.prior[block.start:end].tolist())):
+            value = puct_value(wins, child_visits, amaf_wins, amaf_visits, prior,
+                               sqrt_visits, self.exploration, self.use_rave)
+            if value > best_value:
+                best, best_value = block.start + i, value
+        return best
+
+
+class PUCTPlayer(MCTSPlayer):
+    def __init__(self, numSimulations: int) -> None:
+        """ MCTSPlayer with the PUCT search """
+        MCTSPlayer.__init__(self, numSimulations)
+        self.search = PUCT()
+
+    def name(self):
+        return "PUCT Player ({0} sim.)".format(self.numSimulations)
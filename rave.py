@@ -0,0 +1,87 @@
+"""
+rave.py
+All-moves-as-first (AMAF) statistics for Monte Carlo playouts.
+
+A playout normally only counts for the move it started from.
+AMAF also credits the playout result to every other move played
+during the playout, by the color that played it.
+RAVE blends these fast but biased statistics with the direct ones,
+trusting AMAF while a move has few direct playouts and fading it out
+as the direct statistics grow.
+"""
+
+import numpy as np
+from typing import List
+
+from board_base import BLACK, WHITE, EMPTY, GO_COLOR, GO_POINT
+
+"""
+Equivalence parameter k of the RAVE schedule.
+The AMAF and direct statistics get equal weight after about k/3
+direct playouts.
+"""
+RAVE_EQUIVALENCE: int = 300
+
+
+class AmafStats(object):
+    def __init__(self, maxpoint: int) -> None:
+        """
+        AMAF statistics for both colors on a board with maxpoint array elements.
+        wins[color][point] counts playouts won by color (0.5 for a draw)
+        in which color played on point.
+        """
+        self.maxpoint: int = maxpoint
+        self.wins: np.ndarray = np.zeros((3, maxpoint))
+        self.visits: np.ndarray = np.zeros((3, maxpoint))
+
+    def clear(self) -> None:
+        self.wins.fill(0)
+        self.visits.fill(0)
+
+    def update(self, changes: List, winner: GO_COLOR) -> None:
+        """
+        Record the result of one playout.
+
+        changes: the change_stack entries [color, point, captures...]
+            of all moves played in the playout, in order.
+        winner: BLACK, WHITE, or EMPTY for a draw, as returned by GoBoard.simulate
+        Only the first move on each point counts, so a point that was
+        captured and replayed is credited to the color that played it first.
+        """
+        seen = set()
+        for change in changes:
+            color, point = change[0], change[1]
+            if point in seen:
+                continue
+            seen.add(point)
+            self.visits[color, point] += 1
+            if winner == color:
+                self.wins[color, point] += 1
+            elif winner == EMPTY:
+                self.wins[color, point] += 0.5
+
+    def value(self, color: GO_COLOR, point: GO_POINT) -> float:
+        """ AMAF win rate of point for color, 0.5 if it was never played """
+        n = self.visits[color, point]
+        if n == 0:
+            return 0.5
+        return self.wins[color, point] / n
+
+
+def rave_beta(n: float, n_amaf: float, k: int = RAVE_EQUIVALENCE) -> float:
+    """
+    Weight of the AMAF value in the blended value.
+    Uses the hand-selected schedule beta = sqrt(k / (3n + k)).
+    """
+    if n_amaf == 0:
+        return 0.0
+    return np.sqrt(k / (3 * n + k))
+
+
+def blend(value: float, n: float, amaf_value: float, n_amaf: float,
+          k: int = RAVE_EQUIVALENCE) -> float:
+    """
+    Blend a direct value from n playouts with an AMAF value from n_amaf playouts.
+    """
+    beta = rave_beta(n, n_amaf, k)
+    return (1 - beta) * value + beta * amaf_value
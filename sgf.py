@@ -0,0 +1,224 @@
+"""
+sgf.py
+Reading game records in SGF format.
+
+Only the main line of each game is used: at every branch the first
+variation is followed. The board size comes from SZ (default 19, as in
+the SGF standard), setup stones from AB/AW, and moves from B/W.
+Passes ("" or "tt") are skipped, since Ninuki has no pass move.
+
+parse_games parses a string, iter_game_file streams the games of a
+file holding any number of records, reading it in chunks. replay
+plays a record straight onto a GoBoard with play_move, so the position
+can be taken back with undo_move.
+"""
+
+import re
+from contextlib import closing
+from typing import Dict, Iterator, List, Tuple
+
+from board import GoBoard
+from board_base import BLACK, WHITE, EMPTY, MAXSIZE, GO_COLOR, GO_POINT, coord_to_point
+
+DEFAULT_SGF_SIZE: int = 19
+
+"""
+Number of characters read from a file at a time by iter_game_file.
+"""
+CHUNK_SIZE: int = 1 << 16
+
+_TOKEN = re.compile(r"\s*(?:(\()|(\))|(;)|([A-Za-z]+)|\[((?:[^\\\]]|\\.)*)\])", re.DOTALL)
+
+
+class GameRecord(object):
+    def __init__(self, size: int, setup: List[Tuple[GO_COLOR, GO_POINT]],
+                 moves: List[Tuple[GO_COLOR, GO_POINT]], properties: Dict[str, List[str]]) -> None:
+        """
+        size: board size
+        setup: stones placed before the first move, as (color, point)
+        moves: the moves of the main line, as (color, point)
+        properties: the properties of the root node, such as PB, PW, RE
+        """
+        self.size: int = size
+        self.setup: List[Tuple[GO_COLOR, GO_POINT]] = setup
+        self.moves: List[Tuple[GO_COLOR, GO_POINT]] = moves
+        self.properties: Dict[str, List[str]] = properties
+
+
+def sgf_to_point(value: str, size: int) -> GO_POINT:
+    """
+    Convert an SGF point such as "cd" to a board point.
+    SGF counts rows from the top, the board counts them from the bottom.
+    Returns None for a pass.
+    """
+    if value == "" or (value == "tt" and size <= 19):
+        return None
+    if len(value) != 2:
+        raise ValueError("wrong SGF point: " + value)
+    col = ord(value[0]) - ord("a") + 1
+    row = size - (ord(value[1]) - ord("a"))
+    if not (1 <= col <= size and 1 <= row <= size):
+        raise ValueError("SGF point off the board: " + value)
+    return coord_to_point(row, col, size)
+
+
+def _parse_main_line(tokens: List[Tuple[str, str]]) -> List[Dict[str, List[str]]]:
+    """
+    Nodes of the main line of one game tree, from its tokens.
+    Each token is (kind, text), kind one of "(", ")", ";", "id", "value".
+    The first variation of every branch is written first, so the main line
+    is made of all nodes before the first ")".
+    """
+    nodes: List[Dict[str, List[str]]] = []
+    ident = None
+    for kind, text in tokens:
+        if kind == ")":
+            break
+        elif kind == ";":
+            nodes.append({})
+        elif kind == "id":
+            ident = text
+        elif kind == "value":
+            if not nodes or ident is None:
+                raise ValueError("SGF value outside of a property")
+            nodes[-1].setdefault(ident, []).append(text)
+    return nodes
+
+
+def _tokenize(text: str) -> List[Tuple[str, str]]:
+    tokens = []
+    pos = 0
+    end = len(text.rstrip())
+    while pos < end:
+        match = _TOKEN.match(text, pos)
+        if match is None:
+            raise ValueError("SGF syntax error at position {}".format(pos))
+        pos = match.end()
+        if match.group(1):
+            tokens.append(("(", ""))
+        elif match.group(2):
+            tokens.append((")", ""))
+        elif match.group(3):
+            tokens.append((";", ""))
+        elif match.group(4):
+            tokens.append(("id", match.group(4)))
+        else:
+            tokens.append(("value", match.group(5)))
+    return tokens
+
+
+def parse_game(text: str) -> GameRecord:
+    """ Parse the game tree in text, which holds exactly one game """
+    nodes = _parse_main_line(_tokenize(text))
+    if not nodes:
+        raise ValueError("SGF game without nodes")
+    root = nodes[0]
+    size = int(root.get("SZ", [DEFAULT_SGF_SIZE])[0])
+    if not 2 <= size <= MAXSIZE:
+        raise ValueError("unsupported board size {}".format(size))
+    setup: List[Tuple[GO_COLOR, GO_POINT]] = []
+    moves: List[Tuple[GO_COLOR, GO_POINT]] = []
+    for i, node in enumerate(nodes):
+        for ident, color in [("AB", BLACK), ("AW", WHITE)]:
+            for value in node.get(ident, []):
+                if i > 0:
+                    raise ValueError("setup stones after the first node are not supported")
+                setup.append((color, sgf_to_point(value, size)))
+        for ident, color in [("B", BLACK), ("W", WHITE)]:
+            for value in node.get(ident, []):
+                point = sgf_to_point(value, size)
+                if point is not None:
+                    moves.append((color, point))
+    return GameRecord(size, setup, moves, root)
+
+
+def split_games(text: str) -> Tuple[List[str], str]:
+    """
+    Split text into complete top-level game trees.
+    Returns the games and the unfinished rest of text.
+    """
+    games = []
+    depth = 0
+    in_value = False
+    escaped = False
+    start = None
+    for i, c in enumerate(text):
+        if in_value:
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == "]":
+                in_value = False
+        elif c == "[":
+            in_value = True
+        elif c == "(":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif c == ")":
+            depth -= 1
+            if depth == 0:
+                games.append(text[start:i + 1])
+                start = None
+    if depth == 0:
+        return games, ""
+    return games, text[start:]
+
+
+def parse_games(text: str) -> List[GameRecord]:
+    """ Parse all games in text """
+    games, rest = split_games(text)
+    if rest.strip():
+        raise ValueError("unfinished SGF game tree")
+    return [parse_game(game) for game in games]
+
+
+def iter_game_file(path: str) -> Iterator[GameRecord]:
+    """
+    Stream the games of an SGF file, one GameRecord at a time,
+    without reading the whole file into memory.
+    """
+    rest = ""
+    with open(path, "r") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            games, rest = split_games(rest + chunk)
+            for game in games:
+                yield parse_game(game)
+    if rest.strip():
+        raise ValueError("unfinished SGF game tree at the end of " + path)
+
+
+def read_game(path: str) -> GameRecord:
+    """
+    The first game of an SGF file, None if it has none.
+    The file is closed before returning, the rest of it is not read.
+    """
+    with closing(iter_game_file(path)) as games:
+        return next(games, None)
+
+
+def replay(board: GoBoard, record: GameRecord, num_moves: int = None) -> None:
+    """
+    Reset board to the record's size and setup stones, then play the
+    first num_moves moves of the record (all of them if None).
+    Setup stones are not on the change stack, the moves are.
+    Raises ValueError if a move is on an occupied point, or if num_moves
+    is negative.
+    """
+    if num_moves is not None and num_moves < 0:
+        raise ValueError("negative number of moves: {}".format(num_moves))
+    board.reset(record.size)
+    for color, point in record.setup:
+        if point is not None:
+            board.board[point] = color
+    board.invalidate_status()
+    moves = record.moves if num_moves is None else record.moves[:num_moves]
+    for color, point in moves:
+        if not board.play_move(point, color):
+            raise ValueError("move on occupied point {}".format(point))
+    if not moves and record.moves:
+        board.current_player = record.moves[0][0]
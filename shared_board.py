@@ -0,0 +1,164 @@
+"""
+shared_board.py
+Board state in shared memory for worker processes.
+
+The root position is kept in one multiprocessing.shared_memory block,
+laid out as an int32 array:
+
+    [version, size, current_player, black_captures, white_captures,
+     last_move, last2_move, board[0], board[1], ...]
+
+board is the padded 1D array of GoBoard.board, with room for MAXSIZE.
+Workers map the block as a numpy view, so nothing is pickled or copied
+to send a position. Each worker keeps a private GoBoard to search on and
+only copies the block into it when the version has changed.
+
+The version works like a sequence lock: the writer makes it odd while
+it writes and even again when done. A reader that sees an odd version,
+or a version that changed while it copied, tries again.
+
+The position does not include the playout settings of the board. They
+are sent with each task as PlayoutSettings, see playout_settings, and
+restored on the worker board by apply_playout_settings.
+"""
+
+import numpy as np
+from multiprocessing import shared_memory
+from typing import Dict, Tuple
+
+from board import GoBoard
+from board_base import MAXSIZE, board_array_size
+
+VERSION = 0
+SIZE = 1
+CURRENT_PLAYER = 2
+BLACK_CAPTURES = 3
+WHITE_CAPTURES = 4
+LAST_MOVE = 5
+LAST2_MOVE = 6
+HEADER_SIZE = 7
+
+BLOCK_ELEMENTS: int = HEADER_SIZE + board_array_size(MAXSIZE)
+
+"""
+The playout policy of a board: None for uniform random, or "pattern"
+and the file of its table, None for the default table; then its
+playout_limit, and the file of its solved_db, None for none.
+"""
+PlayoutSettings = Tuple[str, str, int, str]
+
+"""
+Pattern policies and solved position databases of a worker process by
+file, loaded once.
+"""
+_pattern_policies: Dict[str, object] = {}
+_solved_dbs: Dict[str, object] = {}
+
+
+def open_solved_db(path: str):
+    """ The solved_db.SolvedDB at path, opened once per process """
+    if path not in _solved_dbs:
+        from solved_db import SolvedDB
+        _solved_dbs[path] = SolvedDB(path)
+    return _solved_dbs[path]
+
+
+def playout_settings(board: GoBoard) -> PlayoutSettings:
+    """ The playout settings of board as a small picklable tuple """
+    policy = board.playout_policy
+    db = board.solved_db.path if board.solved_db is not None else None
+    if policy is None:
+        return (None, None, board.playout_limit, db)
+    return (policy.name(), policy.path, board.playout_limit, db)
+
+
+def apply_playout_settings(board: GoBoard, settings: PlayoutSettings) -> None:
+    """ Give board the playout settings saved by playout_settings """
+    policy, table, board.playout_limit, db = settings
+    board.solved_db = open_solved_db(db) if db is not None else None
+    board.playout_policy = None
+    if policy is not None:
+        if table not in _pattern_policies:
+            from pattern_policy import PatternPolicy
+            _pattern_policies[table] = PatternPolicy.load(table) if table is not None else PatternPolicy()
+        board.playout_policy = _pattern_policies[table]
+
+
+class SharedBoardState(object):
+    def __init__(self, name: str = None) -> None:
+        """
+        Create a new shared block, or attach to the existing block name.
+        Only the process that created the block may publish to it.
+        """
+        self.owner: bool = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(
+                create=True, size=BLOCK_ELEMENTS * np.dtype(np.int32).itemsize)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.data: np.ndarray = np.ndarray((BLOCK_ELEMENTS,), dtype=np.int32, buffer=self.shm.buf)
+        if self.owner:
+            self.data[:] = 0
+        self.local_version: int = -1
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def version(self) -> int:
+        return int(self.data[VERSION])
+
+    def publish(self, board: GoBoard) -> int:
+        """
+        Write the position of board to the shared block.
+        Returns the new version.
+        """
+        assert self.owner
+        data = self.data
+        data[VERSION] += 1
+        data[SIZE] = board.size
+        data[CURRENT_PLAYER] = board.current_player
+        data[BLACK_CAPTURES] = board.black_captures
+        data[WHITE_CAPTURES] = board.white_captures
+        data[LAST_MOVE] = board.last_move
+        data[LAST2_MOVE] = board.last2_move
+        data[HEADER_SIZE:HEADER_SIZE + board.maxpoint] = board.board
+        data[VERSION] += 1
+        return int(data[VERSION])
+
+    def sync(self, board: GoBoard) -> bool:
+        """
+        Bring the private working copy board up to date.
+        Returns True if it had to be refreshed.
+        The undo history of board is cleared, its moveNumber() is -1.
+        """
+        if self.version == self.local_version:
+            return False
+        data = self.data
+        while True:
+            version = int(data[VERSION])
+            if version % 2 == 1:
+                continue
+            size = int(data[SIZE])
+            if board.size != size:
+                board.reset(size)
+            board.board[:] = data[HEADER_SIZE:HEADER_SIZE + board.maxpoint]
+            board.current_player = int(data[CURRENT_PLAYER])
+            board.black_captures = int(data[BLACK_CAPTURES])
+            board.white_captures = int(data[WHITE_CAPTURES])
+            board.last_move = int(data[LAST_MOVE])
+            board.last2_move = int(data[LAST2_MOVE])
+            if int(data[VERSION]) == version:
+                break
+        board.change_stack = []
+        board.invalidate_status()
+        self.local_version = version
+        return True
+
+    def close(self) -> None:
+        """ Detach from the block. The owner also frees it. """
+        self.data = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,324 @@
+#!/usr/bin/python3
+"""
+solved_db.py
+On-disk database of solved positions, shared by runs and processes.
+
+Every record holds a proven result for the player to move, WIN, DRAW or
+LOSS of solver.py, the move that achieves it, and the depth of the proof
+in moves. Records are keyed by a 128-bit hash of the canonical position:
+the board under the one of its 8 symmetries with the smallest cells, the
+player to move and the captures of both colors. The move is stored in
+the canonical orientation and mapped back on lookup, so the 8 symmetric
+positions share one record.
+
+A database file starts with a HEADER_SIZE byte header:
+
+    magic "NINUKISV", format version, record size, sorted records
+
+followed by records of RECORD_DTYPE. The first sorted records are
+ordered by key, as written by compact, and are searched by bisection in
+a memory map of the file. The records after them were appended by
+engines in any order; they are read once into a dict, and again when
+the file has grown.
+
+Appends are whole records written with one os.write to a file opened for
+appending, under an exclusive lock on the lock file path + ".lock", so
+several engines can add results to the same file. compact rewrites the
+file sorted and without duplicates under the same lock, and replaces it
+atomically. An engine notices the new file on its next write or refresh.
+
+Usage:
+    python3 solved_db.py info solved.db
+    python3 solved_db.py compact solved.db
+"""
+
+import argparse
+import fcntl
+import hashlib
+import os
+import numpy as np
+from typing import Dict, List, Tuple
+
+from board_base import BLACK, WHITE, EMPTY, GO_COLOR, GO_POINT, coord_to_point
+
+MAGIC: bytes = b"NINUKISV"
+FORMAT_VERSION: int = 1
+HEADER_SIZE: int = 64
+
+_HEADER_DTYPE = np.dtype([("magic", "S8"), ("version", "<u4"),
+                          ("record_size", "<u4"), ("sorted", "<u8")])
+
+RECORD_DTYPE = np.dtype([
+    ("key", "<u8"),     # first half of the position hash, the sort key
+    ("check", "<u8"),   # second half of the position hash
+    ("size", "u1"),
+    ("result", "i1"),   # WIN, DRAW or LOSS for the player to move
+    ("move", "<i2"),    # index in the canonical board, -1 for none
+    ("depth", "<u2"),
+])
+
+"""
+Results as in solver.py, repeated to keep the solver out of the imports.
+"""
+WIN: int = 1
+DRAW: int = 0
+LOSS: int = -1
+
+Entry = Tuple[int, GO_POINT, int] # result, move, depth
+_symmetry_cache: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+
+
+def symmetries(size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The points of the board in row order, and for each of the 8
+    symmetries the permutation of their indices: index j of the
+    transformed board is index perms[t][j] of the board.
+    """
+    if size not in _symmetry_cache:
+        points = np.array([coord_to_point(row, col, size)
+                           for row in range(1, size + 1) for col in range(1, size + 1)])
+        grid = np.arange(size * size).reshape(size, size)
+        perms = []
+        for flip in [grid, grid.T]:
+            for k in range(4):
+                perms.append(np.rot90(flip, k).ravel())
+        _symmetry_cache[size] = (points, np.array(perms))
+    return _symmetry_cache[size]
+
+
+def canonical(board) -> Tuple[bytes, np.ndarray]:
+    """
+    The hash of the canonical position of a GoBoard, 16 bytes, and the
+    permutation of the symmetry that gives it.
+    """
+    points, perms = symmetries(board.size)
+    cells = board.board[points].astype(np.uint8)
+    transformed = cells[perms]
+    images = [row.tobytes() for row in transformed]
+    t = min(range(len(images)), key=images.__getitem__)
+    material = images[t] + bytes([board.current_player, board.black_captures, board.white_captures])
+    return hashlib.blake2b(material, digest_size=16).digest(), perms[t]
+
+
+def _make_header(sorted_count: int = 0) -> bytes:
+    header = np.zeros(1, dtype=_HEADER_DTYPE)
+    header["magic"] = MAGIC
+    header["version"] = FORMAT_VERSION
+    header["record_size"] = RECORD_DTYPE.itemsize
+    header["sorted"] = sorted_count
+    return header.tobytes().ljust(HEADER_SIZE, b"\0")
+
+
+def read_header(path: str) -> int:
+    """ Check the header of a database file and return its number of sorted records """
+    with open(path, "rb") as f:
+        data = f.read(HEADER_SIZE)
+    if len(data) < HEADER_SIZE:
+        raise ValueError("not a solved position database: " + path)
+    header = np.frombuffer(data[:_HEADER_DTYPE.itemsize], dtype=_HEADER_DTYPE)[0]
+    if header["magic"] != MAGIC or header["version"] != FORMAT_VERSION \
+            or header["record_size"] != RECORD_DTYPE.itemsize:
+        raise ValueError("not a solved position database: " + path)
+    return int(header["sorted"])
+
+
+class _FileLock(object):
+    """ Exclusive lock on path + ".lock", held in a with block """
+    def __init__(self, path: str) -> None:
+        self.path: str = path + ".lock"
+
+    def __enter__(self) -> '_FileLock':
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info) -> bool:
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        os.close(self.fd)
+        return False
+
+
+def _create(path: str) -> None:
+    """ Write the header of a new database, under the lock """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        with open(path, "wb") as f:
+            f.write(_make_header())
+
+
+class SolvedDB(object):
+    def __init__(self, path: str) -> None:
+        """ Open the database at path, creating it if needed """
+        self.path: str = path
+        with _FileLock(path):
+            _create(path)
+        self.inode: int = None
+        self.hits: int = 0
+        self.misses: int = 0
+        self._last: Tuple[bytes, Entry] = (None, None)
+        self._open()
+
+    def _open(self) -> None:
+        """ Map the sorted records and read the appended ones """
+        self.sorted_count: int = read_header(self.path)
+        stat = os.stat(self.path)
+        self.inode = stat.st_ino
+        self.sorted: np.ndarray = np.zeros(0, dtype=RECORD_DTYPE)
+        if self.sorted_count > 0:
+            self.sorted = np.memmap(self.path, dtype=RECORD_DTYPE, mode="r",
+                                    offset=HEADER_SIZE, shape=(self.sorted_count,))
+        self.tail: Dict[Tuple[int, int], np.void] = {}
+        self.read_size: int = HEADER_SIZE + self.sorted_count * RECORD_DTYPE.itemsize
+        self._read_tail(stat.st_size)
+
+    def _read_tail(self, file_size: int) -> None:
+        count = (file_size - self.read_size) // RECORD_DTYPE.itemsize
+        if count <= 0:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self.read_size)
+            data = f.read(count * RECORD_DTYPE.itemsize)
+        records = np.frombuffer(data, dtype=RECORD_DTYPE)
+        for record in records:
+            self.tail[int(record["key"]), int(record["check"])] = record
+        self.read_size += len(records) * RECORD_DTYPE.itemsize
+
+    def refresh(self) -> None:
+        """ Read the records added by other processes, or reopen after compact """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return
+        if stat.st_ino != self.inode:
+            self._open()
+        elif stat.st_size > self.read_size:
+            self._read_tail(stat.st_size)
+
+    def _find(self, key: int, check: int) -> np.void:
+        record = self.tail.get((key, check))
+        if record is not None:
+            return record
+        keys = self.sorted["key"]
+        i = int(np.searchsorted(keys, key))
+        while i < len(keys) and keys[i] == key:
+            if self.sorted[i]["check"] == check:
+                return self.sorted[i]
+            i += 1
+        return None
+
+    def lookup(self, board, refresh: bool = True) -> Entry:
+        """
+        The (result, move, depth) stored for the position of board, with
+        the move mapped to the board, or None if the position is unknown.
+        refresh: on a miss, first read what other processes have added
+        """
+        digest, perm = canonical(board)
+        key = int.from_bytes(digest[:8], "little")
+        check = int.from_bytes(digest[8:], "little")
+        record = self._find(key, check)
+        if record is None and refresh:
+            self.refresh()
+            record = self._find(key, check)
+        if record is None or record["size"] != board.size:
+            self.misses += 1
+            return None
+        self.hits += 1
+        move = None
+        if record["move"] >= 0:
+            points, _ = symmetries(board.size)
+            move = int(points[perm[record["move"]]])
+        return int(record["result"]), move, int(record["depth"])
+
+    def winner(self, board) -> GO_COLOR:
+        """
+        The winner of the position of board with perfect play, EMPTY for a
+        draw, None if unknown. For playouts: the last answer is kept, and
+        the file is not checked for new records.
+        """
+        key = board.board.tobytes() + bytes([board.current_player, board.black_captures,
+                                             board.white_captures])
+        if key == self._last[0]:
+            entry = self._last[1]
+        else:
+            entry = self.lookup(board, refresh=False)
+            self._last = (key, entry)
+        if entry is None:
+            return None
+        if entry[0] == DRAW:
+            return EMPTY
+        toplay = board.current_player
+        return toplay if entry[0] == WIN else (WHITE if toplay == BLACK else BLACK)
+
+    def store(self, board, result: int, move: GO_POINT, depth: int) -> None:
+        """ Append the proven result of the position of board """
+        digest, perm = canonical(board)
+        record = np.zeros(1, dtype=RECORD_DTYPE)
+        record["key"] = int.from_bytes(digest[:8], "little")
+        record["check"] = int.from_bytes(digest[8:], "little")
+        record["size"] = board.size
+        record["result"] = result
+        record["move"] = -1
+        if move is not None:
+            points, _ = symmetries(board.size)
+            index = int(np.flatnonzero(points == move)[0])
+            record["move"] = int(np.flatnonzero(perm == index)[0])
+        record["depth"] = min(depth, 0xFFFF)
+        with _FileLock(self.path):
+            _create(self.path) # the file may have been removed
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+            try:
+                os.write(fd, record.tobytes())
+            finally:
+                os.close(fd)
+        self.tail[int(record["key"][0]), int(record["check"][0])] = record[0]
+        self._last = (None, None)
+
+    def __len__(self) -> int:
+        return self.sorted_count + len(self.tail)
+
+
+def compact(path: str) -> Tuple[int, int]:
+    """
+    Rewrite the database at path sorted by key, keeping one record per
+    position: the last one written. Returns the number of records
+    before and after.
+    """
+    with _FileLock(path):
+        read_header(path)
+        count = (os.path.getsize(path) - HEADER_SIZE) // RECORD_DTYPE.itemsize
+        records = np.fromfile(path, dtype=RECORD_DTYPE, count=count, offset=HEADER_SIZE)
+        # last record of each position: unique on the reversed array
+        reversed_records = records[::-1]
+        _, first = np.unique(np.stack([reversed_records["key"], reversed_records["check"]], axis=1),
+                             axis=0, return_index=True)
+        kept = reversed_records[np.sort(first)]
+        kept = kept[np.lexsort((kept["check"], kept["key"]))]
+        temp = path + ".compact"
+        with open(temp, "wb") as f:
+            f.write(_make_header(len(kept)))
+            f.write(kept.tobytes())
+        os.replace(temp, path)
+    return count, len(kept)
+
+
+def main(argv: List[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Ninuki solved position database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    info = commands.add_parser("info", help="count the records")
+    info.add_argument("path")
+    compact_parser = commands.add_parser("compact", help="sort and remove duplicates")
+    compact_parser.add_argument("path")
+    args = parser.parse_args(argv)
+    if args.command == "info":
+        sorted_count = read_header(args.path)
+        count = (os.path.getsize(args.path) - HEADER_SIZE) // RECORD_DTYPE.itemsize
+        records = np.fromfile(args.path, dtype=RECORD_DTYPE, count=count, offset=HEADER_SIZE)
+        print("{}: {} records, {} sorted, win/draw/loss={}/{}/{}".format(
+            args.path, count, sorted_count, int(np.sum(records["result"] == WIN)),
+            int(np.sum(records["result"] == DRAW)), int(np.sum(records["result"] == LOSS))))
+    else:
+        before, after = compact(args.path)
+        print("{}: {} records, {} after compaction".format(args.path, before, after))
+
+
+if __name__ == "__main__":
+    main()
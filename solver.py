@@ -0,0 +1,206 @@
+"""
+solver.py
+Exact solver for Ninuki positions.
+
+Solver.solve returns the game-theoretic result of the position for the
+player to move, WIN, DRAW or LOSS, with a move that achieves it.
+It first runs the threat-space search of tss.py, which proves most won
+positions in a few milliseconds. Only if that fails it runs a full
+negamax search with alpha-beta pruning on the three results and a
+transposition table. In the full search:
+- a player with a winning point wins at once,
+- a player facing a winning point of the opponent only tries the moves
+  that stop it: playing on a winning point, or a capture,
+- the other moves are ordered by Evaluator.move_priority.
+The search stops with no result when the time limit is reached.
+
+With a solved_db.SolvedDB, solve first looks the position up, and
+stores the results it proves, with the length of the TSS line or the
+deepest ply of the negamax search as proof depth.
+"""
+
+import time
+from typing import Dict, List, Tuple
+
+from board import GoBoard
+from board_base import BLACK, EMPTY, GO_COLOR, GO_POINT, opponent
+from evaluation import Evaluator
+from tss import SearchLimitReached, ThreatSpaceSearch
+import tracing
+
+WIN: int = 1
+DRAW: int = 0
+LOSS: int = -1
+
+EXACT: int = 0
+LOWER_BOUND: int = 1
+UPPER_BOUND: int = 2
+
+DEFAULT_TIME_LIMIT: float = 1.0
+
+"""
+Share of the time limit given to the threat-space search at the root.
+"""
+TSS_TIME_SHARE: float = 0.2
+
+
+class Solver(object):
+    def __init__(self, time_limit: float = DEFAULT_TIME_LIMIT, db=None) -> None:
+        """ db: a solved_db.SolvedDB to look up and store results, None for none """
+        self.time_limit: float = time_limit
+        self.db = db
+        self.nodes: int = 0
+        self.ply: int = 0
+        self.max_ply: int = 0
+        self.table: Dict[Tuple, Tuple[int, int, GO_POINT]] = {}
+
+    def solve(self, board: GoBoard) -> Tuple[int, GO_POINT]:
+        """
+        Result of the position for the player to move, and the move that
+        achieves it (None for a loss or a finished game).
+        Returns None if the time limit was reached.
+        The board is back in its original state on return.
+        """
+        start = time.time()
+        self.deadline = start + self.time_limit
+        self.nodes = 0
+        result = board.get_final_result()
+        if result != "unknown":
+            if result == "draw":
+                return DRAW, None
+            winner = "black" if board.current_player == BLACK else "white"
+            return (WIN if result == winner else LOSS), None
+        if self.db is not None:
+            entry = self.db.lookup(board)
+            if entry is not None:
+                return entry[0], entry[1]
+
+        with tracing.span("threat_space_search"):
+            line = ThreatSpaceSearch(time_limit=self.time_limit * TSS_TIME_SHARE).winning_line(board)
+        if line:
+            if self.db is not None:
+                self.db.store(board, WIN, line[0], len(line))
+            return WIN, line[0]
+
+        with tracing.span("negamax"):
+            solved = self.search_root(board)
+        if solved is None:
+            return None
+        value, move, depth = solved
+        if self.db is not None:
+            self.db.store(board, value, move, depth)
+        return value, move
+
+    def search_root(self, board: GoBoard) -> Tuple[int, GO_POINT, int]:
+        """
+        The full search of solve: the result, best move and deepest ply
+        searched, or None if the time limit was reached.
+        """
+        moveNr = board.moveNumber()
+        evaluator = board.evaluator
+        attached = evaluator is None
+        if attached:
+            evaluator = Evaluator(board)
+        try:
+            self.ply = self.max_ply = 0
+            value, move = self.negamax(board, evaluator, LOSS, WIN)
+            return value, move, self.max_ply
+        except SearchLimitReached:
+            board.resetToMoveNumber(moveNr)
+            return None
+        finally:
+            if attached:
+                evaluator.detach()
+
+    def _key(self, board: GoBoard) -> Tuple:
+        return (board.board.tobytes(), board.current_player,
+                board.black_captures, board.white_captures)
+
+    # The transposition table, the time check and the move order are used
+    # through the methods below and move_order, which parallel_solver.py
+    # overrides.
+    def probe(self, key) -> Tuple[int, int, GO_POINT]:
+        """ The (value, flag, move) entry of key, None if there is none """
+        return self.table.get(key)
+
+    def save(self, key, value: int, flag: int, move: GO_POINT) -> None:
+        self.table[key] = (value, flag, move)
+
+    def out_of_time(self) -> bool:
+        return time.time() > self.deadline
+
+    def negamax(self, board: GoBoard, evaluator: Evaluator,
+                alpha: int, beta: int) -> Tuple[int, GO_POINT]:
+        """ Result for the player to move and its best move """
+        self.nodes += 1
+        if self.nodes % 256 == 0 and self.out_of_time():
+            raise SearchLimitReached()
+        color = board.current_player
+        winner = evaluator.winner()
+        if winner != EMPTY:
+            return (WIN if winner == color else LOSS), None
+        if evaluator.empty == 0:
+            return DRAW, None
+
+        key = self._key(board)
+        entry = self.probe(key)
+        if entry is not None:
+            value, flag, move = entry
+            if flag == EXACT:
+                return value, move
+            if flag == LOWER_BOUND and value >= beta:
+                return value, move
+            if flag == UPPER_BOUND and value <= alpha:
+                return value, move
+
+        wins = board.winning_moves(color)
+        if wins:
+            self.save(key, WIN, EXACT, wins[0])
+            return WIN, wins[0]
+
+        original_alpha = alpha
+        best_value = LOSS - 1
+        best_move = None
+        for move in self.ordered_moves(board, evaluator, color):
+            board.play_move(move, color)
+            self.ply += 1
+            self.max_ply = max(self.max_ply, self.ply)
+            value = -self.negamax(board, evaluator, -beta, -alpha)[0]
+            self.ply -= 1
+            board.undo_move()
+            if value > best_value:
+                best_value, best_move = value, move
+            if value > alpha:
+                alpha = value
+            if alpha >= beta:
+                break
+
+        if best_value <= original_alpha:
+            flag = UPPER_BOUND
+        elif best_value >= beta:
+            flag = LOWER_BOUND
+        else:
+            flag = EXACT
+        self.save(key, best_value, flag, best_move)
+        return best_value, best_move
+
+    def ordered_moves(self, board: GoBoard, evaluator: Evaluator, color: GO_COLOR) -> List[GO_POINT]:
+        """
+        All empty points, or only the answers to the opponent's winning
+        points if it has any. Ordered by Evaluator.move_priority.
+        """
+        cells = evaluator.cells
+        threats = board.winning_moves(opponent(color))
+        if threats:
+            moves = list(threats)
+            for p in evaluator.points:
+                if cells[p] == EMPTY and p not in threats and board._count_captures(cells, p, color) > 0:
+                    moves.append(p)
+        else:
+            moves = [p for p in evaluator.points if cells[p] == EMPTY]
+        moves.sort(key=lambda move: self.move_order(evaluator, move, color), reverse=True)
+        return moves
+
+    def move_order(self, evaluator: Evaluator, move: GO_POINT, color: GO_COLOR) -> float:
+        """ Sort key of ordered_moves, highest first """
+        return evaluator.move_priority(move, color)
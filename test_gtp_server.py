@@ -0,0 +1,96 @@
+"""
+test_gtp_server.py
+Game clock of a server session whose moves are searched in the pool.
+
+A server is started in this process on a Unix socket with one pool
+worker, and a client plays a game on a short clock. Every genmove must
+stay within its share of the clock, and the moves of a color together
+within its main time, as they do on a local connection.
+
+Usage:
+    python3 -m unittest test_gtp_server
+"""
+
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from typing import List, Tuple
+
+from Ninuki import Go0
+from gtp_server import make_server
+from time_control import MAX_SHARE
+
+MAIN_TIME: float = 2.0
+MOVES_PER_COLOR: int = 4
+
+"""
+Seconds a genmove may take past its hard limit, for the socket and the
+pool round trip.
+"""
+SLACK: float = 0.05
+
+
+class ServerClockTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(self.directory.name, "ninuki.sock")
+        self.server = make_server(Go0, unix_socket=path, pool_workers=1)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.client = socket.socket(socket.AF_UNIX)
+        self.client.connect(path)
+        self.stream = self.client.makefile("rw")
+
+    def tearDown(self) -> None:
+        self.stream.close()
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.directory.cleanup()
+
+    def send(self, command: str) -> Tuple[str, float]:
+        """ The response to command without "= ", and the seconds it took """
+        start = time.time()
+        self.stream.write(command + "\n")
+        self.stream.flush()
+        lines: List[str] = []
+        while True:
+            line = self.stream.readline()
+            self.assertNotEqual(line, "", "server closed the session after " + command)
+            if line.strip() == "":
+                if lines:
+                    break
+                continue
+            lines.append(line.strip())
+        seconds = time.time() - start
+        self.assertTrue(lines[0].startswith("="), command + ": " + " ".join(lines))
+        return " ".join(lines)[1:].strip(), seconds
+
+    def play_on_clock(self, search: str) -> None:
+        self.send("boardsize 11")
+        self.send("search " + search)
+        self.send("time_settings {} 0 0".format(MAIN_TIME))
+        used = {"b": 0.0, "w": 0.0}
+        for _ in range(MOVES_PER_COLOR):
+            for color in ["b", "w"]:
+                move, seconds = self.send("genmove " + color)
+                self.assertNotIn(move, ["pass", "resign"])
+                self.assertLessEqual(seconds, MAX_SHARE * (MAIN_TIME - used[color]) + SLACK,
+                                     "genmove {} with {:.2f}s used".format(color, used[color]))
+                used[color] += seconds
+        for color, seconds in used.items():
+            self.assertLess(seconds, MAIN_TIME, "{} lost on time".format(color))
+
+    def test_flat_within_clock(self) -> None:
+        self.play_on_clock("flat")
+
+    def test_mcts_within_clock(self) -> None:
+        self.play_on_clock("mcts")
+
+
+if __name__ == "__main__":
+    unittest.main()
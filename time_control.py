@@ -0,0 +1,235 @@
+"""
+time_control.py
+Game clock time management for genmove.
+
+The clock of each color is set with the GTP commands time_settings and
+time_left, and charged with the time used by every genmove. A clock has
+main time, then optional Canadian byo-yomi: byo_yomi_stones moves in
+every period of byo_yomi_time seconds.
+
+For each move the TimeManager sets two limits:
+- soft: the share of the remaining time for this move. The remaining
+  main time is spread over the moves still to come, estimated from the
+  number of empty points. In byo-yomi it is the period time per stone.
+  Critical positions, where the rule based policy finds a move that
+  blocks a win, makes an open four or captures, get CRITICAL_FACTOR
+  times more.
+- hard: the most the move may ever use, a few times soft but never more
+  than MAX_SHARE of the main time, and always SAFETY_MARGIN seconds
+  short of losing on time.
+
+When a search had no time to look at the moves, the player falls back
+to fallback_move, a move of the rule based policy, instead of the first
+move it happened to try.
+
+The searches call should_stop while running. A search stops:
+- at the hard limit,
+- before the soft limit once the search has converged: the most visited
+  move cannot be caught up in the playouts left until the soft limit, or
+  its win rate is significantly above that of every other move,
+- after the soft limit as soon as the most visited move also has the
+  best win rate. Otherwise it continues, up to the hard limit.
+"""
+
+import math
+import time
+from typing import Callable, Dict, List, Tuple
+
+from board_base import BLACK, WHITE, GO_COLOR, GO_POINT
+
+RootStats = Dict[GO_POINT, Tuple[int, float]]
+
+"""
+Seconds kept in reserve against network and process delays.
+"""
+SAFETY_MARGIN: float = 0.1
+"""
+Our moves still to come are estimated as EMPTY_POINTS_PER_MOVE empty
+points per move, at least MIN_MOVES_LEFT.
+"""
+EMPTY_POINTS_PER_MOVE: float = 2.0
+MIN_MOVES_LEFT: int = 8
+"""
+hard is at most MAX_EXTENSION times soft, and at most MAX_SHARE of the
+remaining main time.
+"""
+MAX_EXTENSION: float = 3.0
+MAX_SHARE: float = 0.25
+"""
+Share of the byo-yomi time per stone used as soft limit.
+"""
+BYO_YOMI_SHARE: float = 0.8
+CRITICAL_FACTOR: float = 2.0
+"""
+Seconds between two convergence checks, which look at the root statistics.
+"""
+CHECK_INTERVAL: float = 0.02
+"""
+A win rate is significantly higher when it is DOMINANCE_Z standard
+errors above the other. Only moves with MIN_VISITS visits are compared.
+"""
+DOMINANCE_Z: float = 3.0
+MIN_VISITS: int = 20
+
+
+class Clock(object):
+    def __init__(self, main_time: float = 0.0, stones: int = 0) -> None:
+        """
+        main_time: seconds left, in the current byo-yomi period if stones > 0
+        stones: moves left to play in the current byo-yomi period,
+            0 while in main time
+        """
+        self.time_left: float = main_time
+        self.stones: int = stones
+
+
+class TimeManager(object):
+    def __init__(self) -> None:
+        self.active: bool = False # no time limit until time_settings
+        self.main_time: float = 0.0
+        self.byo_yomi_time: float = 0.0
+        self.byo_yomi_stones: int = 0
+        self.clocks: List[Clock] = [None, Clock(), Clock()]
+        self.soft: float = 0.0
+        self.hard: float = 0.0
+        self.start_time: float = 0.0
+        self.next_check: float = 0.0
+        self.policy_moves: List[GO_POINT] = None # of the current move, see fallback_move
+
+    def time_settings(self, main_time: float, byo_yomi_time: float, byo_yomi_stones: int) -> None:
+        """
+        Set the clocks of both colors as in the GTP command time_settings.
+        byo_yomi_time > 0 with byo_yomi_stones 0 means no time limit.
+        """
+        self.main_time = main_time
+        self.byo_yomi_time = byo_yomi_time
+        self.byo_yomi_stones = byo_yomi_stones
+        self.active = not (byo_yomi_time > 0 and byo_yomi_stones == 0)
+        for color in [BLACK, WHITE]:
+            self.clocks[color] = Clock(main_time)
+            if main_time <= 0 and byo_yomi_stones > 0:
+                self.clocks[color] = Clock(byo_yomi_time, byo_yomi_stones)
+
+    def time_left(self, color: GO_COLOR, seconds: float, stones: int) -> None:
+        """ Correct the clock of color as in the GTP command time_left """
+        self.clocks[color] = Clock(seconds, stones)
+
+    def has_byo_yomi(self) -> bool:
+        return self.byo_yomi_time > 0 and self.byo_yomi_stones > 0
+
+    def start_move(self, color: GO_COLOR, empty_points: int, critical: bool = False,
+                   start_time: float = None, policy_moves: List[GO_POINT] = None) -> None:
+        """
+        Start timing a move of color and set its limits.
+        start_time: when the move started, if before this call, so that the
+            time spent finding out whether it is critical is charged too
+        policy_moves: the moves of the rule based policy, for fallback_move
+        """
+        self.start_time = time.time() if start_time is None else start_time
+        self.next_check = self.start_time
+        self.soft, self.hard = self.budget(color, empty_points, critical)
+        self.policy_moves = policy_moves
+
+    def fallback_move(self, rng) -> GO_POINT:
+        """
+        A random move of the rule based policy of the current move, for a
+        search that ran out of time before it could compare the moves.
+        None if start_move was not given the policy moves.
+        """
+        if self.policy_moves is None or len(self.policy_moves) == 0:
+            return None
+        return int(rng.choice(self.policy_moves))
+
+    def budget(self, color: GO_COLOR, empty_points: int, critical: bool = False) -> Tuple[float, float]:
+        """ The soft and hard limit in seconds for a move of color """
+        clock = self.clocks[color]
+        if clock.stones > 0:
+            per_move = (clock.time_left - SAFETY_MARGIN) / clock.stones
+            soft = per_move * BYO_YOMI_SHARE
+            hard = per_move
+        else:
+            moves_left = max(MIN_MOVES_LEFT, empty_points / EMPTY_POINTS_PER_MOVE)
+            soft = (clock.time_left - SAFETY_MARGIN) / moves_left
+            hard = (clock.time_left - SAFETY_MARGIN) * MAX_SHARE
+            if self.has_byo_yomi():
+                # the periods that follow main time can be used as well
+                per_stone = (self.byo_yomi_time - SAFETY_MARGIN) / self.byo_yomi_stones
+                soft += per_stone * BYO_YOMI_SHARE
+                hard += per_stone
+            hard = min(hard, soft * MAX_EXTENSION)
+        if critical:
+            soft *= CRITICAL_FACTOR
+        soft = max(0.0, min(soft, hard))
+        return soft, max(0.0, hard)
+
+    def end_move(self, color: GO_COLOR) -> float:
+        """ Charge the time used since start_move to the clock of color """
+        used = time.time() - self.start_time
+        clock = self.clocks[color]
+        clock.time_left -= used
+        if clock.stones > 0:
+            clock.stones -= 1
+            if clock.stones == 0 and clock.time_left >= 0:
+                self.clocks[color] = Clock(self.byo_yomi_time, self.byo_yomi_stones)
+        elif clock.time_left <= 0 and self.has_byo_yomi():
+            self.clocks[color] = Clock(self.byo_yomi_time + clock.time_left, self.byo_yomi_stones)
+        return used
+
+    def out_of_time(self) -> bool:
+        """ The hard limit of the current move is reached """
+        return time.time() - self.start_time >= self.hard
+
+    def should_stop(self, playouts: int, stats_fn: Callable[[], RootStats]) -> bool:
+        """
+        Called by a search after each playout, or batch of playouts, with
+        their number so far and a function that returns the root statistics.
+        """
+        now = time.time()
+        elapsed = now - self.start_time
+        if elapsed >= self.hard:
+            return True
+        if now < self.next_check:
+            return False
+        self.next_check = now + CHECK_INTERVAL
+        stats = stats_fn()
+        if len(stats) <= 1:
+            return len(stats) == 1
+        if elapsed >= self.soft:
+            return self.settled(stats)
+        remaining = playouts / elapsed * (self.soft - elapsed) if elapsed > 0 else float("inf")
+        return self.dominant(stats, remaining)
+
+    def settled(self, stats: RootStats) -> bool:
+        """
+        The most visited move also has the best win rate among the moves
+        with MIN_VISITS visits.
+        """
+        best = max(stats.keys(), key=lambda move: stats[move])
+        return all(win_rate(stats[best]) >= win_rate(entry)
+                   for entry in stats.values() if entry[0] >= MIN_VISITS)
+
+    def dominant(self, stats: RootStats, remaining: float) -> bool:
+        """
+        The most visited move cannot be caught up in remaining playouts,
+        or its win rate is significantly above that of all other moves.
+        """
+        ranked = sorted(stats.values(), reverse=True)
+        best, second = ranked[0], ranked[1]
+        if best[0] - second[0] > remaining:
+            return True
+        if best[0] < MIN_VISITS:
+            return False
+        p = win_rate(best)
+        for visits, wins in ranked[1:]:
+            if visits < MIN_VISITS:
+                continue
+            q = wins / visits
+            error = math.sqrt(max(p * (1 - p) / best[0] + q * (1 - q) / visits, 1e-12))
+            if p - q < DOMINANCE_Z * error:
+                return False
+        return True
+
+
+def win_rate(entry: Tuple[int, float]) -> float:
+    visits, wins = entry
+    return wins / visits if visits > 0 else 0.0
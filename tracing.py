@@ -0,0 +1,248 @@
+"""
+tracing.py
+Opt-in tracing of GTP commands and engine phases.
+
+When tracing is on, every span is recorded as a complete event of the
+Chrome trace format, which chrome://tracing and https://ui.perfetto.dev
+can show as a timeline:
+
+    {"traceEvents": [{"name": "genmove", "cat": "gtp", "ph": "X",
+                      "ts": 1200.0, "dur": 850000.0, "pid": 1, "tid": 2,
+                      "args": {...}}, ...]}
+
+GtpConnection.get_cmd opens a span for each command, and the engine opens
+spans for its major phases (threat-space search, the main search, the
+rule based policy, ...). The trace file is written by stop, and at exit.
+
+With profiling, a SamplingProfiler samples the stack of the thread that
+runs each command. The functions seen most often are written to stderr
+after the command and stored in the args of its span.
+
+Tracing is off by default. span then returns one shared object that does
+nothing, so an engine phase pays one function call per span.
+"""
+
+import atexit
+import os
+import sys
+import threading
+import time
+from sys import stderr
+from typing import Dict, List, TextIO, Tuple
+
+"""
+Seconds between two samples of the sampling profiler, and the number
+of functions reported per command.
+"""
+PROFILE_INTERVAL: float = 0.001
+TOP_FUNCTIONS: int = 10
+
+Function = Tuple[str, int, str] # file, first line, name
+
+"""
+The switch interval is process-wide, and the sessions of the threaded
+server can profile commands at the same time. The profilers share one
+override: the first to start saves the interval, the last to stop
+restores it.
+"""
+_switch_lock = threading.Lock()
+_switch_users: int = 0
+_saved_switch_interval: float = None
+
+
+def _override_switch_interval(interval: float) -> None:
+    global _switch_users, _saved_switch_interval
+    with _switch_lock:
+        if _switch_users == 0:
+            _saved_switch_interval = sys.getswitchinterval()
+        _switch_users += 1
+        sys.setswitchinterval(min(interval, sys.getswitchinterval()))
+
+
+def _restore_switch_interval() -> None:
+    global _switch_users
+    with _switch_lock:
+        _switch_users -= 1
+        if _switch_users == 0:
+            sys.setswitchinterval(_saved_switch_interval)
+
+
+class SamplingProfiler(object):
+    def __init__(self, thread_id: int, interval: float = PROFILE_INTERVAL) -> None:
+        """
+        Samples the stack of the thread thread_id from a background thread
+        every interval seconds, between start and stop.
+        """
+        self.thread_id: int = thread_id
+        self.interval: float = interval
+        self.samples: int = 0
+        self.self_counts: Dict[Function, int] = {}
+        self.total_counts: Dict[Function, int] = {}
+        self._done = threading.Event()
+        self._thread: threading.Thread = None
+
+    def start(self) -> None:
+        # the sampling thread only runs when the profiled thread lets go of
+        # the GIL, so switch threads as often as samples are taken
+        _override_switch_interval(self.interval)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._done.set()
+        self._thread.join()
+        _restore_switch_interval()
+
+    def _run(self) -> None:
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            seen = set()
+            top = True
+            while frame is not None:
+                code = frame.f_code
+                function = (code.co_filename, code.co_firstlineno, code.co_name)
+                if top:
+                    self.self_counts[function] = self.self_counts.get(function, 0) + 1
+                    top = False
+                if function not in seen:
+                    seen.add(function)
+                    self.total_counts[function] = self.total_counts.get(function, 0) + 1
+                frame = frame.f_back
+
+    def top_functions(self, n: int = TOP_FUNCTIONS) -> List[Tuple[str, float, float]]:
+        """
+        The n functions with the most samples on top of the stack, as
+        (function, self %, total %). total counts the samples in which
+        the function was anywhere on the stack.
+        """
+        if self.samples == 0:
+            return []
+        ranked = sorted(self.self_counts.items(), key=lambda item: item[1], reverse=True)
+        return [(format_function(function), 100.0 * count / self.samples,
+                 100.0 * self.total_counts[function] / self.samples)
+                for function, count in ranked[:n]]
+
+
+def format_function(function: Function) -> str:
+    filename, line, name = function
+    return "{} ({}:{})".format(name, os.path.basename(filename), line)
+
+
+class Span(object):
+    def __init__(self, tracer: 'Tracer', name: str, category: str,
+                 args: Dict, profile: bool) -> None:
+        self.tracer = tracer
+        self.name: str = name
+        self.category: str = category
+        self.args: Dict = args
+        self.profiler: SamplingProfiler = None
+        if profile:
+            self.profiler = SamplingProfiler(threading.get_ident(), tracer.interval)
+
+    def __enter__(self) -> 'Span':
+        if self.profiler is not None:
+            self.profiler.start()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> bool:
+        end = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.stop()
+            top = self.profiler.top_functions(self.tracer.top)
+            if self.profiler.samples > 0:
+                self.args["profile"] = ["{:5.1f}% {:5.1f}% {}".format(s, t, f) for f, s, t in top]
+                self.tracer.write_profile(self.name, self.profiler.samples, top)
+        self.tracer.add_event(self.name, self.category, self.start, end, self.args)
+        return False
+
+
+class NullSpan(object):
+    def __enter__(self) -> 'NullSpan':
+        return self
+
+    def __exit__(self, *exc_info) -> bool:
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer(object):
+    def __init__(self, path: str = None, profile: bool = False,
+                 interval: float = PROFILE_INTERVAL, top: int = TOP_FUNCTIONS,
+                 stream: TextIO = None) -> None:
+        """
+        path: the trace file, None to only profile
+        profile: sample the stack during each GTP command
+        stream: where profiles are written, stderr by default
+        """
+        self.path: str = path
+        self.profile: bool = profile
+        self.interval: float = interval
+        self.top: int = top
+        self.stream: TextIO = stream if stream is not None else stderr
+        self.origin: float = time.perf_counter()
+        self.events: List[Dict] = []
+
+    def add_event(self, name: str, category: str, start: float, end: float, args: Dict) -> None:
+        self.events.append({
+            "name": name, "cat": category, "ph": "X",
+            "ts": (start - self.origin) * 1e6, "dur": (end - start) * 1e6,
+            "pid": os.getpid(), "tid": threading.get_ident(), "args": args,
+        })
+
+    def write_profile(self, name: str, samples: int, top: List[Tuple[str, float, float]]) -> None:
+        lines = ["profile of {}: {} samples".format(name, samples),
+                 "  self%  total%  function"]
+        lines += ["  {:5.1f}  {:5.1f}   {}".format(s, t, f) for f, s, t in top]
+        self.stream.write("\n".join(lines) + "\n")
+        self.stream.flush()
+
+    def write(self) -> None:
+        """ Write all events so far to the trace file """
+        if self.path is None:
+            return
+        import json # only needed here, kept out of the engine startup
+        with open(self.path, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+
+
+_tracer: Tracer = None
+
+
+def span(name: str, category: str = "engine", args: Dict = None, profile: bool = False):
+    """
+    A context manager that records name as a span, if tracing is on.
+    profile: also run the sampling profiler, if the tracer profiles
+    """
+    if _tracer is None:
+        return NULL_SPAN
+    return Span(_tracer, name, category, args if args is not None else {},
+                profile and _tracer.profile)
+
+
+def enabled() -> bool:
+    return _tracer is not None
+
+
+def start(path: str = None, profile: bool = False) -> Tracer:
+    """ Turn tracing on, replacing the current tracer after writing it """
+    global _tracer
+    stop()
+    _tracer = Tracer(path, profile)
+    return _tracer
+
+
+def stop() -> None:
+    """ Write the trace file and turn tracing off """
+    global _tracer
+    if _tracer is not None:
+        _tracer.write()
+        _tracer = None
+
+
+atexit.register(stop)
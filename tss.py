@@ -0,0 +1,176 @@
+"""
+tss.py
+Threat-space search: fast detection of forced wins.
+
+Only forcing moves of the attacker, the player to move, are searched.
+A move is forcing if afterwards the attacker threatens to win on the
+next move: it makes a four or an open four, or, with 8 or more captured
+stones, a capture threat toward 10. The defender must answer, and its
+only useful answers are:
+- playing on one of the attacker's winning points, or
+- a capture, which can take stones out of the threat.
+If the defender has a winning point of its own, the threat fails.
+
+The attacker wins if it has a winning point, or a forcing move after
+which every answer of the defender leaves it a win. Since the defender
+has few answers, the search is narrow and finds long forcing sequences
+that a full-width search could not reach.
+
+A failed search proves nothing: the attacker may still win with quiet
+moves. The search stops with no result when its node budget or time
+limit is used up.
+"""
+
+import time
+from typing import Dict, List, Tuple
+
+from board import GoBoard
+from board_base import EMPTY, GO_COLOR, GO_POINT
+from solved_db import WIN
+
+DEFAULT_NODE_BUDGET: int = 20000
+
+"""
+Limits of the threat-space search that genmove runs before the
+Monte Carlo search. Nodes cost more on large boards, hence the time limit.
+"""
+GENMOVE_NODE_BUDGET: int = 2000
+GENMOVE_TIME_LIMIT: float = 0.2
+
+
+class SearchLimitReached(Exception):
+    pass
+
+
+class ThreatSpaceSearch(object):
+    def __init__(self, node_budget: int = DEFAULT_NODE_BUDGET, time_limit: float = None) -> None:
+        """
+        node_budget: maximum number of positions searched
+        time_limit: maximum seconds, None for no limit
+        """
+        self.node_budget: int = node_budget
+        self.time_limit: float = time_limit
+        self.nodes: int = 0
+        self.table: Dict[Tuple, List[GO_POINT]] = {}
+
+    def winning_line(self, board: GoBoard) -> List[GO_POINT]:
+        """
+        A forced win for the player to move as the line of moves
+        that ends with the winning move, with one defender answer at
+        each step. None if none was found within the limits.
+        The board is back in its original state on return.
+        """
+        self.nodes = 0
+        self.table = {}
+        self.deadline = None if self.time_limit is None else time.time() + self.time_limit
+        moveNr = board.moveNumber()
+        try:
+            return self.attacker_wins(board)
+        except SearchLimitReached:
+            board.resetToMoveNumber(moveNr)
+            return None
+
+    def _count_node(self) -> None:
+        self.nodes += 1
+        if self.nodes > self.node_budget:
+            raise SearchLimitReached()
+        if self.deadline is not None and self.nodes % 16 == 0 and time.time() > self.deadline:
+            raise SearchLimitReached()
+
+    def _key(self, board: GoBoard) -> Tuple:
+        return (board.board.tobytes(), board.current_player,
+                board.black_captures, board.white_captures)
+
+    def attacker_wins(self, board: GoBoard) -> List[GO_POINT]:
+        """ Winning line of the player to move, None if not found """
+        key = self._key(board)
+        if key in self.table:
+            return self.table[key]
+        self._count_node()
+        attacker = board.current_player
+        line = None
+        wins = board.winning_moves(attacker)
+        if wins:
+            line = [wins[0]]
+        else:
+            for move in self.forcing_moves(board, attacker):
+                board.play_move(move, attacker)
+                defense = self.defender_loses(board, attacker)
+                board.undo_move()
+                if defense is not None:
+                    line = [move] + defense
+                    break
+        self.table[key] = line
+        return line
+
+    def defender_loses(self, board: GoBoard, attacker: GO_COLOR) -> List[GO_POINT]:
+        """
+        After a forcing move of attacker: the line after one of the
+        defender's answers if all answers lose, None otherwise.
+        """
+        defender = board.current_player
+        if len(board.get_empty_points()) == 0 or board.winning_moves(defender):
+            return None
+        threats = board.winning_moves(attacker)
+        if not threats:
+            return None
+        line = None
+        for answer in self.defender_answers(board, defender, threats):
+            board.play_move(answer, defender)
+            win = self.attacker_wins(board)
+            board.undo_move()
+            if win is None:
+                return None
+            if line is None:
+                line = [answer] + win
+        return line
+
+    def defender_answers(self, board: GoBoard, defender: GO_COLOR, threats: List[GO_POINT]) -> List[GO_POINT]:
+        """ The winning points of the attacker and all capturing moves """
+        cells = board.board.tolist()
+        answers = list(threats)
+        for p in board.get_empty_points().tolist():
+            if p not in threats and board._count_captures(cells, p, defender) > 0:
+                answers.append(p)
+        return answers
+
+    def forcing_moves(self, board: GoBoard, attacker: GO_COLOR) -> List[GO_POINT]:
+        """
+        Empty points after which attacker threatens to win, judged
+        without playing the move: the moves that make most threats first.
+        """
+        cells = board.board.tolist()
+        captures = board.get_captures(attacker)
+        moves = []
+        for p in board.get_empty_points().tolist():
+            cells[p] = attacker
+            threats = len(board._five_points(cells, p, attacker))
+            cells[p] = EMPTY
+            new_captures = captures + 2 * board._count_captures(cells, p, attacker)
+            if new_captures >= 8:
+                cells[p] = attacker
+                for q in board._points_near(cells, p, 3):
+                    if board._count_captures(cells, q, attacker) > 0:
+                        threats += 1
+                cells[p] = EMPTY
+            if threats > 0:
+                moves.append((threats, p))
+        moves.sort(key=lambda item: item[0], reverse=True)
+        return [p for _, p in moves]
+
+
+def forced_win_move(board: GoBoard, node_budget: int = GENMOVE_NODE_BUDGET,
+                    time_limit: float = GENMOVE_TIME_LIMIT, db=None) -> GO_POINT:
+    """
+    First move of a forced win for the player to move, None if not found.
+    db: a solved_db.SolvedDB, where a win is looked up first, and where
+    a forced win that is found is stored
+    """
+    if db is not None:
+        entry = db.lookup(board)
+        if entry is not None: # solved: a win, or proven not to be one
+            return entry[1] if entry[0] == WIN else None
+    line = ThreatSpaceSearch(node_budget, time_limit).winning_line(board)
+    if line and db is not None:
+        db.store(board, WIN, line[0], len(line))
+    return line[0] if line else None